@@ -19,7 +19,7 @@ db = SQLAlchemy()
 migrate = Migrate()
 cors = CORS()
 jwt = JWTManager()
-limiter = create_limiter(None)  # 将在create_app中初始化
+limiter = create_limiter()  # 在create_app中绑定应用
 
 
 def create_app(config_class=None):
@@ -47,17 +47,33 @@ def create_app(config_class=None):
                   allow_headers=['Content-Type', 'Authorization', 'X-Requested-With'])
     
     jwt.init_app(app)
-    # 初始化频率限制器
-    from app.utils.rate_limit import create_limiter
-    global limiter
-    limiter = create_limiter(app)
+    # 注册JWT吊销检查
+    from app.utils.token_revocation import token_revocation
+    token_revocation.init_app(app, jwt)
+    # 初始化频率限制器（各模块在导入时已使用该实例注册装饰器，因此不能重新创建）
+    limiter.init_app(app)
     
-    # 初始化安全中间件
+    # 初始化审计/操作日志批量写入器
+    from app.utils.enhanced_audit import audit_writer
+    from app.utils.auth import operation_log_writer
+    audit_writer.init_app(app)
+    operation_log_writer.init_app(app)
+    
+    # 初始化安全中间件及行为画像后台汇总
+    from app.utils.anomaly_detection import behavior_profile_builder
     security_middleware.init_app(app)
+    behavior_profile_builder.init_app(app)
     
     # 启动性能监控
+    from app.utils.performance_monitor import performance_monitor
+    performance_monitor.init_app(app)
+    from app.utils.openmetrics import pool_monitor
+    pool_monitor.init_app(app)
+    from app.utils.query_tracker import query_tracker
+    query_tracker.init_app(app)
+    from app.utils.request_profiler import request_profiler
+    request_profiler.init_app(app)
     if app.config.get('PERFORMANCE_MONITORING', True):
-        from app.utils.performance_monitor import performance_monitor
         monitoring_interval = app.config.get('MONITORING_INTERVAL', 60)
         performance_monitor.start_monitoring(monitoring_interval)
     
@@ -65,6 +81,10 @@ def create_app(config_class=None):
     from app.api import init_api
     init_api(app)
     
+    # 按端点分级绑定频率限制
+    from app.utils.rate_limit import bind_endpoint_limits
+    bind_endpoint_limits(app, limiter)
+    
     # 创建上传目录
     upload_folder = app.config.get('UPLOAD_FOLDER')
     if upload_folder and not os.path.exists(upload_folder):
@@ -21,6 +21,7 @@ def init_api(app):
     from app.api.statistics import statistics_bp
     from app.api.file import file_bp
     from app.api.health import health_bp
+    from app.api.metrics import metrics_bp
     from app.api.monitor import monitor_bp
     from app.api.asset_port import port_bp
     from app.api.category import category_bp
@@ -44,6 +45,9 @@ def init_api(app):
     # 注册健康检查蓝图（直接在根路径下）
     app.register_blueprint(health_bp)
     
+    # 注册OpenMetrics指标导出（根路径 /metrics）
+    app.register_blueprint(metrics_bp)
+    
     # 注册主蓝图到应用
     app.register_blueprint(api_bp)
     
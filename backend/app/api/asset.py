@@ -11,6 +11,7 @@ from app.models.asset import Asset, AssetStatusLog, AssetCategory
 from app.models.location import Building, Floor, Room
 from app.utils.response import ApiResponse
 from app.utils.auth import login_required, permission_required, log_operation
+from app.utils.query_tracker import query_budget
 from app.utils.exceptions import ValidationError as CustomValidationError, ResourceNotFoundError
 from app.utils.helpers import generate_asset_code, allowed_file, validate_ip_address, validate_mac_address
 from app.utils.excel import AssetExcelProcessor
@@ -73,6 +74,7 @@ class AssetSchema(Schema):
 
 
 @asset_bp.route('', methods=['GET'])
+@query_budget(max_queries=15)
 @login_required
 @permission_required('asset:view')
 def get_assets():
@@ -121,23 +123,17 @@ def get_assets():
         elif hasattr(Asset, key):
             query = query.filter(getattr(Asset, key).like(f'%{value}%') if isinstance(value, str) else getattr(Asset, key) == value)
     
-    # 分页查询
+    # 保修状态过滤（转换为保修结束日期的范围条件，分页与总数随之正确）
+    if warranty_status:
+        warranty_condition = Asset.warranty_filter(warranty_status)
+        if warranty_condition is not None:
+            query = query.filter(warranty_condition)
+    
+    # 分页查询（位置关系随页面一并加载）
+    query = query.options(*Asset.location_load_options())
     pagination = query.paginate(page=page, per_page=page_size, error_out=False)
     
-    assets = []
-    for asset in pagination.items:
-        asset_dict = asset.to_dict()
-        
-        # 保修状态过滤
-        if warranty_status:
-            if warranty_status == 'expiring' and not asset.is_warranty_expiring():
-                continue
-            elif warranty_status == 'expired' and asset.get_warranty_status() != '已过保':
-                continue
-            elif warranty_status == 'valid' and asset.get_warranty_status() != '保修中':
-                continue
-        
-        assets.append(asset_dict)
+    assets = Asset.to_dict_list(pagination.items)
     
     return ApiResponse.page_success(
         assets,
@@ -542,13 +538,10 @@ def get_warranty_alerts():
     """获取保修预警"""
     days = request.args.get('days', 30, type=int)  # 默认30天内到期
     
-    assets = Asset.query.filter_by(is_deleted=False).all()
-    expiring_assets = []
-    
-    for asset in assets:
-        if asset.is_warranty_expiring(days):
-            asset_dict = asset.to_dict()
-            expiring_assets.append(asset_dict)
+    assets = Asset.query.filter_by(is_deleted=False).filter(
+        Asset.warranty_filter('expiring', days=days)
+    ).options(*Asset.location_load_options()).all()
+    expiring_assets = Asset.to_dict_list(assets)
     
     return ApiResponse.success(expiring_assets, f"获取{days}天内保修到期资产成功")
 
@@ -4,7 +4,7 @@
 from datetime import datetime, timedelta
 from flask import Blueprint, request, current_app
 from flask_jwt_extended import (
-    create_access_token, create_refresh_token, 
+    create_access_token, create_refresh_token, decode_token,
     jwt_required, get_jwt_identity, get_jwt
 )
 from marshmallow import Schema, fields, validate, ValidationError
@@ -17,8 +17,12 @@ from app.utils.enhanced_audit import audit_logger, AuditEventType, AuditSeverity
 from app.utils.api_signature import require_api_signature
 from app.utils.anomaly_detection import anomaly_detector
 from app.utils.communication_security import require_secure_communication
-from app.utils.exceptions import AuthenticationError, ValidationError as CustomValidationError
-from app import db, limiter
+from app.utils.permission_cache import build_permission_claims
+from app.utils.password_pool import password_pool
+from app.utils.token_revocation import token_revocation
+from app.utils.shared_store import SharedStoreUnavailable
+from app.utils.exceptions import AuthenticationError, ServiceBusyError, ValidationError as CustomValidationError
+from app import db
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -37,10 +41,23 @@ class ChangePasswordSchema(Schema):
     confirm_password = fields.Str(required=True)
 
 
+def _permission_claims(user) -> dict:
+    """权限快照模式下生成附加声明"""
+    if not current_app.config.get('JWT_EMBED_PERMISSIONS', False):
+        return None
+    return build_permission_claims(user)
+
+
+def _access_claims(user, refresh_jti: str, refresh_exp: int) -> dict:
+    """访问令牌附加声明：权限快照及配对的刷新令牌（登出时一并吊销）"""
+    claims = dict(_permission_claims(user) or {})
+    claims['refresh_jti'] = refresh_jti
+    claims['refresh_exp'] = refresh_exp
+    return claims
+
+
 @auth_bp.route('/login', methods=['POST'])
-@limiter.limit("3 per minute", key_func=lambda: get_client_ip(request))
-@limiter.limit("20 per hour", key_func=lambda: get_client_ip(request))
-@require_api_signature
+@require_api_signature()
 @require_secure_communication
 @log_operation("用户登录")
 def login():
@@ -56,8 +73,10 @@ def login():
     password = data['password']
     remember_me = data.get('remember_me', False)
     
-    # 查找用户
+    # 查找用户（支持邮箱登录，通过盲索引等值查询）
     user = User.query.filter_by(username=username, is_deleted=False).first()
+    if not user and '@' in username:
+        user = User.find_by_email(username)
     if not user:
         current_app.logger.warning(f"登录失败: 用户名不存在 - {username} - IP: {get_client_ip(request)}")
         # 记录登录失败审计日志
@@ -81,8 +100,8 @@ def login():
         current_app.logger.warning(f"登录失败: 账户被禁用 - {username}")
         raise AuthenticationError("账户已被禁用")
     
-    # 验证密码
-    if not user.check_password(password):
+    # 验证密码（在独立进程池中执行）
+    if not password_pool.verify(user.password_hash, password):
         # 增加失败次数
         user.failed_login_count += 1
         
@@ -96,6 +115,10 @@ def login():
         current_app.logger.warning(f"登录失败: 密码错误 - {username} - 失败次数: {user.failed_login_count}")
         raise AuthenticationError("用户名或密码错误")
     
+    # 哈希参数变更时透明地重新哈希
+    if password_pool.needs_rehash(user.password_hash):
+        user.password_hash = password_pool.hash(password)
+    
     # 登录成功，重置失败次数
     user.failed_login_count = 0
     user.login_count += 1
@@ -114,11 +137,13 @@ def login():
     
     # 生成令牌
     expires_delta = timedelta(days=7) if remember_me else None
+    refresh_token = create_refresh_token(identity=user.id)
+    refresh_claims = decode_token(refresh_token)
     access_token = create_access_token(
         identity=user.id,
-        expires_delta=expires_delta
+        expires_delta=expires_delta,
+        additional_claims=_access_claims(user, refresh_claims['jti'], refresh_claims['exp'])
     )
-    refresh_token = create_refresh_token(identity=user.id)
     
     current_app.logger.info(f"用户登录成功 - {username} - IP: {get_client_ip(request)}")
     
@@ -135,16 +160,22 @@ def login():
 @log_operation("用户登出")
 def logout():
     """用户登出"""
-    # 将令牌加入黑名单（这里简化处理，实际应该使用Redis等缓存）
-    jti = get_jwt()['jti']
-    # TODO: 将jti加入黑名单
+    # 吊销当前令牌及配对的刷新令牌，吊销记录保留到令牌自然过期
+    claims = get_jwt()
+    try:
+        token_revocation.revoke(claims['jti'], claims.get('exp'))
+        if claims.get('refresh_jti'):
+            token_revocation.revoke(claims['refresh_jti'], claims.get('refresh_exp'))
+    except SharedStoreUnavailable:
+        # 吊销只在本进程生效，不能向客户端报告登出成功
+        raise ServiceBusyError("会话服务暂不可用，登出失败，请稍后重试")
     
     return ApiResponse.success(message="登出成功")
 
 
 @auth_bp.route('/refresh', methods=['POST'])
 @jwt_required(refresh=True)
-@require_api_signature
+@require_api_signature()
 def refresh():
     """刷新令牌"""
     user_id = get_jwt_identity()
@@ -153,8 +184,12 @@ def refresh():
     if not user or not user.is_active():
         raise AuthenticationError("无效的刷新令牌")
     
-    # 生成新的访问令牌
-    access_token = create_access_token(identity=user_id)
+    # 生成新的访问令牌（沿用当前刷新令牌作为配对令牌）
+    refresh_claims = get_jwt()
+    access_token = create_access_token(
+        identity=user_id,
+        additional_claims=_access_claims(user, refresh_claims['jti'], refresh_claims['exp'])
+    )
     
     return ApiResponse.success({
         'access_token': access_token,
@@ -191,6 +226,12 @@ def update_profile():
     # 允许更新的字段
     allowed_fields = ['real_name', 'email', 'phone']
     
+    # 邮箱、手机号唯一性检查（盲索引等值查询）
+    if data.get('email') and User.find_by_email(data['email'], exclude_id=user.id):
+        raise CustomValidationError("邮箱已被使用")
+    if data.get('phone') and User.find_by_phone(data['phone'], exclude_id=user.id):
+        raise CustomValidationError("手机号已被使用")
+    
     for field in allowed_fields:
         if field in data:
             setattr(user, field, data[field])
@@ -206,7 +247,7 @@ def update_profile():
 
 @auth_bp.route('/change-password', methods=['POST'])
 @jwt_required()
-@require_api_signature
+@require_api_signature()
 @log_operation("修改密码")
 def change_password():
     """修改密码"""
@@ -224,7 +265,7 @@ def change_password():
         raise AuthenticationError("用户不存在")
     
     # 验证旧密码
-    if not user.check_password(data['old_password']):
+    if not password_pool.verify(user.password_hash, data['old_password']):
         raise AuthenticationError("原密码错误")
     
     # 验证新密码确认
@@ -232,7 +273,7 @@ def change_password():
         raise CustomValidationError("新密码确认不匹配")
     
     # 检查新密码是否与旧密码相同
-    if user.check_password(data['new_password']):
+    if data['new_password'] == data['old_password']:
         raise CustomValidationError("新密码不能与原密码相同")
     
     # 更新密码
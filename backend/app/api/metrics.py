@@ -0,0 +1,64 @@
+"""
+OpenMetrics指标导出API
+供Prometheus等监控系统抓取。必须配置METRICS_AUTH_TOKEN（Bearer令牌）或
+METRICS_ALLOWED_IPS（抓取端IP/网段白名单）之一，两者均配置时需同时满足；
+均未配置时拒绝提供指标，非调试/测试环境启动时直接报错
+"""
+import hmac
+import ipaddress
+
+from flask import Blueprint, Response, request, current_app
+
+from app import limiter
+from app.middleware.detection import skip_security_detection
+from app.utils.openmetrics import render_metrics, CONTENT_TYPE
+
+metrics_bp = Blueprint('metrics', __name__)
+
+
+def _allowed_networks(app) -> list:
+    """解析抓取端白名单（逗号分隔的IP或CIDR）"""
+    value = app.config.get('METRICS_ALLOWED_IPS') or ''
+    if isinstance(value, str):
+        value = value.split(',')
+    return [ipaddress.ip_network(item.strip(), strict=False) for item in value if item.strip()]
+
+
+@metrics_bp.record_once
+def _check_access_config(state):
+    """未配置访问控制时拒绝启动（调试与测试环境除外）"""
+    app = state.app
+    _allowed_networks(app)  # 白名单格式错误时启动即报错
+    if app.debug or app.testing:
+        return
+    if not app.config.get('METRICS_AUTH_TOKEN') and not app.config.get('METRICS_ALLOWED_IPS'):
+        raise RuntimeError("/metrics需要配置METRICS_AUTH_TOKEN或METRICS_ALLOWED_IPS")
+
+
+def _client_allowed(networks: list) -> bool:
+    """按直连对端地址校验（不信任可伪造的X-Forwarded-For）"""
+    try:
+        address = ipaddress.ip_address(request.remote_addr or '')
+    except ValueError:
+        return False
+    return any(address in network for network in networks)
+
+
+@metrics_bp.route('/metrics', methods=['GET'])
+@limiter.exempt
+@skip_security_detection
+def get_metrics():
+    """OpenMetrics文本格式指标"""
+    token = current_app.config.get('METRICS_AUTH_TOKEN')
+    networks = _allowed_networks(current_app)
+    if not token and not networks:
+        return Response('metrics access control not configured\n', status=403, mimetype='text/plain')
+
+    if networks and not _client_allowed(networks):
+        return Response('forbidden\n', status=403, mimetype='text/plain')
+    if token:
+        provided = request.headers.get('Authorization', '')
+        if not hmac.compare_digest(provided, f'Bearer {token}'):
+            return Response('unauthorized\n', status=401, mimetype='text/plain')
+
+    return Response(render_metrics(), content_type=CONTENT_TYPE)
@@ -2,16 +2,21 @@
 监控API端点
 提供系统监控、性能指标、安全审计等信息的API接口
 """
-from flask import Blueprint, request, jsonify
+from datetime import datetime
+from flask import Blueprint, request, jsonify, g, send_file
 from flask_jwt_extended import jwt_required
 
 from app.utils.response import ApiResponse
-from app.utils.auth import role_required, log_operation
+from app.utils.auth import role_required, log_operation, operation_log_writer
 from app.utils.performance_monitor import performance_monitor
+from app.utils.request_profiler import request_profiler
 from app.utils.compliance_checker import compliance_manager
 from app.utils.anomaly_detection import anomaly_detector
-from app.utils.enhanced_audit import audit_logger
+from app.utils.ip_blocklist import ip_blocklist
+from app.utils.shared_store import store_status
+from app.utils.enhanced_audit import audit_logger, audit_writer
 from app.utils.api_signature import require_api_signature
+from app.middleware.detection import detection_pipeline, skip_security_detection
 
 monitor_bp = Blueprint('monitor', __name__)
 
@@ -35,13 +40,17 @@ def get_metrics_history():
     """获取历史性能指标"""
     metric_type = request.args.get('metric_type', 'cpu_usage')
     hours = request.args.get('hours', 24, type=int)
+    resolution = request.args.get('resolution')  # raw/1h/1d，默认按范围自动选择
+    if resolution not in (None, 'raw', '1h', '1d'):
+        return ApiResponse.error("resolution只能为raw、1h或1d")
     
     try:
-        history = performance_monitor.get_historical_metrics(metric_type, hours)
+        history = performance_monitor.get_historical_metrics(metric_type, hours, resolution)
         return ApiResponse.success({
             'metric_type': metric_type,
             'hours': hours,
-            'data': history
+            'resolution': history['resolution'],
+            'data': history['points']
         }, "获取历史指标成功")
     except Exception as e:
         return ApiResponse.error(f"获取历史指标失败: {str(e)}")
@@ -65,6 +74,42 @@ def get_system_alerts():
         return ApiResponse.error(f"获取系统告警失败: {str(e)}")
 
 
+@monitor_bp.route('/system/profiles', methods=['GET'])
+@jwt_required()
+@role_required('admin')
+def get_request_profiles():
+    """获取慢请求采样列表"""
+    limit = min(request.args.get('limit', 50, type=int), 500)
+    endpoint = request.args.get('endpoint')
+    
+    try:
+        profiles = request_profiler.list_profiles(limit=limit, endpoint=endpoint)
+        return ApiResponse.success({
+            'profiles': profiles,
+            'stats': request_profiler.get_stats()
+        }, "获取请求采样列表成功")
+    except Exception as e:
+        return ApiResponse.error(f"获取请求采样列表失败: {str(e)}")
+
+
+@monitor_bp.route('/system/profiles/<profile_id>', methods=['GET'])
+@jwt_required()
+@role_required('admin')
+def download_request_profile(profile_id):
+    """下载慢请求采样文件（format=collapsed为折叠栈，json为元数据）"""
+    kind = request.args.get('format', 'collapsed')
+    path = request_profiler.profile_path(profile_id, kind)
+    if path is None:
+        return ApiResponse.error("采样文件不存在", 404)
+    
+    return send_file(
+        path,
+        mimetype='application/json' if kind == 'json' else 'text/plain',
+        as_attachment=True,
+        download_name=f'{profile_id}.{kind}'
+    )
+
+
 @monitor_bp.route('/security/anomalies', methods=['GET'])
 @jwt_required()
 @role_required('admin')
@@ -89,26 +134,62 @@ def get_security_anomalies():
 @jwt_required()
 @role_required('admin')
 def get_blocked_ips():
-    """获取被阻止的IP列表"""
+    """获取被阻止的IP/网段列表（action=allow时返回放行列表）"""
+    action = request.args.get('action', 'block')
+    
     try:
-        blocked_ips = anomaly_detector.get_blocked_ips()
+        rules = [rule.to_dict() for rule in ip_blocklist.list_rules(action=action)]
         return ApiResponse.success({
-            'blocked_ips': blocked_ips,
-            'total': len(blocked_ips)
+            'blocked_ips': rules,
+            'total': len(rules),
+            'engine': ip_blocklist.get_stats()
         }, "获取阻止IP列表成功")
     except Exception as e:
         return ApiResponse.error(f"获取阻止IP列表失败: {str(e)}")
 
 
+@monitor_bp.route('/security/blocked-ips', methods=['POST'])
+@jwt_required()
+@role_required('admin')
+@require_api_signature()
+@log_operation("添加IP访问规则")
+def add_blocked_ip():
+    """添加IP/网段阻止或放行规则
+    
+    请求体: {"cidr": "10.1.0.0/16", "action": "block", "duration": 3600, "reason": "..."}
+    duration为空表示永久
+    """
+    data = request.json or {}
+    cidr = data.get('cidr') or data.get('ip_address')
+    
+    if not cidr:
+        return ApiResponse.error("IP地址或网段不能为空")
+    
+    try:
+        rule = ip_blocklist.add_rule(
+            cidr,
+            action=data.get('action', 'block'),
+            duration=data.get('duration'),
+            reason=data.get('reason'),
+            source='manual',
+            created_by=g.current_user.id if getattr(g, 'current_user', None) else None
+        )
+        return ApiResponse.success(rule.to_dict(), f"已添加规则 {rule.cidr}")
+    except ValueError as e:
+        return ApiResponse.error(f"规则无效: {str(e)}")
+    except Exception as e:
+        return ApiResponse.error(f"添加IP规则失败: {str(e)}")
+
+
 @monitor_bp.route('/security/unblock-ip', methods=['POST'])
 @jwt_required()
 @role_required('admin')
-@require_api_signature
+@require_api_signature()
 @log_operation("解除IP阻止")
 def unblock_ip():
-    """解除IP阻止"""
+    """解除IP/网段阻止"""
     data = request.json or {}
-    ip_address = data.get('ip_address')
+    ip_address = data.get('ip_address') or data.get('cidr')
     
     if not ip_address:
         return ApiResponse.error("IP地址不能为空")
@@ -119,6 +200,8 @@ def unblock_ip():
             return ApiResponse.success(message=f"IP {ip_address} 已解除阻止")
         else:
             return ApiResponse.error(f"IP {ip_address} 未在阻止列表中")
+    except ValueError:
+        return ApiResponse.error(f"IP地址格式无效: {ip_address}")
     except Exception as e:
         return ApiResponse.error(f"解除IP阻止失败: {str(e)}")
 
@@ -126,7 +209,7 @@ def unblock_ip():
 @monitor_bp.route('/compliance/check', methods=['POST'])
 @jwt_required()
 @role_required('admin')
-@require_api_signature
+@require_api_signature()
 @log_operation("执行合规性检查")
 def run_compliance_check():
     """执行合规性检查"""
@@ -166,34 +249,59 @@ def run_compliance_check():
 @jwt_required()
 @role_required('admin')
 def get_audit_logs():
-    """获取审计日志"""
+    """获取审计日志（游标分页）
+    
+    查询参数: cursor, page_size, event_type, severity, user_id, start_time, end_time,
+    count(none/exact/estimate，默认none)；未提供cursor时兼容page参数
+    """
     page = request.args.get('page', 1, type=int)
     page_size = min(request.args.get('page_size', 50, type=int), 200)
+    cursor = request.args.get('cursor')
     event_type = request.args.get('event_type')
     severity = request.args.get('severity')
-    start_time = request.args.get('start_time')
-    end_time = request.args.get('end_time')
+    user_id = request.args.get('user_id', type=int)
+    count = request.args.get('count', 'none')
     
     try:
+        start_time = _parse_time_arg('start_time')
+        end_time = _parse_time_arg('end_time')
+        if count not in ('none', 'exact', 'estimate'):
+            raise ValueError("count参数只能为none、exact或estimate")
+        
         logs = audit_logger.query_logs(
-            page=page,
             page_size=page_size,
+            cursor=cursor,
             event_type=event_type,
             severity=severity,
+            user_id=user_id,
             start_time=start_time,
-            end_time=end_time
+            end_time=end_time,
+            count=count,
+            page=page
         )
-        
-        return ApiResponse.page_success(
-            logs['items'],
-            logs['total'],
-            page,
-            page_size,
-            "获取审计日志成功"
-        )
-        
+    except ValueError as e:
+        return ApiResponse.error(str(e))
     except Exception as e:
         return ApiResponse.error(f"获取审计日志失败: {str(e)}")
+    
+    return ApiResponse.cursor_success(
+        logs['items'],
+        logs['next_cursor'],
+        page_size,
+        logs['total'],
+        "获取审计日志成功"
+    )
+
+
+def _parse_time_arg(name):
+    """解析ISO格式的时间查询参数"""
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"{name}格式无效，应为ISO格式时间")
 
 
 @monitor_bp.route('/audit/statistics', methods=['GET'])
@@ -211,6 +319,7 @@ def get_audit_statistics():
 
 
 @monitor_bp.route('/health', methods=['GET'])
+@skip_security_detection
 def health_check():
     """健康检查端点"""
     try:
@@ -237,6 +346,20 @@ def health_check():
             status = "critical"
             issues.append(f"磁盘使用率过高: {disk_usage}%")
         
+        # 审计日志写入队列背压
+        audit_writer_stats = audit_writer.get_stats()
+        if audit_writer_stats['queue_depth'] > audit_writer_stats['queue_capacity'] * 0.8:
+            if status == "healthy":
+                status = "warning"
+            issues.append(f"审计日志写入队列积压: {audit_writer_stats['queue_depth']}")
+        
+        # 共享存储降级（权限版本、令牌吊销、IP规则同步按失败关闭处理）
+        shared_store_status = store_status()
+        if shared_store_status.get('degraded'):
+            if status == "healthy":
+                status = "warning"
+            issues.append(f"共享存储不可用: {shared_store_status.get('last_error')}")
+        
         response_data = {
             'status': status,
             'timestamp': metrics['timestamp'],
@@ -245,6 +368,10 @@ def health_check():
                 'memory_usage': memory_usage,
                 'disk_usage': disk_usage
             },
+            'audit_writer': audit_writer_stats,
+            'operation_log_writer': operation_log_writer.get_stats(),
+            'security_detection': detection_pipeline.get_stats(),
+            'shared_store': shared_store_status,
             'issues': issues
         }
         
@@ -320,7 +447,7 @@ def get_dashboard_data():
 @monitor_bp.route('/start-monitoring', methods=['POST'])
 @jwt_required()
 @role_required('admin')
-@require_api_signature
+@require_api_signature()
 @log_operation("启动系统监控")
 def start_monitoring():
     """启动系统监控"""
@@ -337,7 +464,7 @@ def start_monitoring():
 @monitor_bp.route('/stop-monitoring', methods=['POST'])
 @jwt_required()
 @role_required('admin')
-@require_api_signature
+@require_api_signature()
 @log_operation("停止系统监控")
 def stop_monitoring():
     """停止系统监控"""
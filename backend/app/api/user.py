@@ -3,6 +3,7 @@
 """
 from flask import Blueprint, request
 from marshmallow import Schema, fields, validate, ValidationError
+from sqlalchemy.orm import undefer_group
 from datetime import datetime
 
 from app.models.user import User, Role
@@ -10,6 +11,7 @@ from app.utils.response import ApiResponse
 from app.utils.auth import login_required, permission_required, log_operation
 from app.utils.exceptions import ValidationError as CustomValidationError, ResourceNotFoundError
 from app.utils.helpers import validate_email, validate_phone
+from app.utils.encryption import blind_index
 from app.utils.api_signature import require_api_signature
 from app.utils.communication_security import require_secure_communication
 from app import db
@@ -49,15 +51,16 @@ def get_users():
     email = request.args.get('email', '').strip()
     status = request.args.get('status', type=int)
     
-    # 构建查询
-    query = User.query.filter_by(is_deleted=False)
+    # 构建查询（列表需要渲染加密字段，批量加载避免逐行查询）
+    query = User.query.options(undefer_group('encrypted')).filter_by(is_deleted=False)
     
     if username:
         query = query.filter(User.username.like(f'%{username}%'))
     if real_name:
         query = query.filter(User.real_name.like(f'%{real_name}%'))
     if email:
-        query = query.filter(User.email.like(f'%{email}%'))
+        # 邮箱为加密存储，仅支持通过盲索引精确匹配
+        query = query.filter(User.email_bidx == blind_index(email, 'email'))
     if status is not None:
         query = query.filter(User.status == status)
     
@@ -94,7 +97,7 @@ def get_user(user_id):
 @user_bp.route('', methods=['POST'])
 @login_required
 @permission_required('user:create')
-@require_api_signature
+@require_api_signature()
 @log_operation("创建用户")
 def create_user():
     """创建用户"""
@@ -112,14 +115,14 @@ def create_user():
     if data.get('email'):
         if not validate_email(data['email']):
             raise CustomValidationError("邮箱格式无效")
-        if User.query.filter_by(email=data['email'], is_deleted=False).first():
+        if User.find_by_email(data['email']):
             raise CustomValidationError("邮箱已被使用")
     
     # 检查手机号是否已存在
     if data.get('phone'):
         if not validate_phone(data['phone']):
             raise CustomValidationError("手机号格式无效")
-        if User.query.filter_by(phone=data['phone'], is_deleted=False).first():
+        if User.find_by_phone(data['phone']):
             raise CustomValidationError("手机号已被使用")
     
     # 创建用户
@@ -149,7 +152,7 @@ def create_user():
 @user_bp.route('/<int:user_id>', methods=['PUT'])
 @login_required
 @permission_required('user:edit')
-@require_api_signature
+@require_api_signature()
 @log_operation("更新用户")
 def update_user(user_id):
     """更新用户"""
@@ -167,14 +170,14 @@ def update_user(user_id):
     if data.get('email') and data['email'] != user.email:
         if not validate_email(data['email']):
             raise CustomValidationError("邮箱格式无效")
-        if User.query.filter_by(email=data['email'], is_deleted=False).filter(User.id != user_id).first():
+        if User.find_by_email(data['email'], exclude_id=user_id):
             raise CustomValidationError("邮箱已被使用")
     
     # 检查手机号是否已被其他用户使用
     if data.get('phone') and data['phone'] != user.phone:
         if not validate_phone(data['phone']):
             raise CustomValidationError("手机号格式无效")
-        if User.query.filter_by(phone=data['phone'], is_deleted=False).filter(User.id != user_id).first():
+        if User.find_by_phone(data['phone'], exclude_id=user_id):
             raise CustomValidationError("手机号已被使用")
     
     # 更新用户信息
@@ -205,7 +208,7 @@ def update_user(user_id):
 @user_bp.route('/<int:user_id>', methods=['DELETE'])
 @login_required
 @permission_required('user:delete')
-@require_api_signature
+@require_api_signature()
 @log_operation("删除用户")
 def delete_user(user_id):
     """删除用户"""
@@ -228,7 +231,7 @@ def delete_user(user_id):
 @user_bp.route('/<int:user_id>/reset-password', methods=['POST'])
 @login_required
 @permission_required('user:edit')
-@require_api_signature
+@require_api_signature()
 @log_operation("重置用户密码")
 def reset_password(user_id):
     """重置用户密码"""
@@ -2,5 +2,6 @@
 中间件模块
 """
 from .security_middleware import security_middleware, require_security_compliance
+from .detection import detection_pipeline, skip_security_detection
 
-__all__ = ['security_middleware', 'require_security_compliance']
\ No newline at end of file
+__all__ = ['security_middleware', 'require_security_compliance', 'detection_pipeline', 'skip_security_detection']
\ No newline at end of file
@@ -0,0 +1,286 @@
+"""
+请求级安全检测流水线
+在before_request中以进程内环形缓冲计数为主、批量同步共享计数，
+支持按路由豁免、低风险GET采样以及单请求时间预算，并统计检测耗时
+"""
+import re
+import time
+import random
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import List, Optional
+
+from flask import request, g, current_app
+
+from app.utils.anomaly_detection import (
+    anomaly_detector, AnomalyEvent, AnomalyType, ThreatLevel
+)
+
+
+# 已知扫描器/攻击工具的User-Agent特征
+SUSPICIOUS_USER_AGENT_PATTERN = re.compile(
+    r'sqlmap|nikto|nmap|masscan|acunetix|nessus|dirbuster|gobuster|wpscan|zgrab|hydra|nuclei',
+    re.IGNORECASE
+)
+
+LOW_RISK_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS'])
+
+
+def skip_security_detection(f):
+    """路由级豁免安全检测（用于健康检查、轮询等高频低风险接口）"""
+    f._skip_security_detection = True
+    return f
+
+
+class RingCounter:
+    """按秒分槽的环形缓冲计数器，维护窗口内累计值，计数为O(1)摊销"""
+
+    __slots__ = ('window', 'slots', 'current', 'total', 'pending', 'last_flush')
+
+    def __init__(self, window: int):
+        self.window = window
+        self.slots = [0] * window
+        self.current = 0
+        self.total = 0
+        self.pending = 0  # 尚未同步到共享计数的次数
+        self.last_flush = 0.0
+
+    def hit(self, now: float) -> int:
+        """计数并返回窗口内的总数"""
+        second = int(now)
+        if second != self.current:
+            if second - self.current >= self.window:
+                self.slots = [0] * self.window
+                self.total = 0
+            else:
+                # 清空跨过的过期槽位
+                for s in range(self.current + 1, second + 1):
+                    index = s % self.window
+                    self.total -= self.slots[index]
+                    self.slots[index] = 0
+            self.current = second
+        self.slots[second % self.window] += 1
+        self.total += 1
+        self.pending += 1
+        return self.total
+
+
+class LRUDict(OrderedDict):
+    """容量受限的有序字典"""
+
+    def __init__(self, max_size: int):
+        super().__init__()
+        self.max_size = max_size
+
+    def touch(self, key, factory):
+        value = self.get(key)
+        if value is None:
+            value = factory()
+            self[key] = value
+            if len(self) > self.max_size:
+                self.popitem(last=False)
+        else:
+            self.move_to_end(key)
+        return value
+
+
+class DetectionPipeline:
+    """合并的请求级安全检测阶段"""
+
+    def __init__(self):
+        self.app = None
+        self._lock = threading.Lock()
+        self._counters = LRUDict(10000)
+        self._alerted = LRUDict(10000)
+        self.stats = {
+            'requests': 0,
+            'skipped': 0,
+            'sampled_out': 0,
+            'budget_exceeded': 0,
+            'anomalies': 0,
+            'total_us': 0.0,
+            'max_us': 0.0,
+        }
+
+    def init_app(self, app):
+        self.app = app
+        self._counters.max_size = app.config.get('SECURITY_DETECTION_MAX_TRACKED_IPS', 10000)
+        self._alerted.max_size = self._counters.max_size
+
+    # ---------- 配置 ----------
+
+    def _config(self, key, default):
+        return current_app.config.get(key, default)
+
+    def _is_exempt(self) -> bool:
+        """是否豁免检测：静态文件、配置的路径前缀或标记了skip_security_detection的视图"""
+        if request.endpoint == 'static':
+            return True
+        path = request.path
+        for prefix in self._config('SECURITY_DETECTION_EXEMPT_PATHS', ()):
+            if path.startswith(prefix):
+                return True
+        view = current_app.view_functions.get(request.endpoint)
+        return bool(view is not None and getattr(view, '_skip_security_detection', False))
+
+    # ---------- 检测阶段 ----------
+
+    def run(self) -> Optional[tuple]:
+        """执行检测，返回需要直接响应的结果（被阻止时）或None"""
+        start = time.perf_counter()
+        self.stats['requests'] += 1
+        g.security_anomalies = []
+
+        if not self._config('SECURITY_DETECTION_ENABLED', True) or self._is_exempt():
+            self.stats['skipped'] += 1
+            g.security_check_us = 0.0
+            return None
+
+        budget = self._config('SECURITY_DETECTION_BUDGET_MS', 2.0) / 1000.0
+        ip = g.client_ip
+        result = None
+
+        try:
+            # 阶段1：IP阻止列表（进程内缓存）
+            if anomaly_detector.is_ip_blocked(ip):
+                result = ({'error': 'Access denied'}, 403)
+                return result
+
+            # 阶段2：请求频率（环形缓冲计数，批量同步到共享计数）
+            self._check_request_rate(ip)
+
+            # 低风险请求按比例采样执行其余检测
+            if request.method in LOW_RISK_METHODS and \
+                    random.random() >= self._config('SECURITY_DETECTION_SAMPLE_RATE', 0.1):
+                self.stats['sampled_out'] += 1
+                return None
+
+            # 阶段3：User-Agent
+            if self._over_budget(start, budget):
+                return None
+            self._check_user_agent(ip, g.user_agent)
+
+            # 阶段4：访问时间
+            if self._over_budget(start, budget):
+                return None
+            self._check_access_time(ip)
+
+        except Exception as e:
+            current_app.logger.error(f"异常检测错误: {str(e)}")
+
+        finally:
+            elapsed_us = (time.perf_counter() - start) * 1e6
+            g.security_check_us = elapsed_us
+            self.stats['total_us'] += elapsed_us
+            if elapsed_us > self.stats['max_us']:
+                self.stats['max_us'] = elapsed_us
+            if g.security_anomalies:
+                self.stats['anomalies'] += len(g.security_anomalies)
+                anomaly_detector.handle_anomaly_events(g.security_anomalies)
+
+        return result
+
+    def _over_budget(self, start: float, budget: float) -> bool:
+        if time.perf_counter() - start > budget:
+            self.stats['budget_exceeded'] += 1
+            return True
+        return False
+
+    def _check_request_rate(self, ip: str):
+        """进程内计数；累计一定次数或超过同步间隔时合并写入共享计数并判断阈值"""
+        thresholds = anomaly_detector.thresholds
+        now = time.time()
+        with self._lock:
+            counter = self._counters.touch(ip, lambda: RingCounter(thresholds['rapid_api_timeframe']))
+            local_count = counter.hit(now)
+            flush_every = self._config('SECURITY_DETECTION_SYNC_EVERY', 20)
+            if counter.pending < flush_every and now - counter.last_flush < 1.0 \
+                    and local_count < thresholds['rapid_api_calls']:
+                return
+            pending, counter.pending, counter.last_flush = counter.pending, 0, now
+
+        call_count = anomaly_detector.api_call_history.hit(ip, pending)
+        if call_count >= thresholds['rapid_api_calls'] and self._should_alert(ip, AnomalyType.RAPID_API_CALLS):
+            g.security_anomalies.append(AnomalyEvent(
+                anomaly_type=AnomalyType.RAPID_API_CALLS,
+                threat_level=ThreatLevel.MEDIUM,
+                user_id=None,
+                ip_address=ip,
+                description=f"检测到快速API调用，{thresholds['rapid_api_timeframe']}秒内调用{call_count}次",
+                confidence_score=min(call_count / thresholds['rapid_api_calls'], 1.0),
+                evidence={'call_count': call_count, 'timeframe': thresholds['rapid_api_timeframe']},
+                timestamp=datetime.utcnow(),
+                risk_score=min(50 + call_count, 100)
+            ))
+
+    def _check_user_agent(self, ip: str, user_agent: str):
+        """空User-Agent或已知扫描工具特征"""
+        if user_agent and not SUSPICIOUS_USER_AGENT_PATTERN.search(user_agent):
+            return
+        if not self._should_alert(ip, AnomalyType.SUSPICIOUS_USER_AGENT):
+            return
+        g.security_anomalies.append(AnomalyEvent(
+            anomaly_type=AnomalyType.SUSPICIOUS_USER_AGENT,
+            threat_level=ThreatLevel.MEDIUM if user_agent else ThreatLevel.LOW,
+            user_id=None,
+            ip_address=ip,
+            description=f"可疑的User-Agent: {user_agent[:100] if user_agent else '(空)'}",
+            confidence_score=0.9 if user_agent else 0.5,
+            evidence={'user_agent': (user_agent or '')[:200], 'path': request.path},
+            timestamp=datetime.utcnow(),
+            risk_score=60 if user_agent else 30
+        ))
+
+    def _check_access_time(self, ip: str):
+        """非工作时段的写操作"""
+        off_hours = self._config('SECURITY_OFF_HOURS', (0, 6))
+        if not off_hours or request.method in LOW_RISK_METHODS:
+            return
+        hour = datetime.now().hour
+        if not off_hours[0] <= hour < off_hours[1]:
+            return
+        if not self._should_alert(ip, AnomalyType.UNUSUAL_ACCESS_PATTERN):
+            return
+        g.security_anomalies.append(AnomalyEvent(
+            anomaly_type=AnomalyType.UNUSUAL_ACCESS_PATTERN,
+            threat_level=ThreatLevel.LOW,
+            user_id=None,
+            ip_address=ip,
+            description=f"非工作时段的写操作: {hour}:00 {request.method} {request.path}",
+            confidence_score=0.5,
+            evidence={'hour': hour, 'method': request.method, 'path': request.path},
+            timestamp=datetime.utcnow(),
+            risk_score=30
+        ))
+
+    def _should_alert(self, ip: str, anomaly_type: AnomalyType) -> bool:
+        """同一IP同类告警在冷却时间内只报告一次"""
+        key = (ip, anomaly_type)
+        now = time.time()
+        cooldown = self._config('SECURITY_ALERT_COOLDOWN', 300)
+        with self._lock:
+            last = self._alerted.get(key)
+            if last is not None and now - last < cooldown:
+                return False
+            self._alerted[key] = now
+            if len(self._alerted) > self._alerted.max_size:
+                self._alerted.popitem(last=False)
+        return True
+
+    def get_stats(self) -> dict:
+        """检测耗时统计"""
+        stats = dict(self.stats)
+        checked = stats['requests'] - stats['skipped']
+        stats['avg_us'] = stats['total_us'] / checked if checked else 0.0
+        stats['tracked_ips'] = len(self._counters)
+        return stats
+
+
+def current_anomalies() -> List[AnomalyEvent]:
+    """当前请求检测到的异常"""
+    return getattr(g, 'security_anomalies', [])
+
+
+# 全局检测流水线
+detection_pipeline = DetectionPipeline()
@@ -2,6 +2,8 @@
 资产管理模型
 """
 from datetime import datetime, timedelta
+from sqlalchemy import case, func
+from sqlalchemy.orm import joinedload
 from app import db
 from app.models.base import BaseModel
 
@@ -10,6 +12,9 @@ class Asset(BaseModel):
     """资产模型"""
     __tablename__ = 'it_asset'
     
+    # 列表中附带端口统计的类别
+    PORT_STAT_CATEGORIES = ['网络设备', '交换机', '路由器', '防火墙', '服务器']
+    
     # 基本信息
     asset_code = db.Column(db.String(50), unique=True, nullable=False, comment='资产编码')
     name = db.Column(db.String(100), nullable=False, comment='资产名称')
@@ -75,8 +80,18 @@ class Asset(BaseModel):
     device_ports = db.relationship('DevicePort', backref='asset_device', lazy='dynamic', 
                                    foreign_keys='DevicePort.device_id', cascade='all, delete-orphan')
     
-    def to_dict(self, exclude_fields=None):
-        """转换为字典"""
+    # 复合索引：按保修结束日期范围筛选未删除资产
+    __table_args__ = (
+        db.Index('ix_it_asset_deleted_warranty', 'is_deleted', 'warranty_end_date'),
+    )
+    
+    def to_dict(self, exclude_fields=None, port_counts=None):
+        """转换为字典
+        
+        Args:
+            exclude_fields: 排除的字段
+            port_counts: 预先批量统计的(端口总数, 已连接端口数)，为None时逐条查询
+        """
         result = super().to_dict(exclude_fields)
         
         # 添加位置信息
@@ -98,10 +113,12 @@ class Asset(BaseModel):
         result['usage_days'] = self.get_usage_days()
         
         # 网络设备专用信息
-        if self.category in ['网络设备', '交换机', '路由器', '防火墙', '服务器']:
+        if self.category in self.PORT_STAT_CATEGORIES:
             result['is_network_device'] = True
             # 端口数量统计
-            if hasattr(self, 'device_ports'):
+            if port_counts is not None:
+                result['total_ports'], result['connected_ports'] = port_counts
+            elif hasattr(self, 'device_ports'):
                 result['total_ports'] = self.device_ports.filter_by(is_deleted=False).count()
                 result['connected_ports'] = self.device_ports.filter_by(is_deleted=False, is_connected=True).count()
         else:
@@ -109,6 +126,45 @@ class Asset(BaseModel):
         
         return result
     
+    @staticmethod
+    def location_load_options():
+        """列表查询时随资产一并加载楼宇/楼层/房间的选项"""
+        return (
+            joinedload(Asset.building),
+            joinedload(Asset.floor),
+            joinedload(Asset.room),
+        )
+    
+    @staticmethod
+    def get_port_counts(asset_ids):
+        """一次分组查询统计多个资产的(端口总数, 已连接端口数)"""
+        from app.models.network import DevicePort
+        
+        if not asset_ids:
+            return {}
+        rows = db.session.query(
+            DevicePort.device_id,
+            func.count(DevicePort.id),
+            func.sum(case((DevicePort.is_connected == True, 1), else_=0))
+        ).filter(
+            DevicePort.device_id.in_(asset_ids),
+            DevicePort.is_deleted == False
+        ).group_by(DevicePort.device_id).all()
+        return {device_id: (total, int(connected or 0)) for device_id, total, connected in rows}
+    
+    @classmethod
+    def to_dict_list(cls, assets, exclude_fields=None):
+        """批量转换为字典，端口统计合并为一次查询（位置关系应已通过location_load_options加载）"""
+        port_ids = [asset.id for asset in assets if asset.category in cls.PORT_STAT_CATEGORIES]
+        port_counts = cls.get_port_counts(port_ids)
+        return [
+            asset.to_dict(
+                exclude_fields,
+                port_counts=port_counts.get(asset.id, (0, 0)) if asset.category in cls.PORT_STAT_CATEGORIES else None
+            )
+            for asset in assets
+        ]
+    
     def get_full_location(self):
         """获取完整位置信息"""
         parts = []
@@ -152,6 +208,27 @@ class Asset(BaseModel):
         today = datetime.now().date()
         return (today - self.deploy_date).days
     
+    @classmethod
+    def warranty_filter(cls, warranty_status, days=30, today=None):
+        """保修状态对应的查询条件，与get_warranty_status/is_warranty_expiring的判定一致
+        
+        Args:
+            warranty_status: expiring(即将到期)/expired(已过保)/valid(保修中)
+            days: 即将到期的天数范围
+            today: 基准日期，默认为当天
+        
+        Returns:
+            warranty_end_date上的范围条件，未知状态返回None
+        """
+        today = today or datetime.now().date()
+        if warranty_status == 'expiring':
+            return cls.warranty_end_date.between(today, today + timedelta(days=days))
+        if warranty_status == 'expired':
+            return cls.warranty_end_date < today
+        if warranty_status == 'valid':
+            return cls.warranty_end_date >= today
+        return None
+    
     def is_warranty_expiring(self, days=30):
         """检查保修是否即将到期"""
         if not self.warranty_end_date:
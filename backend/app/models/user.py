@@ -1,11 +1,12 @@
 """
 用户和权限模型
 """
-from datetime import datetime
-from werkzeug.security import generate_password_hash, check_password_hash
+from datetime import datetime, timedelta
+from sqlalchemy.orm import validates
+from werkzeug.security import check_password_hash
 from app import db
 from app.models.base import BaseModel
-from app.utils.encryption import PartialEncryptedType, mask_sensitive_data
+from app.utils.encryption import PartialEncryptedType, mask_sensitive_data, blind_index
 
 
 # 用户角色关联表
@@ -29,8 +30,18 @@ class User(BaseModel):
     
     username = db.Column(db.String(50), unique=True, nullable=False, comment='用户名')
     password_hash = db.Column(db.String(128), nullable=False, comment='密码哈希')
-    email = db.Column(PartialEncryptedType, unique=True, nullable=True, comment='邮箱')
-    phone = db.Column(PartialEncryptedType, nullable=True, comment='手机号')
+    # 加密字段延迟加载，仅在访问时读取并解密（列表场景使用undefer_group('encrypted')批量加载）
+    # 密文不可比较，邮箱唯一性由未删除用户的盲索引唯一索引保证
+    email = db.deferred(db.Column(PartialEncryptedType, nullable=True, comment='邮箱'), group='encrypted')
+    email_bidx = db.Column(db.String(64), nullable=True, index=True, comment='邮箱盲索引')
+    email_active_bidx = db.Column(
+        db.String(64),
+        db.Computed("CASE WHEN is_deleted = 0 THEN email_bidx END"),
+        nullable=True,
+        comment='未删除用户的邮箱盲索引（软删除后为NULL，不参与唯一约束）'
+    )
+    phone = db.deferred(db.Column(PartialEncryptedType, nullable=True, comment='手机号'), group='encrypted')
+    phone_bidx = db.Column(db.String(64), nullable=True, index=True, comment='手机号盲索引')
     real_name = db.Column(db.String(50), nullable=True, comment='真实姓名')
     avatar = db.Column(db.String(255), nullable=True, comment='头像路径')
     status = db.Column(db.Integer, default=1, nullable=False, comment='状态：0-禁用，1-启用')
@@ -43,9 +54,43 @@ class User(BaseModel):
     # 关联关系
     roles = db.relationship('Role', secondary=user_roles, back_populates='users')
     
+    # 未删除用户邮箱唯一（软删除用户的email_active_bidx为NULL，可重新注册同一邮箱）
+    __table_args__ = (
+        db.Index('uq_sys_user_email_active_bidx', 'email_active_bidx', unique=True),
+    )
+    
+    @validates('email')
+    def _update_email_bidx(self, key, value):
+        """写入邮箱时同步维护盲索引"""
+        self.email_bidx = blind_index(value, 'email')
+        return value
+    
+    @validates('phone')
+    def _update_phone_bidx(self, key, value):
+        """写入手机号时同步维护盲索引"""
+        self.phone_bidx = blind_index(value, 'phone')
+        return value
+    
+    @classmethod
+    def find_by_email(cls, email, exclude_id=None):
+        """通过盲索引按邮箱查找用户"""
+        query = cls.query.filter_by(email_bidx=blind_index(email, 'email'), is_deleted=False)
+        if exclude_id:
+            query = query.filter(cls.id != exclude_id)
+        return query.first()
+    
+    @classmethod
+    def find_by_phone(cls, phone, exclude_id=None):
+        """通过盲索引按手机号查找用户"""
+        query = cls.query.filter_by(phone_bidx=blind_index(phone, 'phone'), is_deleted=False)
+        if exclude_id:
+            query = query.filter(cls.id != exclude_id)
+        return query.first()
+    
     def set_password(self, password):
         """设置密码"""
-        self.password_hash = generate_password_hash(password)
+        from app.utils.password_pool import password_pool
+        self.password_hash = password_pool.hash(password)
     
     def check_password(self, password):
         """验证密码"""
@@ -86,9 +131,9 @@ class User(BaseModel):
     def to_dict(self, exclude_fields=None, mask_sensitive=True):
         """转换为字典"""
         if exclude_fields is None:
-            exclude_fields = ['password_hash']
+            exclude_fields = ['password_hash', 'email_bidx', 'email_active_bidx', 'phone_bidx']
         else:
-            exclude_fields.append('password_hash')
+            exclude_fields.extend(['password_hash', 'email_bidx', 'email_active_bidx', 'phone_bidx'])
         
         result = super().to_dict(exclude_fields)
         result['roles'] = [role.to_dict() for role in self.roles]
@@ -159,4 +204,10 @@ class OperationLog(BaseModel):
     duration = db.Column(db.Integer, nullable=True, comment='执行时长(ms)')
     
     # 关联关系
-    user = db.relationship('User', backref=db.backref('operation_logs', lazy='dynamic'))
\ No newline at end of file
+    user = db.relationship('User', backref=db.backref('operation_logs', lazy='dynamic'))
+    
+    # 复合索引：按时间范围及按用户的时间范围查询
+    __table_args__ = (
+        db.Index('ix_operation_log_time', 'created_at'),
+        db.Index('ix_operation_log_user_time', 'user_id', 'created_at'),
+    )
\ No newline at end of file
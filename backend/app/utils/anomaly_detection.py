@@ -2,19 +2,25 @@
 异常行为检测系统
 实现智能的用户行为分析和异常检测，满足等保2.0入侵防范要求
 """
+import os
 import time
 import json
-import statistics
+import threading
 from datetime import datetime, timedelta
+from functools import wraps
 from typing import Dict, List, Optional, Tuple, Any
-from collections import defaultdict, deque
+from collections import defaultdict, OrderedDict
 from dataclasses import dataclass
 from enum import Enum
-from flask import current_app, g, request
-from sqlalchemy import and_, func, desc
+from flask import current_app, g, request, has_app_context
+from sqlalchemy import and_, func
+from app import db
+from app.models.base import BaseModel
 from app.models.user import User
 from app.utils.enhanced_audit import EnhancedAuditLog, AuditEventType, AuditSeverity, audit_logger
 from app.utils.helpers import get_client_ip
+from app.utils.shared_store import SlidingWindowCounter, get_shared_store
+from app.utils.ip_blocklist import ip_blocklist
 
 
 class AnomalyType(Enum):
@@ -53,70 +59,84 @@ class AnomalyEvent:
     risk_score: int  # 风险评分 0-100
 
 
+class UserBehaviorProfile(BaseModel):
+    """用户行为画像（由后台任务从审计日志增量汇总）"""
+    __tablename__ = 'user_behavior_profile'
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('sys_user.id'), nullable=False, unique=True, comment='用户ID')
+    login_hours = db.Column(db.Text, nullable=True, comment='登录小时分布(JSON，24个计数)')
+    ip_addresses = db.Column(db.Text, nullable=True, comment='常用IP(JSON，IP->最近时间戳)')
+    user_agents = db.Column(db.Text, nullable=True, comment='常用用户代理(JSON，UA->最近时间戳)')
+    endpoint_counts = db.Column(db.Text, nullable=True, comment='接口访问频率(JSON，接口->计数)')
+    event_count = db.Column(db.Integer, default=0, nullable=False, comment='累计事件数')
+    last_event_id = db.Column(db.Integer, default=0, nullable=False, comment='已汇总的最大审计日志ID')
+
+
+class ProfileWatermark(BaseModel):
+    """后台汇总任务水位线"""
+    __tablename__ = 'profile_watermark'
+    
+    name = db.Column(db.String(50), nullable=False, unique=True, comment='任务名称')
+    last_id = db.Column(db.Integer, default=0, nullable=False, comment='已处理的最大ID')
+    pending_ids = db.Column(db.Text, nullable=True, comment='水位线以下尚未出现的ID(JSON，ID->发现时间)')
+
+
+def _load_json(value, default):
+    if not value:
+        return default
+    try:
+        return json.loads(value)
+    except ValueError:
+        return default
+
+
+def _cap_by_value(items: Dict, max_size: int) -> Dict:
+    """保留值最大的max_size项"""
+    if len(items) <= max_size:
+        return items
+    return dict(sorted(items.items(), key=lambda kv: kv[1], reverse=True)[:max_size])
+
+
 class BehaviorProfile:
-    """用户行为画像"""
+    """用户行为画像（检测时使用的只读视图）"""
     
     def __init__(self, user_id: int):
         self.user_id = user_id
-        self.login_times = []  # 登录时间列表
-        self.ip_addresses = set()  # 常用IP地址
-        self.user_agents = set()  # 常用用户代理
-        self.api_call_patterns = defaultdict(list)  # API调用模式
-        self.access_frequency = defaultdict(int)  # 访问频率
+        self.login_hours = [0.0] * 24  # 登录小时分布
+        self.ip_addresses = {}  # 常用IP地址 -> 最近出现时间戳
+        self.user_agents = {}  # 常用用户代理 -> 最近出现时间戳
+        self.access_frequency = {}  # 访问频率
         self.last_updated = datetime.utcnow()
     
-    def update_from_logs(self, days: int = 30):
-        """从审计日志更新行为画像"""
-        try:
-            from app import db
-            start_time = datetime.utcnow() - timedelta(days=days)
-            
-            # 获取用户的审计日志
-            logs = db.session.query(EnhancedAuditLog).filter(
-                and_(
-                    EnhancedAuditLog.user_id == self.user_id,
-                    EnhancedAuditLog.event_timestamp >= start_time,
-                    EnhancedAuditLog.operation_result == 'SUCCESS'
-                )
-            ).order_by(desc(EnhancedAuditLog.event_timestamp)).limit(1000).all()
-            
-            # 分析登录时间模式
-            login_logs = [log for log in logs if log.event_type == AuditEventType.LOGIN_SUCCESS.value]
-            self.login_times = [log.event_timestamp.hour for log in login_logs]
-            
-            # 分析IP地址
-            self.ip_addresses = {log.client_ip for log in logs if log.client_ip}
-            
-            # 分析用户代理
-            self.user_agents = {log.user_agent for log in logs if log.user_agent}
-            
-            # 分析API调用模式
-            for log in logs:
-                if log.request_url:
-                    endpoint = log.request_url.split('?')[0]  # 移除查询参数
-                    hour = log.event_timestamp.hour
-                    self.api_call_patterns[endpoint].append(hour)
-            
-            # 计算访问频率
-            for log in logs:
-                if log.request_url:
-                    self.access_frequency[log.request_url.split('?')[0]] += 1
-            
-            self.last_updated = datetime.utcnow()
-            
-        except Exception as e:
-            current_app.logger.error(f"更新用户行为画像失败: {str(e)}")
+    @classmethod
+    def from_record(cls, user_id: int, record: Optional[UserBehaviorProfile]) -> 'BehaviorProfile':
+        """从画像表记录构建"""
+        profile = cls(user_id)
+        if record is not None:
+            profile.login_hours = _load_json(record.login_hours, [0.0] * 24)
+            profile.ip_addresses = _load_json(record.ip_addresses, {})
+            profile.user_agents = _load_json(record.user_agents, {})
+            profile.access_frequency = _load_json(record.endpoint_counts, {})
+        return profile
+    
+    @property
+    def login_times(self) -> List[int]:
+        """历史登录次数最多的小时（按次数降序）"""
+        return [hour for hour in sorted(range(24), key=lambda h: self.login_hours[h], reverse=True)
+                if self.login_hours[hour] > 0]
     
     def is_unusual_login_time(self, hour: int) -> Tuple[bool, float]:
         """检查是否为异常登录时间"""
-        if not self.login_times:
+        total = sum(self.login_hours)
+        if total <= 0:
             return False, 0.0
         
-        # 计算历史登录时间的统计信息
-        mean_hour = statistics.mean(self.login_times)
+        # 计算历史登录时间的统计信息（按小时分布加权）
+        mean_hour = sum(h * c for h, c in enumerate(self.login_hours)) / total
         
-        if len(self.login_times) > 1:
-            std_hour = statistics.stdev(self.login_times)
+        if total > 1:
+            variance = sum(c * (h - mean_hour) ** 2 for h, c in enumerate(self.login_hours)) / (total - 1)
+            std_hour = variance ** 0.5
         else:
             std_hour = 0
         
@@ -145,14 +165,213 @@ class BehaviorProfile:
         return user_agent not in self.user_agents
 
 
+class BehaviorProfileBuilder:
+    """行为画像后台汇总任务
+    
+    从水位线之后的审计日志增量更新画像表，多个工作进程通过共享存储互斥，同一时间只有一个进程执行
+    """
+    
+    WATERMARK_NAME = 'behavior_profile'
+    LOCK_KEY = 'anomaly:profile_builder:lock'
+    DECAY_HALF_LIFE_DAYS = 30  # 计数衰减半衰期，使画像偏向近期行为
+    
+    def __init__(self):
+        self.app = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self.stats = {'runs': 0, 'processed': 0, 'pending_ids': 0, 'last_run_ms': 0.0, 'last_error': None}
+    
+    def init_app(self, app):
+        """注册到应用，首个请求时按进程启动后台线程"""
+        self.app = app
+        if app.config.get('BEHAVIOR_PROFILE_BACKGROUND', True):
+            app.before_request(self._ensure_started)
+    
+    def _ensure_started(self):
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='behavior-profile-builder', daemon=True)
+            self._thread.start()
+    
+    def _run(self):
+        interval = self.app.config.get('BEHAVIOR_PROFILE_REFRESH_INTERVAL', 60)
+        while True:
+            time.sleep(interval)
+            try:
+                with self.app.app_context():
+                    if get_shared_store().add(self.LOCK_KEY, os.getpid(), ttl=max(interval - 1, 1)):
+                        self.run_once()
+            except Exception as e:
+                self.stats['last_error'] = str(e)
+                self.app.logger.error(f"行为画像汇总失败: {str(e)}")
+    
+    def run_once(self, batch_size: int = None, lag_seconds: int = None) -> int:
+        """处理水位线之后的审计日志，返回处理的记录数
+        
+        只处理事件时间早于当前时间lag_seconds的记录，以减少仍在批量写入中的较小ID；
+        ID在插入时分配、提交可能更晚，水位线越过的缺失ID会被记录下来，
+        后续轮次回查并补汇总，超过BEHAVIOR_PROFILE_GAP_TIMEOUT仍未出现的视为回滚丢弃
+        """
+        config = current_app.config
+        batch_size = batch_size or config.get('BEHAVIOR_PROFILE_BATCH_SIZE', 5000)
+        lag_seconds = lag_seconds if lag_seconds is not None else config.get('BEHAVIOR_PROFILE_LAG', 10)
+        gap_timeout = config.get('BEHAVIOR_PROFILE_GAP_TIMEOUT', 600)
+        max_gaps = config.get('BEHAVIOR_PROFILE_MAX_GAPS', 1000)
+        start = time.time()
+        
+        watermark = ProfileWatermark.query.filter_by(name=self.WATERMARK_NAME).first()
+        if watermark is None:
+            watermark = ProfileWatermark(name=self.WATERMARK_NAME, last_id=0)
+            db.session.add(watermark)
+            db.session.flush()
+        
+        columns = (
+            EnhancedAuditLog.id,
+            EnhancedAuditLog.user_id,
+            EnhancedAuditLog.event_type,
+            EnhancedAuditLog.event_timestamp,
+            EnhancedAuditLog.operation_result,
+            EnhancedAuditLog.client_ip,
+            EnhancedAuditLog.user_agent,
+            EnhancedAuditLog.request_url
+        )
+        
+        # 回查水位线以下迟提交的记录
+        pending = {
+            int(gap_id): seen_at
+            for gap_id, seen_at in _load_json(watermark.pending_ids, {}).items()
+            if start - seen_at < gap_timeout
+        }
+        processed = 0
+        if pending:
+            late_rows = db.session.query(*columns).filter(
+                EnhancedAuditLog.id.in_(list(pending))
+            ).order_by(EnhancedAuditLog.id).all()
+            if late_rows:
+                self._merge(late_rows)
+                for row in late_rows:
+                    pending.pop(row.id, None)
+                processed += len(late_rows)
+        
+        while True:
+            horizon = datetime.utcnow() - timedelta(seconds=lag_seconds)
+            rows = db.session.query(*columns).filter(
+                EnhancedAuditLog.id > watermark.last_id
+            ).order_by(EnhancedAuditLog.id).limit(batch_size).all()
+            
+            # 遇到尚未超过延迟的记录即停止，水位线不越过它
+            ready = []
+            for row in rows:
+                if row.event_timestamp > horizon:
+                    break
+                ready.append(row)
+            if not ready:
+                break
+            
+            # 记录被水位线越过的缺失ID
+            seen = {row.id for row in ready}
+            for gap_id in range(watermark.last_id + 1, ready[-1].id):
+                if len(pending) >= max_gaps:
+                    break
+                if gap_id not in seen:
+                    pending[gap_id] = start
+            
+            self._merge(ready)
+            watermark.last_id = ready[-1].id
+            watermark.pending_ids = json.dumps(pending)
+            db.session.commit()
+            processed += len(ready)
+            
+            if len(ready) < batch_size:
+                break
+        
+        watermark.pending_ids = json.dumps(pending)
+        db.session.commit()
+        self.stats['runs'] += 1
+        self.stats['processed'] += processed
+        self.stats['pending_ids'] = len(pending)
+        self.stats['last_run_ms'] = (time.time() - start) * 1000
+        return processed
+    
+    def _merge(self, rows):
+        """将一批审计日志合并到对应用户画像"""
+        config = current_app.config
+        max_ips = config.get('BEHAVIOR_PROFILE_MAX_IPS', 50)
+        max_agents = config.get('BEHAVIOR_PROFILE_MAX_USER_AGENTS', 20)
+        max_endpoints = config.get('BEHAVIOR_PROFILE_MAX_ENDPOINTS', 100)
+        
+        by_user = defaultdict(list)
+        for row in rows:
+            if row.user_id and row.operation_result == 'SUCCESS':
+                by_user[row.user_id].append(row)
+        if not by_user:
+            return
+        
+        records = {
+            record.user_id: record
+            for record in UserBehaviorProfile.query.filter(UserBehaviorProfile.user_id.in_(list(by_user)))
+        }
+        now = datetime.utcnow()
+        
+        for user_id, user_rows in by_user.items():
+            record = records.get(user_id)
+            if record is None:
+                record = UserBehaviorProfile(user_id=user_id, event_count=0, last_event_id=0)
+                db.session.add(record)
+            
+            login_hours = _load_json(record.login_hours, [0.0] * 24)
+            ip_addresses = _load_json(record.ip_addresses, {})
+            user_agents = _load_json(record.user_agents, {})
+            endpoint_counts = _load_json(record.endpoint_counts, {})
+            
+            # 按距上次更新的时间衰减历史计数
+            if record.updated_at:
+                elapsed_days = (now - record.updated_at).total_seconds() / 86400
+                decay = 0.5 ** (elapsed_days / self.DECAY_HALF_LIFE_DAYS)
+                login_hours = [c * decay for c in login_hours]
+                endpoint_counts = {k: v * decay for k, v in endpoint_counts.items()}
+            
+            for row in user_rows:
+                seen_at = row.event_timestamp.timestamp()
+                if row.event_type == AuditEventType.LOGIN_SUCCESS.value:
+                    login_hours[row.event_timestamp.hour] += 1
+                if row.client_ip:
+                    ip_addresses[row.client_ip] = max(ip_addresses.get(row.client_ip, 0), seen_at)
+                if row.user_agent:
+                    user_agents[row.user_agent] = max(user_agents.get(row.user_agent, 0), seen_at)
+                if row.request_url:
+                    endpoint = row.request_url.split('?')[0]  # 移除查询参数
+                    endpoint_counts[endpoint] = endpoint_counts.get(endpoint, 0) + 1
+            
+            record.login_hours = json.dumps([round(c, 3) for c in login_hours])
+            record.ip_addresses = json.dumps(_cap_by_value(ip_addresses, max_ips))
+            record.user_agents = json.dumps(_cap_by_value(user_agents, max_agents), ensure_ascii=False)
+            record.endpoint_counts = json.dumps(
+                {k: round(v, 3) for k, v in _cap_by_value(endpoint_counts, max_endpoints).items()},
+                ensure_ascii=False
+            )
+            record.event_count = (record.event_count or 0) + len(user_rows)
+            record.last_event_id = max(record.last_event_id or 0, user_rows[-1].id)
+            record.updated_at = now
+
+
+# 全局行为画像汇总任务
+behavior_profile_builder = BehaviorProfileBuilder()
+
+
 class AnomalyDetector:
     """异常检测器"""
     
-    def __init__(self):
-        self.behavior_profiles: Dict[int, BehaviorProfile] = {}
-        self.ip_request_counts = defaultdict(lambda: deque(maxlen=100))  # IP请求计数
-        self.failed_login_attempts = defaultdict(lambda: deque(maxlen=50))  # 失败登录尝试
-        self.api_call_history = defaultdict(lambda: deque(maxlen=200))  # API调用历史
+    def __init__(self, profile_cache_size: int = 1000):
+        # 进程内行为画像缓存（LRU）
+        self.behavior_profiles: "OrderedDict[int, BehaviorProfile]" = OrderedDict()
+        self.profile_cache_size = profile_cache_size
+        self._profile_lock = threading.Lock()
         
         # 检测阈值配置
         self.thresholds = {
@@ -164,36 +383,72 @@ class AnomalyDetector:
             'data_export_threshold': 10,    # 数据导出阈值
             'data_export_timeframe': 3600,  # 数据导出时间窗口（秒）
         }
+        
+        # 共享存储中的滑动窗口计数器（所有工作进程共享）
+        self.failed_login_attempts = SlidingWindowCounter(
+            'anomaly:failed_login', self.thresholds['brute_force_timeframe'])
+        self.api_call_history = SlidingWindowCounter(
+            'anomaly:api_calls', self.thresholds['rapid_api_timeframe'])
+        self.data_export_history = SlidingWindowCounter(
+            'anomaly:data_export', self.thresholds['data_export_timeframe'])
     
     def get_behavior_profile(self, user_id: int) -> BehaviorProfile:
-        """获取或创建用户行为画像"""
-        if user_id not in self.behavior_profiles:
-            profile = BehaviorProfile(user_id)
-            profile.update_from_logs()
-            self.behavior_profiles[user_id] = profile
+        """获取用户行为画像（读取后台汇总的画像表，按主键单行查询并在进程内缓存）"""
+        refresh_interval = 60
+        if has_app_context():
+            self.profile_cache_size = current_app.config.get('ANOMALY_PROFILE_CACHE_SIZE', self.profile_cache_size)
+            refresh_interval = current_app.config.get('BEHAVIOR_PROFILE_REFRESH_INTERVAL', refresh_interval)
+        
+        with self._profile_lock:
+            profile = self.behavior_profiles.get(user_id)
+            if profile is not None:
+                self.behavior_profiles.move_to_end(user_id)
         
-        # 定期更新画像
-        profile = self.behavior_profiles[user_id]
-        if (datetime.utcnow() - profile.last_updated).total_seconds() > 3600:  # 1小时更新一次
-            profile.update_from_logs()
+        if profile is not None and (datetime.utcnow() - profile.last_updated).total_seconds() < refresh_interval:
+            return profile
+        
+        record = UserBehaviorProfile.query.filter_by(user_id=user_id).first()
+        profile = BehaviorProfile.from_record(user_id, record)
+        with self._profile_lock:
+            self.behavior_profiles[user_id] = profile
+            self.behavior_profiles.move_to_end(user_id)
+            while len(self.behavior_profiles) > self.profile_cache_size:
+                self.behavior_profiles.popitem(last=False)
         
         return profile
     
+    def block_ip(self, ip: str, duration: int = 3600, reason: str = None, source: str = 'auto'):
+        """阻止IP或网段（持久化并同步到所有工作进程）"""
+        return ip_blocklist.add_rule(ip, action='block', duration=duration, reason=reason, source=source)
+    
+    def unblock_ip(self, ip: str) -> bool:
+        """解除IP或网段阻止"""
+        return ip_blocklist.remove_rule(ip, action='block')
+    
+    def is_ip_blocked(self, ip: str) -> bool:
+        """检查IP是否被阻止（进程内基数树最长前缀匹配）"""
+        try:
+            return ip_blocklist.is_blocked(ip)
+        except Exception as e:
+            current_app.logger.error(f"IP阻止列表检查失败: {str(e)}")
+            return False
+    
+    def get_blocked_ips(self) -> List[Dict[str, Any]]:
+        """获取当前生效的阻止规则"""
+        return [rule.to_dict() for rule in ip_blocklist.list_rules(action='block')]
+    
+    def mark_login_failure(self, ip: str, user_id: Optional[int] = None):
+        """记录登录失败并检测暴力破解"""
+        anomaly = self.detect_brute_force_attack(ip, user_id)
+        if anomaly:
+            self.handle_anomaly_events([anomaly])
+    
     def detect_brute_force_attack(self, ip: str, user_id: Optional[int] = None) -> Optional[AnomalyEvent]:
         """检测暴力破解攻击"""
-        current_time = time.time()
-        
-        # 记录失败登录尝试
-        self.failed_login_attempts[ip].append(current_time)
-        
-        # 清理过期记录
-        cutoff_time = current_time - self.thresholds['brute_force_timeframe']
-        while (self.failed_login_attempts[ip] and 
-               self.failed_login_attempts[ip][0] < cutoff_time):
-            self.failed_login_attempts[ip].popleft()
+        # 记录失败登录尝试并获取窗口内次数
+        attempt_count = self.failed_login_attempts.hit(ip)
         
         # 检查是否达到阈值
-        attempt_count = len(self.failed_login_attempts[ip])
         if attempt_count >= self.thresholds['brute_force_attempts']:
             confidence = min(attempt_count / self.thresholds['brute_force_attempts'], 1.0)
             
@@ -206,8 +461,7 @@ class AnomalyDetector:
                 confidence_score=confidence,
                 evidence={
                     'attempt_count': attempt_count,
-                    'timeframe': self.thresholds['brute_force_timeframe'],
-                    'recent_attempts': list(self.failed_login_attempts[ip])[-5:]
+                    'timeframe': self.thresholds['brute_force_timeframe']
                 },
                 timestamp=datetime.utcnow(),
                 risk_score=min(70 + attempt_count * 5, 100)
@@ -217,19 +471,10 @@ class AnomalyDetector:
     
     def detect_rapid_api_calls(self, ip: str, user_id: Optional[int] = None) -> Optional[AnomalyEvent]:
         """检测快速API调用"""
-        current_time = time.time()
-        
-        # 记录API调用
-        self.api_call_history[ip].append(current_time)
-        
-        # 清理过期记录
-        cutoff_time = current_time - self.thresholds['rapid_api_timeframe']
-        while (self.api_call_history[ip] and 
-               self.api_call_history[ip][0] < cutoff_time):
-            self.api_call_history[ip].popleft()
+        # 记录API调用并获取窗口内次数
+        call_count = self.api_call_history.hit(ip)
         
         # 检查调用频率
-        call_count = len(self.api_call_history[ip])
         if call_count >= self.thresholds['rapid_api_calls']:
             confidence = min(call_count / self.thresholds['rapid_api_calls'], 1.0)
             
@@ -267,7 +512,7 @@ class AnomalyDetector:
                     confidence_score=confidence,
                     evidence={
                         'login_hour': login_hour,
-                        'historical_hours': profile.login_times[-10:],  # 最近10次登录时间
+                        'historical_hours': profile.login_times[:10],  # 最常见的登录时间
                         'deviation': confidence
                     },
                     timestamp=datetime.utcnow(),
@@ -303,7 +548,7 @@ class AnomalyDetector:
                         confidence_score=0.8,
                         evidence={
                             'new_ip': ip,
-                            'known_ips': list(profile.ip_addresses)[-5:],  # 最近5个已知IP
+                            'known_ips': sorted(profile.ip_addresses, key=profile.ip_addresses.get)[-5:],  # 最近5个已知IP
                             'historical_count': recent_logs
                         },
                         timestamp=datetime.utcnow(),
@@ -317,19 +562,8 @@ class AnomalyDetector:
     def detect_data_exfiltration(self, user_id: int) -> Optional[AnomalyEvent]:
         """检测数据外泄行为"""
         try:
-            # 检查最近1小时的数据导出操作
-            start_time = datetime.utcnow() - timedelta(seconds=self.thresholds['data_export_timeframe'])
-            
-            export_events = db.session.query(EnhancedAuditLog).filter(
-                and_(
-                    EnhancedAuditLog.user_id == user_id,
-                    EnhancedAuditLog.event_timestamp >= start_time,
-                    or_(
-                        EnhancedAuditLog.event_type == AuditEventType.DATA_EXPORT.value,
-                        EnhancedAuditLog.event_type == AuditEventType.FILE_DOWNLOAD.value
-                    )
-                )
-            ).count()
+            # 记录本次导出并获取最近1小时的导出次数
+            export_events = self.data_export_history.hit(user_id)
             
             if export_events >= self.thresholds['data_export_threshold']:
                 confidence = min(export_events / self.thresholds['data_export_threshold'], 1.0)
@@ -499,10 +733,4 @@ def detect_anomalies():
 # 提供获取检测器实例的函数
 def get_anomaly_detector():
     """获取异常检测器实例"""
-    if not hasattr(get_anomaly_detector, '_instance'):
-        get_anomaly_detector._instance = AnomalyDetector()
-    return get_anomaly_detector._instance
-
-
-# 为了向后兼容，提供一个全局变量
-anomaly_detector = None
\ No newline at end of file
+    return anomaly_detector
\ No newline at end of file
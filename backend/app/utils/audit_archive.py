@@ -0,0 +1,348 @@
+"""
+审计日志分区与归档
+按月对审计/操作日志进行范围分区（MySQL），超过保留期的月份导出为gzip压缩的JSONL归档分片后
+删除已归档的记录，归档文件可通过 audit_archive_tool.py 离线查询
+"""
+import os
+import json
+import gzip
+from datetime import datetime, date
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from flask import current_app, has_app_context
+from sqlalchemy import text, inspect
+
+from app import db
+
+
+# 需要归档的表及其时间列
+ARCHIVE_TABLES = {
+    'enhanced_audit_log': 'event_timestamp',
+    'operation_log': 'created_at',
+}
+
+
+def month_start(value: datetime) -> datetime:
+    """取所在月份的第一天"""
+    return datetime(value.year, value.month, 1)
+
+
+def add_months(value: datetime, months: int) -> datetime:
+    """月份加减（结果为当月第一天）"""
+    index = value.year * 12 + value.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: datetime) -> str:
+    """月份分区名，如p202610"""
+    return month.strftime('p%Y%m')
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+
+class AuditArchiver:
+    """审计日志分区维护与保留期归档"""
+
+    def __init__(self, archive_dir: str = None, retention_months: int = None, batch_size: int = 1000):
+        self._archive_dir = archive_dir
+        self._retention_months = retention_months
+        self.batch_size = batch_size
+
+    def _config(self, key, default):
+        if has_app_context():
+            return current_app.config.get(key, default)
+        return default
+
+    @property
+    def archive_dir(self) -> str:
+        return self._archive_dir or self._config('AUDIT_ARCHIVE_DIR', 'archive/audit')
+
+    @property
+    def retention_months(self) -> int:
+        if self._retention_months is not None:
+            return self._retention_months
+        return self._config('AUDIT_RETENTION_MONTHS', 12)
+
+    @property
+    def is_mysql(self) -> bool:
+        return db.engine.dialect.name == 'mysql'
+
+    # ---------- 索引与分区维护 ----------
+
+    def ensure_indexes(self) -> List[str]:
+        """为已有数据库补建模型中声明的复合索引"""
+        created = []
+        inspector = inspect(db.engine)
+        for table in ARCHIVE_TABLES:
+            model_table = db.metadata.tables[table]
+            existing = {index['name'] for index in inspector.get_indexes(table)}
+            for index in model_table.indexes:
+                if index.name not in existing:
+                    index.create(bind=db.engine)
+                    created.append(index.name)
+        return created
+
+    def get_partitions(self, table: str) -> List[str]:
+        """获取表的分区名（非MySQL或未分区时返回空列表）"""
+        if not self.is_mysql:
+            return []
+        rows = db.session.execute(text(
+            "SELECT PARTITION_NAME FROM information_schema.PARTITIONS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table AND PARTITION_NAME IS NOT NULL "
+            "ORDER BY PARTITION_ORDINAL_POSITION"
+        ), {'table': table}).fetchall()
+        return [row[0] for row in rows]
+
+    def partition_table(self, table: str, months_ahead: int = None) -> bool:
+        """将表转换为按月RANGE COLUMNS分区
+
+        MySQL分区表不支持外键，且主键必须包含分区列，因此会删除该表的外键并将主键改为(id, 时间列)
+        """
+        if not self.is_mysql:
+            return False
+        if self.get_partitions(table):
+            return False
+
+        column = ARCHIVE_TABLES[table]
+        months_ahead = months_ahead if months_ahead is not None else self._config('AUDIT_PARTITION_MONTHS_AHEAD', 2)
+
+        foreign_keys = db.session.execute(text(
+            "SELECT CONSTRAINT_NAME FROM information_schema.TABLE_CONSTRAINTS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table AND CONSTRAINT_TYPE = 'FOREIGN KEY'"
+        ), {'table': table}).fetchall()
+        for (constraint_name,) in foreign_keys:
+            db.session.execute(text(f"ALTER TABLE {table} DROP FOREIGN KEY {constraint_name}"))
+
+        db.session.execute(text(f"ALTER TABLE {table} DROP PRIMARY KEY, ADD PRIMARY KEY (id, {column})"))
+
+        oldest = db.session.execute(text(f"SELECT MIN({column}) FROM {table}")).scalar()
+        month = month_start(oldest or datetime.utcnow())
+        last = add_months(datetime.utcnow(), months_ahead)
+        definitions = []
+        while month <= last:
+            upper = add_months(month, 1)
+            definitions.append(
+                f"PARTITION {partition_name(month)} VALUES LESS THAN ('{upper:%Y-%m-%d}')"
+            )
+            month = upper
+        definitions.append("PARTITION pmax VALUES LESS THAN (MAXVALUE)")
+
+        db.session.execute(text(
+            f"ALTER TABLE {table} PARTITION BY RANGE COLUMNS({column}) ({', '.join(definitions)})"
+        ))
+        db.session.commit()
+        return True
+
+    def ensure_partitions(self, table: str, months_ahead: int = None) -> List[str]:
+        """预先创建未来月份的分区（从pmax中拆分）"""
+        existing = self.get_partitions(table)
+        if not existing:
+            return []
+
+        months_ahead = months_ahead if months_ahead is not None else self._config('AUDIT_PARTITION_MONTHS_AHEAD', 2)
+        created = []
+        month = month_start(datetime.utcnow())
+        for _ in range(months_ahead + 1):
+            name = partition_name(month)
+            if name not in existing:
+                upper = add_months(month, 1)
+                db.session.execute(text(
+                    f"ALTER TABLE {table} REORGANIZE PARTITION pmax INTO ("
+                    f"PARTITION {name} VALUES LESS THAN ('{upper:%Y-%m-%d}'), "
+                    f"PARTITION pmax VALUES LESS THAN (MAXVALUE))"
+                ))
+                created.append(name)
+            month = add_months(month, 1)
+        db.session.commit()
+        return created
+
+    # ---------- 归档 ----------
+
+    def archive_path(self, table: str, month: datetime) -> str:
+        """新归档分片路径：同一月份每次导出写入独立分片，重复执行不会覆盖已有归档"""
+        suffix = f"{datetime.utcnow():%Y%m%d%H%M%S%f}-{os.getpid()}"
+        return os.path.join(self.archive_dir, table, f"{table}-{month:%Y-%m}.{suffix}.jsonl.gz")
+
+    def archive_parts(self, table: str, month: datetime) -> List[str]:
+        """某月已有的归档分片（含旧版单文件归档）"""
+        return [
+            os.path.join(self.archive_dir, table, filename)
+            for filename in _archive_files(self.archive_dir, table)
+            if _archive_month(table, filename) == month
+        ]
+
+    def _iter_archived_ids(self, paths: List[str]) -> Iterator[int]:
+        for path in paths:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                for line in f:
+                    yield int(json.loads(line)['id'])
+
+    def export_month(self, table: str, month: datetime) -> Tuple[int, Optional[str]]:
+        """将某月尚未归档的数据按主键分批导出为新的gzip JSONL分片
+
+        已存在于该月其他分片中的记录（如上次删除中途失败后重跑）不会重复导出。
+        返回 (导出行数, 分片路径)，无新数据时不生成分片
+        """
+        column = ARCHIVE_TABLES[table]
+        archived = set(self._iter_archived_ids(self.archive_parts(table, month)))
+        path = self.archive_path(table, month)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+
+        params = {'start': month, 'end': add_months(month, 1), 'last_id': 0, 'limit': self.batch_size}
+        count = 0
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+            while True:
+                result = db.session.execute(text(
+                    f"SELECT * FROM {table} WHERE {column} >= :start AND {column} < :end "
+                    f"AND id > :last_id ORDER BY id LIMIT :limit"
+                ), params)
+                rows = [dict(row._mapping) for row in result]
+                if not rows:
+                    break
+                for row in rows:
+                    if row['id'] in archived:
+                        continue
+                    f.write(json.dumps(row, ensure_ascii=False, default=_json_default))
+                    f.write('\n')
+                    count += 1
+                params['last_id'] = rows[-1]['id']
+
+        if not count:
+            os.remove(tmp_path)
+            return 0, None
+        os.replace(tmp_path, path)
+        return count, path
+
+    def purge_month(self, table: str, month: datetime) -> str:
+        """删除已归档月份的数据，只删除归档分片中存在的记录
+
+        导出后新写入（或延迟提交）的记录不会被删除，留待下次归档。
+        该月所有记录均已归档且存在对应分区时直接DROP PARTITION，否则按归档ID分批DELETE
+        """
+        column = ARCHIVE_TABLES[table]
+        parts = self.archive_parts(table, month)
+        if not parts:
+            return 'skip'
+        params = {'start': month, 'end': add_months(month, 1)}
+
+        name = partition_name(month)
+        if name in self.get_partitions(table):
+            archived = set(self._iter_archived_ids(parts))
+            remaining = db.session.execute(text(
+                f"SELECT id FROM {table} WHERE {column} >= :start AND {column} < :end"
+            ), params)
+            if all(row[0] in archived for row in remaining):
+                db.session.execute(text(f"ALTER TABLE {table} DROP PARTITION {name}"))
+                db.session.commit()
+                return 'drop_partition'
+
+        batch = []
+        for record_id in self._iter_archived_ids(parts):
+            batch.append(record_id)
+            if len(batch) >= self.batch_size:
+                self._delete_ids(table, column, batch, params)
+                batch = []
+        if batch:
+            self._delete_ids(table, column, batch, params)
+        return 'delete'
+
+    def _delete_ids(self, table: str, column: str, ids: List[int], params: Dict):
+        db.session.execute(text(
+            f"DELETE FROM {table} WHERE id IN ({', '.join(str(int(i)) for i in ids)}) "
+            f"AND {column} >= :start AND {column} < :end"
+        ), params)
+        db.session.commit()
+
+    def expired_months(self, table: str) -> List[datetime]:
+        """超过保留期的月份"""
+        column = ARCHIVE_TABLES[table]
+        cutoff = add_months(datetime.utcnow(), -self.retention_months)
+        oldest = db.session.execute(text(f"SELECT MIN({column}) FROM {table}")).scalar()
+        if oldest is None:
+            return []
+        if isinstance(oldest, str):
+            oldest = datetime.fromisoformat(oldest)
+
+        months = []
+        month = month_start(oldest)
+        while month < cutoff:
+            months.append(month)
+            month = add_months(month, 1)
+        return months
+
+    def run_retention(self, tables: List[str] = None) -> Dict[str, List[Dict]]:
+        """执行保留期任务：补齐未来分区，归档并删除过期月份"""
+        summary = {}
+        for table in tables or ARCHIVE_TABLES:
+            results = []
+            self.ensure_partitions(table)
+            for month in self.expired_months(table):
+                exported, path = self.export_month(table, month)
+                method = self.purge_month(table, month)
+                results.append({
+                    'month': f"{month:%Y-%m}",
+                    'rows': exported,
+                    'archive': path or os.path.join(self.archive_dir, table),
+                    'method': method
+                })
+            summary[table] = results
+        return summary
+
+
+def _archive_files(archive_dir: str, table: str) -> List[str]:
+    """表的归档文件名（按月份、分片顺序排列）"""
+    directory = os.path.join(archive_dir, table)
+    if not os.path.isdir(directory):
+        return []
+    return sorted(
+        filename for filename in os.listdir(directory)
+        if filename.startswith(f'{table}-') and filename.endswith('.jsonl.gz')
+    )
+
+
+def _archive_month(table: str, filename: str) -> datetime:
+    """从归档文件名解析月份：{table}-YYYY-MM[.分片].jsonl.gz"""
+    return datetime.strptime(filename[len(table) + 1:len(table) + 8], '%Y-%m')
+
+
+def iter_archive(archive_dir: str, table: str, start: datetime = None, end: datetime = None,
+                 filters: Optional[Dict] = None) -> Iterator[Dict]:
+    """遍历归档记录（只读取时间范围覆盖的月份文件）
+
+    Args:
+        archive_dir: 归档根目录
+        table: 表名
+        start: 起始时间（含）
+        end: 结束时间（不含）
+        filters: 字段等值过滤，如 {'user_id': 1, 'event_type': 'LOGIN_FAILED'}
+    """
+    column = ARCHIVE_TABLES[table]
+    directory = os.path.join(archive_dir, table)
+
+    for filename in _archive_files(archive_dir, table):
+        month = _archive_month(table, filename)
+        if end is not None and month >= end:
+            continue
+        if start is not None and add_months(month, 1) <= start:
+            continue
+
+        with gzip.open(os.path.join(directory, filename), 'rt', encoding='utf-8') as f:
+            for line in f:
+                record = json.loads(line)
+                timestamp = datetime.fromisoformat(record[column])
+                if start is not None and timestamp < start:
+                    continue
+                if end is not None and timestamp >= end:
+                    continue
+                if filters and any(str(record.get(k)) != str(v) for k, v in filters.items()):
+                    continue
+                yield record
+
+
+# 全局归档实例
+audit_archiver = AuditArchiver()
@@ -1,47 +1,130 @@
 """
 认证装饰器和权限检查
 """
+import reprlib
 import functools
 from datetime import datetime
 from flask import request, current_app, g
-from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
+from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity, get_jwt
 from app.models.user import User, OperationLog
 from app.utils.exceptions import AuthenticationError, AuthorizationError
 from app.utils.helpers import get_client_ip
-from app import db
+from app.utils.permission_cache import permission_cache, get_permission_set, permission_set_from_claims
+from app.utils.batch_writer import BatchWriter
+
+
+# 按请求缓存的数据保存在WSGI environ中（测试中应用上下文可能跨请求复用，g不一定按请求隔离）
+_AUTH_ENVIRON_KEY = 'itops.auth.user'
+_REQUEST_DATA_ENVIRON_KEY = 'itops.operation_log.request_data'
+
+
+class TokenUser:
+    """基于权限集（JWT权限快照或进程缓存）的轻量用户对象，访问其他属性时才加载数据库记录"""
+    
+    def __init__(self, user_id, username, permission_set):
+        self.id = user_id
+        self.username = username
+        self.permission_set = permission_set
+        self._user = None
+    
+    def has_permission(self, permission_code):
+        return self.permission_set.has_permission(permission_code)
+    
+    def has_role(self, role_name):
+        return self.permission_set.has_role(role_name)
+    
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        if self._user is None:
+            self._user = User.find_by_id(self.id)
+            if self._user is None:
+                raise AuthenticationError("用户不存在")
+        return getattr(self._user, name)
+
+
+def _authenticate_from_claims():
+    """使用JWT中的权限快照认证，版本号失效时返回None"""
+    claims = get_jwt()
+    user_id = get_jwt_identity()
+    if not user_id or 'perm_version' not in claims:
+        return None
+    
+    perm_set = permission_set_from_claims(user_id, claims)
+    if perm_set is None:
+        return None
+    
+    return _set_current_user(TokenUser(user_id, claims.get('username'), perm_set))
+
+
+def _set_current_user(user):
+    """保存当前请求的认证结果"""
+    request.environ[_AUTH_ENVIRON_KEY] = user
+    g.current_user = user
+    g.permission_set = user.permission_set
+    return user
+
+
+def _authenticate_request():
+    """认证当前请求，同一请求内只执行一次"""
+    user = request.environ.get(_AUTH_ENVIRON_KEY)
+    if user is not None:
+        g.current_user = user
+        return user
+    
+    verify_jwt_in_request()
+    
+    # 权限快照模式：版本号有效时无需访问数据库
+    if current_app.config.get('JWT_EMBED_PERMISSIONS', False):
+        user = _authenticate_from_claims()
+        if user is not None:
+            return user
+    
+    try:
+        # 获取当前用户ID
+        user_id = get_jwt_identity()
+        if not user_id:
+            raise AuthenticationError("无效的令牌")
+        
+        # 权限集缓存同时记录用户状态，命中时无需访问数据库
+        perm_set = permission_cache.get(user_id)
+        if perm_set is None:
+            raise AuthenticationError("用户不存在")
+        
+        # 检查用户状态
+        if not perm_set.is_active():
+            raise AuthenticationError("用户已被禁用或锁定")
+        
+        return _set_current_user(TokenUser(user_id, perm_set.username, perm_set))
+        
+    except Exception as e:
+        if isinstance(e, (AuthenticationError, AuthorizationError)):
+            raise e
+        else:
+            current_app.logger.error(f"认证装饰器异常: {str(e)}")
+            raise AuthenticationError("认证失败")
+
+
+def current_request_user():
+    """当前请求已认证的用户，未经过login_required时返回None"""
+    return request.environ.get(_AUTH_ENVIRON_KEY)
+
+
+def get_current_permissions():
+    """获取当前用户的权限集（按请求缓存）"""
+    perm_set = getattr(g, 'permission_set', None)
+    if perm_set is None:
+        perm_set = get_permission_set(g.current_user)
+        g.permission_set = perm_set
+    return perm_set
 
 
 def login_required(f):
     """登录验证装饰器"""
     @functools.wraps(f)
-    @jwt_required()
     def decorated_function(*args, **kwargs):
-        try:
-            # 获取当前用户ID
-            user_id = get_jwt_identity()
-            if not user_id:
-                raise AuthenticationError("无效的令牌")
-            
-            # 获取用户信息
-            user = User.find_by_id(user_id)
-            if not user:
-                raise AuthenticationError("用户不存在")
-            
-            # 检查用户状态
-            if not user.is_active():
-                raise AuthenticationError("用户已被禁用或锁定")
-            
-            # 将用户信息存储到g对象中
-            g.current_user = user
-            
-            return f(*args, **kwargs)
-            
-        except Exception as e:
-            if isinstance(e, (AuthenticationError, AuthorizationError)):
-                raise e
-            else:
-                current_app.logger.error(f"认证装饰器异常: {str(e)}")
-                raise AuthenticationError("认证失败")
+        _authenticate_request()
+        return f(*args, **kwargs)
     
     return decorated_function
 
@@ -55,7 +138,7 @@ def permission_required(permission_code: str):
             user = g.current_user
             
             # 检查用户是否有指定权限
-            if not user.has_permission(permission_code):
+            if not get_current_permissions().has_permission(permission_code):
                 current_app.logger.warning(
                     f"权限不足: 用户{user.username}尝试访问{permission_code}权限"
                 )
@@ -76,7 +159,7 @@ def role_required(role_name: str):
             user = g.current_user
             
             # 检查用户是否有指定角色
-            if not user.has_role(role_name):
+            if not get_current_permissions().has_role(role_name):
                 current_app.logger.warning(
                     f"角色不足: 用户{user.username}尝试访问{role_name}角色"
                 )
@@ -99,7 +182,7 @@ def admin_required(f):
 
 
 def log_operation(operation: str, auto_log: bool = True):
-    """操作日志装饰器"""
+    """操作日志装饰器（日志经批量写入器异步落库，不额外提交请求会话）"""
     def decorator(f):
         @functools.wraps(f)
         def decorated_function(*args, **kwargs):
@@ -111,56 +194,18 @@ def log_operation(operation: str, auto_log: bool = True):
                 
                 # 记录操作日志
                 if auto_log and hasattr(g, 'current_user'):
-                    end_time = datetime.now()
-                    duration = int((end_time - start_time).total_seconds() * 1000)
-                    
-                    log_entry = OperationLog(
-                        user_id=g.current_user.id,
-                        username=g.current_user.username,
-                        operation=operation,
-                        method=request.method,
-                        url=request.url,
-                        ip=get_client_ip(request),
-                        user_agent=request.headers.get('User-Agent'),
-                        request_data=_get_request_data(),
-                        status_code=200,
-                        duration=duration
-                    )
-                    
-                    try:
-                        db.session.add(log_entry)
-                        db.session.commit()
-                    except Exception as e:
-                        current_app.logger.error(f"记录操作日志失败: {str(e)}")
-                        db.session.rollback()
+                    _submit_operation_log(operation, start_time, status_code=200)
                 
                 return result
                 
             except Exception as e:
                 # 记录错误日志
                 if auto_log and hasattr(g, 'current_user'):
-                    end_time = datetime.now()
-                    duration = int((end_time - start_time).total_seconds() * 1000)
-                    
-                    log_entry = OperationLog(
-                        user_id=g.current_user.id,
-                        username=g.current_user.username,
-                        operation=f"{operation}(失败)",
-                        method=request.method,
-                        url=request.url,
-                        ip=get_client_ip(request),
-                        user_agent=request.headers.get('User-Agent'),
-                        request_data=_get_request_data(),
-                        response_data=str(e),
+                    _submit_operation_log(
+                        f"{operation}(失败)", start_time,
                         status_code=getattr(e, 'code', 500),
-                        duration=duration
+                        response_data=str(e)[:_request_data_limit()]
                     )
-                    
-                    try:
-                        db.session.add(log_entry)
-                        db.session.commit()
-                    except:
-                        db.session.rollback()
                 
                 raise e
         
@@ -168,25 +213,74 @@ def log_operation(operation: str, auto_log: bool = True):
     return decorator
 
 
+def _submit_operation_log(operation: str, start_time: datetime, status_code: int, response_data: str = None):
+    """构建操作日志并提交到批量写入队列"""
+    try:
+        end_time = datetime.now()
+        now = datetime.utcnow()
+        log_entry = OperationLog(
+            user_id=g.current_user.id,
+            username=g.current_user.username,
+            operation=operation[:100],
+            method=request.method,
+            url=request.url[:255],
+            ip=get_client_ip(request),
+            user_agent=request.headers.get('User-Agent'),
+            request_data=_get_request_data(),
+            response_data=response_data,
+            status_code=status_code,
+            duration=int((end_time - start_time).total_seconds() * 1000),
+            created_at=now,
+            updated_at=now,
+            is_deleted=False
+        )
+        operation_log_writer.submit_model(log_entry)
+    except Exception as e:
+        current_app.logger.error(f"记录操作日志失败: {str(e)}")
+
+
+def _request_data_limit() -> int:
+    return current_app.config.get('OPERATION_LOG_MAX_REQUEST_DATA', 2000)
+
+
+# 请求数据摘要：限制嵌套层数与容器元素数，避免对大批量导入数据做完整序列化
+_request_repr = reprlib.Repr()
+_request_repr.maxlevel = 3
+_request_repr.maxdict = 30
+_request_repr.maxlist = 10
+_request_repr.maxstring = 200
+_request_repr.maxother = 200
+
+
 def _get_request_data() -> str:
-    """获取请求数据"""
+    """获取请求数据（截断后的摘要，同一请求内只计算一次）"""
+    cached = request.environ.get(_REQUEST_DATA_ENVIRON_KEY)
+    if cached is not None:
+        return cached
+    
     try:
         if request.method in ['POST', 'PUT', 'PATCH']:
             if request.is_json:
-                data = request.get_json()
+                data = request.get_json(silent=True)
                 # 过滤敏感字段
                 if isinstance(data, dict):
                     sensitive_fields = ['password', 'password_hash', 'token', 'secret']
-                    filtered_data = {k: v for k, v in data.items() 
-                                   if k not in sensitive_fields}
-                    return str(filtered_data)
-                return str(data)
+                    data = {k: v for k, v in data.items()
+                            if k not in sensitive_fields}
             else:
-                return str(dict(request.form))
+                data = request.form.to_dict()
         else:
-            return str(dict(request.args))
-    except:
-        return ""
+            data = request.args.to_dict()
+        result = _request_repr.repr(data)[:_request_data_limit()]
+    except Exception:
+        result = ""
+    
+    request.environ[_REQUEST_DATA_ENVIRON_KEY] = result
+    return result
+
+
+# 操作日志批量写入器
+operation_log_writer = BatchWriter('operation_log', OperationLog.__table__, 'OPERATION_LOG')
 
 
 def validate_user_ownership(user_field: str = 'user_id'):
@@ -198,7 +292,7 @@ def validate_user_ownership(user_field: str = 'user_id'):
             user = g.current_user
             
             # 管理员跳过检查
-            if user.has_role('系统管理员'):
+            if get_current_permissions().has_role('系统管理员'):
                 return f(*args, **kwargs)
             
             # 从请求中获取资源的用户ID
@@ -0,0 +1,406 @@
+"""
+异步批量写入器
+请求线程只负责入队，后台线程按批量大小/时间间隔合并为批量INSERT，
+使用独立数据库连接写入，写入失败或队列溢出时落盘到溢出文件并在恢复后重放
+
+持久性说明：
+- 默认（{prefix}_DURABLE开启）记录先追加到本进程的预写日志段（fsync）再入队，
+  批次写入（或落盘）后删除对应日志段；崩溃进程遗留的日志段由其他进程接管重放，
+  保证至少写入一次（崩溃发生在写库与删除日志段之间时可能重复）；
+- 运维人员可关闭{prefix}_DURABLE换取更低的入队延迟，此时记录入队即返回，
+  进程崩溃（kill -9、OOM）时队列中尚未写入的记录会丢失，正常退出时由atexit写完队列
+溢出文件与预写日志均按进程（pid+启动时间）命名，各进程只追加自己的文件，
+只有确认所属进程已退出的文件才会被其他进程接管（os.replace原子认领）
+"""
+import os
+import glob
+import json
+import time
+import queue
+import atexit
+import logging
+import threading
+from datetime import datetime, date
+from typing import Dict, List, Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+def _encode_value(value):
+    """溢出文件序列化"""
+    if isinstance(value, datetime):
+        return {'__datetime__': value.isoformat()}
+    if isinstance(value, date):
+        return {'__date__': value.isoformat()}
+    return value
+
+
+def _decode_value(value):
+    """溢出文件反序列化"""
+    if isinstance(value, dict):
+        if '__datetime__' in value:
+            return datetime.fromisoformat(value['__datetime__'])
+        if '__date__' in value:
+            return date.fromisoformat(value['__date__'])
+    return value
+
+
+def _process_exited(pid: int) -> bool:
+    """进程是否已退出"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return True
+    except (PermissionError, OSError):
+        return False
+    return False
+
+
+class BatchWriter:
+    """基于内存队列的后台批量写入器"""
+
+    def __init__(self, name: str, table, config_prefix: str):
+        """
+        Args:
+            name: 写入器名称（用于日志和溢出文件名）
+            table: SQLAlchemy Table对象
+            config_prefix: 配置项前缀，如AUDIT对应AUDIT_BATCH_SIZE等
+        """
+        self.name = name
+        self.table = table
+        self.config_prefix = config_prefix
+        self.app = None
+
+        self.enabled = True
+        self.durable = True
+        self.batch_size = 200
+        self.flush_interval = 1.0
+        self.queue_size = 10000
+        self.spill_dir = 'logs/spill'
+
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._owner = None
+        self._generation = 0  # 当前预写日志段编号
+        self._journal_floor = 0  # 最小未删除的日志段编号
+        self._lock = threading.Lock()
+        self._journal_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._last_replay = 0.0
+        self._atexit_registered = False
+
+        self.stats = {
+            'enqueued': 0,
+            'written': 0,
+            'batches': 0,
+            'spilled': 0,
+            'replayed': 0,
+            'failed_batches': 0,
+            'last_batch_size': 0,
+            'last_flush_ms': 0.0,
+        }
+
+    def init_app(self, app):
+        """从应用配置初始化"""
+        self.app = app
+        prefix = self.config_prefix
+        self.enabled = app.config.get(f'{prefix}_ASYNC_WRITE', True)
+        self.durable = app.config.get(f'{prefix}_DURABLE', self.durable)
+        self.batch_size = app.config.get(f'{prefix}_BATCH_SIZE', self.batch_size)
+        self.flush_interval = app.config.get(f'{prefix}_FLUSH_INTERVAL', self.flush_interval)
+        self.queue_size = app.config.get(f'{prefix}_QUEUE_SIZE', self.queue_size)
+        self.spill_dir = app.config.get('BATCH_WRITER_SPILL_DIR', self.spill_dir)
+
+    # ---------- 进程与文件 ----------
+
+    def _bind_process(self) -> str:
+        """绑定当前进程（fork后重建队列与文件归属），返回进程标识"""
+        if self._pid == os.getpid():
+            return self._owner
+        with self._lock:
+            if self._pid != os.getpid():
+                self._queue = queue.Queue(maxsize=self.queue_size)
+                self._owner = f'{os.getpid()}-{int(time.time() * 1000)}'
+                self._generation = 0
+                self._journal_floor = 0
+                self._pid = os.getpid()
+        return self._owner
+
+    @property
+    def spill_path(self) -> str:
+        """本进程的溢出文件"""
+        return os.path.join(self.spill_dir, f'{self.name}.{self._bind_process()}.spill.jsonl')
+
+    def _journal_path(self, generation: int) -> str:
+        return os.path.join(self.spill_dir, f'{self.name}.{self._owner}.{generation}.wal.jsonl')
+
+    def _file_owner(self, path: str) -> str:
+        return os.path.basename(path)[len(self.name) + 1:].split('.', 1)[0]
+
+    def _is_orphan(self, owner: str) -> bool:
+        """文件所属进程是否已退出（同pid但启动时间不同视为已退出的旧进程）"""
+        if owner == self._owner:
+            return False
+        try:
+            pid = int(owner.split('-', 1)[0])
+        except ValueError:
+            return False
+        return pid == os.getpid() or _process_exited(pid)
+
+    def _pending_files(self) -> List[str]:
+        """待重放的文件：本进程溢出文件及已退出进程遗留的溢出/预写日志/重放文件"""
+        self._bind_process()
+        paths = []
+        for path in sorted(glob.glob(os.path.join(glob.escape(self.spill_dir), f'{glob.escape(self.name)}.*.jsonl'))):
+            owner = self._file_owner(path)
+            if owner == self._owner:
+                if path.endswith('.spill.jsonl'):
+                    paths.append(path)
+            elif self._is_orphan(owner):
+                paths.append(path)
+        return paths
+
+    def _append(self, path: str, rows: List[Dict]):
+        os.makedirs(self.spill_dir, exist_ok=True)
+        with open(path, 'a', encoding='utf-8') as f:
+            for row in rows:
+                f.write(json.dumps({k: _encode_value(v) for k, v in row.items()}, ensure_ascii=False))
+                f.write('\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    # ---------- 提交 ----------
+
+    def _ensure_started(self):
+        """按进程惰性启动后台线程（兼容gunicorn preload后fork），线程退出后重启时沿用原队列"""
+        self._bind_process()
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop_event.clear()
+            self._thread = threading.Thread(
+                target=self._run,
+                name=f'{self.name}-batch-writer',
+                daemon=True
+            )
+            self._thread.start()
+            if not self._atexit_registered:
+                atexit.register(self.shutdown)
+                self._atexit_registered = True
+
+    def submit(self, row: Dict):
+        """提交一行记录，队列已满时落盘"""
+        if not self.enabled or self.app is None:
+            self._flush([row])
+            return
+
+        self._ensure_started()
+        if not self.durable:
+            try:
+                self._queue.put_nowait((None, row))
+                self.stats['enqueued'] += 1
+            except queue.Full:
+                self._spill([row])
+            return
+
+        # 先写预写日志再入队，日志写入失败时退化为同步写入
+        with self._journal_lock:
+            generation = self._generation
+            try:
+                self._append(self._journal_path(generation), [row])
+            except OSError as e:
+                logger.error(f"{self.name}预写日志写入失败，改为同步写入: {str(e)}")
+                generation = None
+            if generation is not None:
+                try:
+                    self._queue.put_nowait((generation, row))
+                    self.stats['enqueued'] += 1
+                    return
+                except queue.Full:
+                    pass
+        if generation is None:
+            self._flush([row])
+        else:
+            self._spill([row])
+
+    def submit_model(self, obj):
+        """提交一个未持久化的模型对象（不含自增主键）"""
+        self.submit({
+            column.name: getattr(obj, column.key)
+            for column in obj.__table__.columns
+            if column.name != 'id'
+        })
+
+    def queue_depth(self) -> int:
+        """当前队列深度"""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def get_stats(self) -> Dict:
+        """获取写入器统计（用于背压监控）"""
+        stats = dict(self.stats)
+        stats['queue_depth'] = self.queue_depth()
+        stats['queue_capacity'] = self.queue_size
+        stats['durable'] = self.durable
+        stats['spill_pending'] = bool(self._pending_files())
+        return stats
+
+    # ---------- 后台写入 ----------
+
+    def _run(self):
+        """后台写入循环"""
+        while not self._stop_event.is_set():
+            items = self._collect_batch()
+            if items:
+                self._flush([row for _, row in items])
+                self._release_journal(items[-1][0])
+            if time.time() - self._last_replay > 30:
+                self._replay_spill()
+
+    def _collect_batch(self) -> List[tuple]:
+        """收集一批记录：达到批量大小或超过刷新间隔即返回"""
+        batch = []
+        deadline = time.time() + self.flush_interval
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _release_journal(self, generation: Optional[int]):
+        """删除已处理完的预写日志段
+
+        队列先进先出，批次最后一条属于第N段时，N之前的段均已写入或落盘；
+        队列已清空时当前段也已处理完。批次到达当前段时轮换新段，使其可在下一批次后删除
+        """
+        if generation is None:
+            return
+        with self._journal_lock:
+            if self._queue.empty():
+                obsolete = self._generation
+                self._generation += 1
+            else:
+                obsolete = generation - 1
+                if generation == self._generation:
+                    self._generation += 1
+            for number in range(self._journal_floor, obsolete + 1):
+                try:
+                    os.remove(self._journal_path(number))
+                except OSError:
+                    pass
+            self._journal_floor = max(self._journal_floor, obsolete + 1)
+
+    def _flush(self, batch: List[Dict]):
+        """写入一批记录，失败时落盘"""
+        start = time.time()
+        try:
+            self._write_batch(batch)
+            self.stats['batches'] += 1
+            self.stats['last_batch_size'] = len(batch)
+        except Exception as e:
+            self.stats['failed_batches'] += 1
+            logger.error(f"{self.name}批量写入失败，已落盘: {str(e)}")
+            self._spill(batch)
+        finally:
+            self.stats['last_flush_ms'] = (time.time() - start) * 1000
+
+    def _write_batch(self, rows: List[Dict]):
+        """使用独立连接执行批量INSERT"""
+        from app import db
+
+        if not rows:
+            return
+        if self.app is not None:
+            with self.app.app_context():
+                with db.engine.begin() as conn:
+                    conn.execute(self.table.insert(), rows)
+        else:
+            with db.engine.begin() as conn:
+                conn.execute(self.table.insert(), rows)
+        self.stats['written'] += len(rows)
+
+    def _spill(self, rows: List[Dict]):
+        """追加写入本进程的溢出文件"""
+        try:
+            path = self.spill_path
+            with self._lock:
+                self._append(path, rows)
+            self.stats['spilled'] += len(rows)
+        except Exception as e:
+            logger.error(f"{self.name}溢出文件写入失败，丢弃{len(rows)}条记录: {str(e)}")
+
+    def _replay_spill(self):
+        """重放本进程溢出文件及已退出进程遗留的文件"""
+        self._last_replay = time.time()
+        for path in self._pending_files():
+            self._replay_file(path)
+
+    def _replay_file(self, path: str):
+        """认领并重放单个文件（改名为本进程的重放文件，其他进程不会再认领）"""
+        replay_path = os.path.join(
+            self.spill_dir, f'{self.name}.{self._owner}.{int(time.time() * 1000)}.replay.jsonl'
+        )
+        try:
+            with self._lock:
+                os.replace(path, replay_path)
+        except OSError:
+            # 已被其他进程认领
+            return
+
+        rows = []
+        with open(replay_path, encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    try:
+                        rows.append({k: _decode_value(v) for k, v in json.loads(line).items()})
+                    except ValueError:
+                        continue
+
+        done = 0
+        try:
+            while done < len(rows):
+                chunk = rows[done:done + self.batch_size]
+                self._write_batch(chunk)
+                done += len(chunk)
+                self.stats['replayed'] += len(chunk)
+        except Exception as e:
+            logger.error(f"{self.name}溢出文件重放失败: {str(e)}")
+            # 未写入的记录重新落盘，下次重放
+            self._spill(rows[done:])
+        os.remove(replay_path)
+
+    def flush_now(self):
+        """同步刷新队列中已有记录（用于测试与关闭）"""
+        if self._queue is None:
+            return
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+            if len(batch) >= self.batch_size:
+                self._flush([row for _, row in batch])
+                self._release_journal(batch[-1][0])
+                batch = []
+        if batch:
+            self._flush([row for _, row in batch])
+            self._release_journal(batch[-1][0])
+
+    def shutdown(self):
+        """进程退出时尽量写完队列，无法写入则落盘"""
+        if self._pid != os.getpid():
+            return
+        self._stop_event.set()
+        try:
+            self.flush_now()
+        except Exception as e:
+            logger.error(f"{self.name}关闭时刷新失败: {str(e)}")
@@ -3,7 +3,12 @@
 实现敏感数据的加密存储和解密读取
 """
 import os
+import re
+import hmac
 import base64
+import hashlib
+import threading
+from collections import OrderedDict
 from typing import Optional, Union
 from cryptography.fernet import Fernet
 from cryptography.hazmat.primitives import hashes
@@ -17,6 +22,7 @@ class DataEncryption:
     
     _instance = None
     _fernet = None
+    _decrypt_cache = None
     
     def __new__(cls):
         if cls._instance is None:
@@ -49,6 +55,13 @@ class DataEncryption:
                 encryption_key = key.decode()
         
         self._fernet = Fernet(encryption_key.encode() if isinstance(encryption_key, str) else encryption_key)
+        
+        # 密文->明文的有界LRU缓存，避免重复的AES解密
+        self._decrypt_cache = OrderedDict()
+        self._decrypt_cache_size = int(os.environ.get('DECRYPT_CACHE_SIZE', '4096'))
+        self._decrypt_lock = threading.Lock()
+        self.decrypt_hits = 0
+        self.decrypt_misses = 0
     
     def encrypt(self, data: str) -> str:
         """加密数据"""
@@ -63,17 +76,44 @@ class DataEncryption:
             raise e
     
     def decrypt(self, encrypted_data: str) -> str:
-        """解密数据"""
+        """解密数据（带LRU缓存）"""
         if not encrypted_data:
             return encrypted_data
         
+        with self._decrypt_lock:
+            plaintext = self._decrypt_cache.get(encrypted_data)
+            if plaintext is not None:
+                self._decrypt_cache.move_to_end(encrypted_data)
+                self.decrypt_hits += 1
+                return plaintext
+            self.decrypt_misses += 1
+        
         try:
             decoded_data = base64.urlsafe_b64decode(encrypted_data.encode('utf-8'))
             decrypted_data = self._fernet.decrypt(decoded_data)
-            return decrypted_data.decode('utf-8')
+            plaintext = decrypted_data.decode('utf-8')
         except Exception as e:
             current_app.logger.error(f"数据解密失败: {str(e)}")
             raise e
+        
+        if self._decrypt_cache_size > 0:
+            with self._decrypt_lock:
+                self._decrypt_cache[encrypted_data] = plaintext
+                while len(self._decrypt_cache) > self._decrypt_cache_size:
+                    self._decrypt_cache.popitem(last=False)
+        
+        return plaintext
+    
+    def get_cache_stats(self) -> dict:
+        """获取解密缓存统计"""
+        total = self.decrypt_hits + self.decrypt_misses
+        return {
+            'size': len(self._decrypt_cache),
+            'max_size': self._decrypt_cache_size,
+            'hits': self.decrypt_hits,
+            'misses': self.decrypt_misses,
+            'hit_ratio': (self.decrypt_hits / total) if total else 0.0
+        }
     
     @staticmethod
     def generate_key() -> str:
@@ -140,6 +180,60 @@ class PartialEncryptedType(TypeDecorator):
         return value
 
 
+class BlindIndex:
+    """盲索引生成器（带密钥的HMAC-SHA256），用于加密字段的等值查询"""
+    
+    _key = None
+    
+    @classmethod
+    def _get_key(cls) -> bytes:
+        """获取盲索引密钥"""
+        if cls._key is None:
+            key = os.environ.get('BLIND_INDEX_KEY')
+            if not key:
+                # 未单独配置时从数据加密密钥派生，保证与密文使用不同密钥
+                base_key = os.environ.get('DATA_ENCRYPTION_KEY')
+                if not base_key:
+                    if os.environ.get('FLASK_ENV') == 'production':
+                        raise RuntimeError("生产环境必须设置BLIND_INDEX_KEY或DATA_ENCRYPTION_KEY环境变量")
+                    base_key = "dev-encryption-key-change-in-production"
+                key = hmac.new(base_key.encode(), b"blind-index", hashlib.sha256).hexdigest()
+            cls._key = key.encode() if isinstance(key, str) else key
+        return cls._key
+    
+    @staticmethod
+    def normalize(value: str, field: str) -> str:
+        """规范化字段值，保证等值匹配不受大小写和分隔符影响"""
+        value = str(value).strip()
+        if field == 'email':
+            return value.lower()
+        if field == 'phone':
+            return re.sub(r'[\s\-()]', '', value)
+        return value
+    
+    @classmethod
+    def compute(cls, value: Optional[str], field: str) -> Optional[str]:
+        """
+        计算盲索引
+        
+        Args:
+            value: 明文值
+            field: 字段名（参与HMAC计算，不同字段的相同值索引不同）
+        
+        Returns:
+            64位十六进制索引值，空值返回None
+        """
+        if not value:
+            return None
+        message = f"{field}:{cls.normalize(value, field)}".encode('utf-8')
+        return hmac.new(cls._get_key(), message, hashlib.sha256).hexdigest()
+
+
+def blind_index(value: Optional[str], field: str) -> Optional[str]:
+    """计算加密字段的盲索引"""
+    return BlindIndex.compute(value, field)
+
+
 def mask_sensitive_data(data: str, mask_char: str = '*', visible_start: int = 3, visible_end: int = 3) -> str:
     """
     掩码敏感数据显示
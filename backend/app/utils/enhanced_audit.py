@@ -4,15 +4,19 @@
 """
 import json
 import time
+import base64
 import hashlib
 from datetime import datetime, timedelta
 from typing import Dict, Any, Optional, List
 from enum import Enum
 from flask import request, g, current_app
-from sqlalchemy import and_, or_, func
+from sqlalchemy import and_, or_, func, text
 from app import db
 from app.models.base import BaseModel
 from app.utils.helpers import get_client_ip
+from app.utils.permission_cache import get_permission_set
+from app.utils.batch_writer import BatchWriter
+from app.utils.shared_store import get_shared_store, SlidingWindowCounter
 
 
 class AuditEventType(Enum):
@@ -52,6 +56,10 @@ class AuditEventType(Enum):
     SUSPICIOUS_ACTIVITY = "SUSPICIOUS_ACTIVITY"
     ACCESS_DENIED = "ACCESS_DENIED"
     RATE_LIMIT_EXCEEDED = "RATE_LIMIT_EXCEEDED"
+    UNAUTHORIZED_ACCESS = "UNAUTHORIZED_ACCESS"
+    
+    # 系统事件
+    SYSTEM_ERROR = "SYSTEM_ERROR"
 
 
 class AuditSeverity(Enum):
@@ -112,6 +120,16 @@ class EnhancedAuditLog(BaseModel):
     # 数据完整性
     checksum = db.Column(db.String(64), nullable=True, comment='数据校验和')
     
+    # 复合索引：匹配仪表板按时间范围统计及异常检测按用户/IP/事件类型的时间范围查询
+    __table_args__ = (
+        db.Index('ix_audit_time_id', 'event_timestamp', 'id'),
+        db.Index('ix_audit_time_category', 'event_timestamp', 'event_category'),
+        db.Index('ix_audit_severity_time', 'severity', 'event_timestamp'),
+        db.Index('ix_audit_user_time', 'user_id', 'event_timestamp'),
+        db.Index('ix_audit_ip_time', 'client_ip', 'event_timestamp'),
+        db.Index('ix_audit_type_time', 'event_type', 'event_timestamp'),
+    )
+    
     def calculate_checksum(self):
         """计算数据校验和"""
         data = f"{self.event_type}{self.user_id}{self.event_timestamp}{self.operation_description}"
@@ -158,6 +176,59 @@ class EnhancedAuditLog(BaseModel):
         return result
 
 
+# 审计日志批量写入器
+audit_writer = BatchWriter('audit', EnhancedAuditLog.__table__, 'AUDIT')
+
+
+class RiskState:
+    """风险评分的增量状态（共享存储）
+    
+    - 登录失败计数：按分钟分桶的滑动窗口计数器
+    - 常用IP：按最近成功时间排序的有界集合，超过保留期视为陌生IP
+    """
+    
+    KNOWN_IP_KEY = 'risk:known_ips:{}'
+    
+    def _config(self, key, default):
+        return current_app.config.get(key, default)
+    
+    @property
+    def failures(self) -> SlidingWindowCounter:
+        return SlidingWindowCounter(
+            'risk:login_failed', self._config('RISK_FAILURE_WINDOW', 300), bucket_seconds=60
+        )
+    
+    def record_failure(self, user_id: int):
+        """记录一次登录失败"""
+        self.failures.hit(user_id)
+    
+    def recent_failures(self, user_id: int) -> int:
+        """滑动窗口内的登录失败次数"""
+        return self.failures.count(user_id)
+    
+    def record_known_ip(self, user_id: int, client_ip: str):
+        """记录用户成功操作使用的IP"""
+        ttl = self._config('RISK_KNOWN_IP_TTL', 30 * 86400)
+        get_shared_store().zadd_capped(
+            self.KNOWN_IP_KEY.format(user_id), client_ip, time.time(),
+            max_size=self._config('RISK_KNOWN_IP_MAX', 20), ttl=ttl
+        )
+    
+    def is_unfamiliar_ip(self, user_id: int, client_ip: str) -> bool:
+        """用户已有常用IP且当前IP不在其中（或已超过保留期）"""
+        store = get_shared_store()
+        key = self.KNOWN_IP_KEY.format(user_id)
+        last_seen = store.zscore(key, client_ip)
+        ttl = self._config('RISK_KNOWN_IP_TTL', 30 * 86400)
+        if last_seen is not None and float(last_seen) > time.time() - ttl:
+            return False
+        return store.zcard(key) > 0
+
+
+# 全局风险状态
+risk_state = RiskState()
+
+
 class AuditLogger:
     """审计日志记录器"""
     
@@ -179,10 +250,15 @@ class AuditLogger:
                   new_values: Dict = None,
                   error_message: str = None,
                   processing_time: int = None,
-                  additional_context: Dict = None) -> EnhancedAuditLog:
+                  additional_context: Dict = None,
+                  ip_address: str = None,
+                  user_agent: str = None) -> EnhancedAuditLog:
         """
         记录审计事件
         
+        记录通过后台批量写入器异步落库，不占用请求会话的事务；
+        返回的审计对象为未持久化的临时对象（id为空）
+        
         Args:
             event_type: 事件类型
             severity: 严重程度
@@ -194,6 +270,8 @@ class AuditLogger:
             error_message: 错误信息
             processing_time: 处理时间
             additional_context: 额外上下文
+            ip_address: 客户端IP（默认从请求获取）
+            user_agent: 用户代理（默认从请求获取）
             
         Returns:
             审计日志记录
@@ -207,13 +285,13 @@ class AuditLogger:
             if hasattr(g, 'current_user') and g.current_user:
                 user_id = g.current_user.id
                 username = g.current_user.username
-                user_role = ','.join([role.name for role in g.current_user.roles])
+                user_role = ','.join(sorted(get_permission_set(g.current_user).roles))
             
             # 获取请求信息
             request_method = request.method if request else None
             request_url = request.url if request else None
-            client_ip = get_client_ip(request) if request else None
-            user_agent = request.headers.get('User-Agent') if request else None
+            client_ip = ip_address or (get_client_ip(request) if request else None)
+            user_agent = user_agent or (request.headers.get('User-Agent') if request else None)
             referer = request.headers.get('Referer') if request else None
             
             # 获取请求参数（安全处理）
@@ -251,7 +329,8 @@ class AuditLogger:
                 event_type, user_id, client_ip, severity
             )
             
-            # 创建审计日志记录
+            # 创建审计日志记录（显式填充默认值，批量INSERT不经过ORM默认值处理）
+            now = datetime.utcnow()
             audit_log = EnhancedAuditLog(
                 event_type=event_type.value,
                 severity=severity.value,
@@ -276,15 +355,21 @@ class AuditLogger:
                 processing_time=processing_time,
                 session_id=request.cookies.get('session_id') if request else None,
                 risk_score=risk_score,
-                security_context=json.dumps(additional_context, ensure_ascii=False) if additional_context else None
+                security_context=json.dumps(additional_context, ensure_ascii=False) if additional_context else None,
+                event_timestamp=now,
+                created_at=now,
+                updated_at=now,
+                is_deleted=False
             )
             
             # 计算校验和
             audit_log.checksum = audit_log.calculate_checksum()
             
-            # 保存到数据库
-            db.session.add(audit_log)
-            db.session.commit()
+            # 提交到批量写入队列
+            audit_writer.submit_model(audit_log)
+            
+            # 更新风险评分增量状态
+            self._update_risk_state(event_type, user_id, client_ip, operation_result)
             
             # 高风险事件告警
             if risk_score >= 70 or severity == AuditSeverity.CRITICAL:
@@ -294,7 +379,6 @@ class AuditLogger:
             
         except Exception as e:
             current_app.logger.error(f"审计日志记录失败: {str(e)}")
-            db.session.rollback()
             return None
     
     def _get_event_category(self, event_type: AuditEventType) -> str:
@@ -329,6 +413,9 @@ class AuditLogger:
             AuditEventType.SUSPICIOUS_ACTIVITY: "SECURITY_EVENT",
             AuditEventType.ACCESS_DENIED: "SECURITY_EVENT",
             AuditEventType.RATE_LIMIT_EXCEEDED: "SECURITY_EVENT",
+            AuditEventType.UNAUTHORIZED_ACCESS: "SECURITY_EVENT",
+            
+            AuditEventType.SYSTEM_ERROR: "SYSTEM_EVENT",
         }
         
         return category_mapping.get(event_type, "OTHER")
@@ -359,31 +446,14 @@ class AuditLogger:
         base_score += event_scores.get(event_type, 0)
         
         try:
-            # 检查历史模式
+            # 检查历史模式（共享存储中的增量状态，O(1)）
             if user_id and client_ip:
                 # 检查最近的失败登录
-                recent_failures = db.session.query(EnhancedAuditLog).filter(
-                    and_(
-                        EnhancedAuditLog.user_id == user_id,
-                        EnhancedAuditLog.event_type == AuditEventType.LOGIN_FAILED.value,
-                        EnhancedAuditLog.event_timestamp > datetime.utcnow() - timedelta(minutes=5)
-                    )
-                ).count()
-                
-                if recent_failures >= 3:
+                if risk_state.recent_failures(user_id) >= 3:
                     base_score += 30
                 
                 # 检查异常IP访问
-                normal_ips = db.session.query(EnhancedAuditLog.client_ip).filter(
-                    and_(
-                        EnhancedAuditLog.user_id == user_id,
-                        EnhancedAuditLog.operation_result == 'SUCCESS',
-                        EnhancedAuditLog.event_timestamp > datetime.utcnow() - timedelta(days=30)
-                    )
-                ).distinct().all()
-                
-                normal_ip_list = [ip[0] for ip in normal_ips if ip[0]]
-                if client_ip not in normal_ip_list and len(normal_ip_list) > 0:
+                if risk_state.is_unfamiliar_ip(user_id, client_ip):
                     base_score += 25
                     
         except Exception as e:
@@ -391,6 +461,19 @@ class AuditLogger:
         
         return min(base_score, 100)  # 限制最高分为100
     
+    def _update_risk_state(self, event_type: AuditEventType, user_id: int,
+                           client_ip: str, operation_result: str):
+        """事件写入时维护失败计数与常用IP集合"""
+        if not user_id:
+            return
+        try:
+            if event_type == AuditEventType.LOGIN_FAILED:
+                risk_state.record_failure(user_id)
+            elif operation_result == 'SUCCESS' and client_ip:
+                risk_state.record_known_ip(user_id, client_ip)
+        except Exception as e:
+            current_app.logger.warning(f"风险状态更新异常: {str(e)}")
+    
     def _trigger_security_alert(self, audit_log: EnhancedAuditLog):
         """触发安全告警"""
         try:
@@ -446,5 +529,102 @@ class AuditLogger:
             return {'error': str(e)}
 
 
+    @staticmethod
+    def encode_cursor(audit_log: EnhancedAuditLog) -> str:
+        """生成游标：(event_timestamp, id)"""
+        raw = f"{audit_log.event_timestamp.isoformat()}|{audit_log.id}"
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+    
+    @staticmethod
+    def decode_cursor(cursor: str):
+        """解析游标，返回(event_timestamp, id)"""
+        try:
+            raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+            timestamp, log_id = raw.rsplit('|', 1)
+            return datetime.fromisoformat(timestamp), int(log_id)
+        except (ValueError, UnicodeDecodeError):
+            raise ValueError("无效的分页游标")
+    
+    def query_logs(self,
+                   page_size: int = 50,
+                   cursor: str = None,
+                   event_type: str = None,
+                   severity: str = None,
+                   user_id: int = None,
+                   start_time: datetime = None,
+                   end_time: datetime = None,
+                   count: str = 'none',
+                   page: int = None) -> Dict[str, Any]:
+        """
+        按(event_timestamp, id)倒序的游标分页查询审计日志
+        
+        Args:
+            page_size: 每页条数
+            cursor: 上一页返回的next_cursor，为空时从最新记录开始
+            event_type/severity/user_id: 等值过滤（均有对应的(列, event_timestamp)复合索引）
+            start_time/end_time: 时间范围 [start_time, end_time)
+            count: 总数统计方式：none-不统计，exact-精确COUNT，estimate-无过滤条件时使用表统计信息估算
+            page: 兼容旧的页码分页（仅在未提供cursor时生效，深分页代价随页码增长）
+            
+        Returns:
+            {'items', 'next_cursor', 'has_more', 'total'}
+        """
+        query = EnhancedAuditLog.query
+        filtered = False
+        if event_type:
+            query = query.filter(EnhancedAuditLog.event_type == event_type)
+            filtered = True
+        if severity:
+            query = query.filter(EnhancedAuditLog.severity == severity)
+            filtered = True
+        if user_id:
+            query = query.filter(EnhancedAuditLog.user_id == user_id)
+            filtered = True
+        if start_time:
+            query = query.filter(EnhancedAuditLog.event_timestamp >= start_time)
+            filtered = True
+        if end_time:
+            query = query.filter(EnhancedAuditLog.event_timestamp < end_time)
+            filtered = True
+        
+        total = None
+        if count == 'exact':
+            total = query.order_by(None).count()
+        elif count == 'estimate':
+            total = self._estimate_total() if not filtered else None
+        
+        if cursor:
+            cursor_time, cursor_id = self.decode_cursor(cursor)
+            query = query.filter(or_(
+                EnhancedAuditLog.event_timestamp < cursor_time,
+                and_(EnhancedAuditLog.event_timestamp == cursor_time, EnhancedAuditLog.id < cursor_id)
+            ))
+        elif page and page > 1:
+            query = query.offset((page - 1) * page_size)
+        
+        rows = query.order_by(
+            EnhancedAuditLog.event_timestamp.desc(), EnhancedAuditLog.id.desc()
+        ).limit(page_size + 1).all()
+        
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        
+        return {
+            'items': [row.to_dict() for row in rows],
+            'next_cursor': self.encode_cursor(rows[-1]) if has_more and rows else None,
+            'has_more': has_more,
+            'total': total
+        }
+    
+    def _estimate_total(self) -> Optional[int]:
+        """使用数据库统计信息估算审计表总行数（MySQL），其他数据库精确统计"""
+        if db.engine.dialect.name == 'mysql':
+            return db.session.execute(text(
+                "SELECT TABLE_ROWS FROM information_schema.TABLES "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table"
+            ), {'table': EnhancedAuditLog.__tablename__}).scalar()
+        return EnhancedAuditLog.query.count()
+
+
 # 全局审计日志实例
 audit_logger = AuditLogger()
\ No newline at end of file
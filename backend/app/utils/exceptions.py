@@ -1,7 +1,10 @@
 """
 异常处理模块
 """
+import math
+import time
 from flask import current_app, request
+from flask_limiter.errors import RateLimitExceeded
 from app.utils.response import ApiResponse
 from app.utils.helpers import get_client_ip
 
@@ -65,6 +68,36 @@ class FileError(ITOpsException):
         super().__init__(message, 400)
 
 
+class ServiceBusyError(ITOpsException):
+    """服务繁忙异常"""
+    
+    def __init__(self, message: str = "服务繁忙，请稍后再试"):
+        super().__init__(message, 503)
+
+
+class QueryBudgetExceeded(ITOpsException):
+    """查询预算超限异常（测试模式下用于暴露N+1回归）"""
+
+    def __init__(self, message: str = "查询预算超限", data=None):
+        super().__init__(message, 500, data)
+
+
+def _retry_after_seconds(error: RateLimitExceeded) -> int:
+    """距离被触发的限流窗口重置的秒数（至少1秒）"""
+    from app import limiter
+    
+    try:
+        current = limiter.current_limit
+        if current is not None and current.breached:
+            return max(1, int(math.ceil(current.reset_at - time.time())))
+    except Exception:
+        pass
+    try:
+        return max(1, int(error.limit.limit.get_expiry()))
+    except Exception:
+        return 1
+
+
 def register_error_handlers(app):
     """注册错误处理器"""
     
@@ -98,6 +131,22 @@ def register_error_handlers(app):
         current_app.logger.info(f"资源不存在: {error.message}")
         return ApiResponse.not_found(error.message)
     
+    @app.errorhandler(RateLimitExceeded)
+    def handle_rate_limit_exceeded(error):
+        """处理频率限制异常（HTTP 429，附带Retry-After）"""
+        retry_after = _retry_after_seconds(error)
+        current_app.logger.warning(
+            f"请求频率超限: {request.endpoint} {error.description} - IP: {get_client_ip(request)}"
+        )
+        response = ApiResponse.error(
+            f"请求过于频繁，请{retry_after}秒后再试",
+            429,
+            {'limit': error.description, 'retry_after': retry_after}
+        )
+        response.status_code = 429
+        response.headers['Retry-After'] = str(retry_after)
+        return response
+    
     @app.errorhandler(404)
     def handle_404_error(error):
         """处理404异常"""
@@ -0,0 +1,257 @@
+"""
+IP阻止/放行列表
+规则支持CIDR（IPv4/IPv6）与过期时间，持久化在数据库中；
+各工作进程在内存中构建基数树做最长前缀匹配，并通过共享存储中的版本号轮询同步
+"""
+import time
+import ipaddress
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from flask import current_app, has_app_context
+from sqlalchemy import or_
+
+from app import db
+from app.models.base import BaseModel
+from app.utils.shared_store import get_shared_store
+
+
+BLOCKLIST_VERSION_KEY = 'ipblock:version'
+
+
+def _normalize_version(version) -> Optional[str]:
+    """统一版本号类型（Redis返回字符串，进程内存储返回整数），避免每次轮询都判定为变化"""
+    return str(version) if version is not None else None
+
+
+class IPAccessRule(BaseModel):
+    """IP访问规则"""
+    __tablename__ = 'ip_access_rule'
+
+    cidr = db.Column(db.String(64), nullable=False, index=True, comment='IP或CIDR网段')
+    action = db.Column(db.String(10), nullable=False, default='block', comment='动作: block/allow')
+    reason = db.Column(db.String(255), nullable=True, comment='原因')
+    source = db.Column(db.String(20), nullable=False, default='manual', comment='来源: manual/auto')
+    expires_at = db.Column(db.DateTime, nullable=True, comment='过期时间，为空表示永久')
+
+    def to_dict(self, exclude_fields=None):
+        result = super().to_dict(exclude_fields)
+        result['permanent'] = self.expires_at is None
+        return result
+
+
+class CIDRTrie:
+    """二进制基数树，按位存储网段前缀，查询返回最长前缀匹配的值"""
+
+    __slots__ = ('root', 'bits', 'size')
+
+    def __init__(self, bits: int):
+        self.bits = bits
+        self.root = [None, None, None]  # [0分支, 1分支, 值]
+        self.size = 0
+
+    def insert(self, network, value):
+        node = self.root
+        address = int(network.network_address)
+        for i in range(network.prefixlen):
+            bit = (address >> (self.bits - 1 - i)) & 1
+            if node[bit] is None:
+                node[bit] = [None, None, None]
+            node = node[bit]
+        if node[2] is None:
+            self.size += 1
+        node[2] = value
+
+    def longest_match(self, address: int):
+        node = self.root
+        match = node[2]
+        for i in range(self.bits):
+            node = node[(address >> (self.bits - 1 - i)) & 1]
+            if node is None:
+                break
+            if node[2] is not None:
+                match = node[2]
+        return match
+
+
+class IPBlocklist:
+    """按进程缓存的IP规则引擎"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tries = {4: CIDRTrie(32), 6: CIDRTrie(128)}
+        self._version = None
+        self._next_poll = 0.0
+        self._next_degraded_reload = 0.0
+        self._next_expiry = None
+        self.reloads = 0
+        self.reload_errors = 0
+
+    def _config(self, key, default):
+        if has_app_context():
+            return current_app.config.get(key, default)
+        return default
+
+    # ---------- 同步 ----------
+
+    def _refresh_if_needed(self):
+        """按间隔轮询共享版本号，版本变化或有规则到期时从数据库重建"""
+        now = time.time()
+        if now < self._next_poll:
+            return
+        self._next_poll = now + self._config('IP_BLOCKLIST_SYNC_INTERVAL', 1.0)
+
+        try:
+            version = _normalize_version(get_shared_store().get(BLOCKLIST_VERSION_KEY))
+        except Exception:
+            # 共享存储不可用时无法感知其他进程的规则变更，改为定期从数据库重建
+            if now >= self._next_degraded_reload:
+                self._next_degraded_reload = now + self._config('IP_BLOCKLIST_DEGRADED_RELOAD_INTERVAL', 10.0)
+                self._try_reload(self._version, now)
+            return
+        self._next_degraded_reload = 0.0
+        expired = self._next_expiry is not None and datetime.utcnow() >= self._next_expiry
+        if version != self._version or expired or self.reloads == 0:
+            self._try_reload(version, now)
+
+    def _try_reload(self, version, now: float):
+        """重建失败（如数据表缺失）时保留上次的规则，并推迟下次轮询避免每次请求都查库、刷日志"""
+        try:
+            self.reload(version)
+        except Exception as e:
+            db.session.rollback()
+            self.reload_errors += 1
+            self._next_poll = now + self._config('IP_BLOCKLIST_DEGRADED_RELOAD_INTERVAL', 10.0)
+            if has_app_context():
+                current_app.logger.error(f"加载IP访问规则失败，沿用已加载的规则: {str(e)}")
+
+    def reload(self, version=None):
+        """从数据库加载未过期规则并重建基数树"""
+        now = datetime.utcnow()
+        rules = IPAccessRule.query.filter(
+            IPAccessRule.is_deleted == False,
+            or_(IPAccessRule.expires_at.is_(None), IPAccessRule.expires_at > now)
+        ).all()
+
+        tries = {4: CIDRTrie(32), 6: CIDRTrie(128)}
+        next_expiry = None
+        for rule in rules:
+            try:
+                network = ipaddress.ip_network(rule.cidr, strict=False)
+            except ValueError:
+                continue
+            entry = {
+                'id': rule.id,
+                'cidr': str(network),
+                'action': rule.action,
+                'reason': rule.reason,
+                'expires_at': rule.expires_at,
+            }
+            # 同一网段同时存在放行和阻止规则时，放行优先
+            trie = tries[network.version]
+            existing = trie.longest_match(int(network.network_address)) if network.prefixlen else None
+            if existing and existing['cidr'] == entry['cidr'] and existing['action'] == 'allow':
+                continue
+            trie.insert(network, entry)
+            if rule.expires_at and (next_expiry is None or rule.expires_at < next_expiry):
+                next_expiry = rule.expires_at
+
+        with self._lock:
+            self._tries = tries
+            self._version = version
+            self._next_expiry = next_expiry
+            self.reloads += 1
+
+    def _bump_version(self):
+        try:
+            version = get_shared_store().incr(BLOCKLIST_VERSION_KEY)
+        except Exception as e:
+            version = None
+            if has_app_context():
+                current_app.logger.error(f"递增IP规则版本号失败: {str(e)}")
+        self.reload(_normalize_version(version))
+
+    # ---------- 查询 ----------
+
+    def match(self, ip: str) -> Optional[Dict]:
+        """返回命中的最长前缀规则"""
+        try:
+            address = ipaddress.ip_address(ip)
+        except ValueError:
+            return None
+        self._refresh_if_needed()
+        if address.version == 6 and address.ipv4_mapped:
+            address = address.ipv4_mapped
+        entry = self._tries[address.version].longest_match(int(address))
+        if entry and entry['expires_at'] and entry['expires_at'] <= datetime.utcnow():
+            return None
+        return entry
+
+    def is_blocked(self, ip: str) -> bool:
+        entry = self.match(ip)
+        return bool(entry and entry['action'] == 'block')
+
+    # ---------- 管理 ----------
+
+    def add_rule(self, cidr: str, action: str = 'block', duration: int = None,
+                 reason: str = None, source: str = 'manual', created_by: int = None) -> IPAccessRule:
+        """添加规则
+
+        Args:
+            cidr: IP地址或CIDR网段
+            action: block/allow
+            duration: 有效期（秒），为空表示永久
+        """
+        if action not in ('block', 'allow'):
+            raise ValueError("动作只能为block或allow")
+        network = ipaddress.ip_network(cidr, strict=False)
+
+        rule = IPAccessRule(
+            cidr=str(network),
+            action=action,
+            reason=reason,
+            source=source,
+            expires_at=datetime.utcnow() + timedelta(seconds=duration) if duration else None,
+            created_by=created_by
+        )
+        db.session.add(rule)
+        db.session.commit()
+        self._bump_version()
+        return rule
+
+    def remove_rule(self, cidr: str, action: str = 'block') -> bool:
+        """删除指定网段的规则（软删除），不存在时返回False"""
+        network = ipaddress.ip_network(cidr, strict=False)
+        rules = IPAccessRule.query.filter_by(cidr=str(network), action=action, is_deleted=False).all()
+        if not rules:
+            return False
+        for rule in rules:
+            rule.is_deleted = True
+            rule.updated_at = datetime.utcnow()
+        db.session.commit()
+        self._bump_version()
+        return True
+
+    def list_rules(self, action: str = None) -> List[IPAccessRule]:
+        """未过期的规则"""
+        query = IPAccessRule.query.filter(
+            IPAccessRule.is_deleted == False,
+            or_(IPAccessRule.expires_at.is_(None), IPAccessRule.expires_at > datetime.utcnow())
+        )
+        if action:
+            query = query.filter(IPAccessRule.action == action)
+        return query.order_by(IPAccessRule.created_at.desc()).all()
+
+    def get_stats(self) -> Dict:
+        return {
+            'version': self._version,
+            'ipv4_prefixes': self._tries[4].size,
+            'ipv6_prefixes': self._tries[6].size,
+            'reloads': self.reloads,
+            'next_expiry': self._next_expiry.isoformat() if self._next_expiry else None,
+        }
+
+
+# 全局IP规则引擎
+ip_blocklist = IPBlocklist()
@@ -0,0 +1,277 @@
+"""
+跨工作进程的请求指标汇总
+gunicorn以preload_app方式fork出多个工作进程，每个进程只持有自己的RequestMetrics。
+各工作进程由后台线程将已结束的秒级时间桶增量追加到共享目录（默认/dev/shm下按部署区分的子目录）中按分钟滚动的文件，
+唯一的收集进程（持有文件锁，通常是启动了监控线程的gunicorn主进程）读取增量合并为全服务器指标，
+并定期发布汇总快照供各工作进程的监控接口读取
+"""
+import os
+import json
+import time
+import glob
+import hashlib
+import tempfile
+import threading
+from datetime import datetime
+from typing import Callable, Dict, Optional
+
+try:
+    import fcntl
+    HAS_FCNTL = True
+except ImportError:
+    HAS_FCNTL = False
+
+
+def default_shared_dir(namespace: str = None) -> str:
+    """优先使用内存文件系统，按部署命名空间区分目录"""
+    base = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    return os.path.join(base, f'it-ops-metrics-{namespace}' if namespace else 'it-ops-metrics')
+
+
+def deployment_namespace(app) -> str:
+    """同一主机上的多个部署（不同代码目录或数据库）使用不同的共享目录"""
+    key = f"{app.root_path}|{app.config.get('SQLALCHEMY_DATABASE_URI', '')}"
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()[:12]
+
+
+class MetricsAggregator:
+    """工作进程指标导出与收集进程合并"""
+
+    def __init__(self):
+        self.enabled = True
+        self.shared_dir = default_shared_dir()
+        self.interval = 1.0
+
+        self._collector_pid = None
+        self.merged = None  # 收集进程中合并后的RequestMetrics
+        self._summary_builder: Optional[Callable] = None
+        self._exposition_builder: Optional[Callable] = None
+        self._lock_file = None
+        self._offsets: Dict[str, int] = {}
+        self._worker_seen: Dict[int, float] = {}
+
+        self._exporter_thread = None
+        self._exporter_pid = None
+        self._exported_second = None
+        self._export_lock = threading.Lock()
+
+        self._summary_cache = None
+        self._summary_mtime = None
+        self._summary_checked = 0.0
+        self._exposition_cache = None
+        self._exposition_mtime = None
+        self._exposition_checked = 0.0
+
+        self.stats = {'exported_slots': 0, 'merged_slots': 0, 'export_errors': 0, 'collect_errors': 0}
+
+    def init_app(self, app):
+        self.enabled = app.config.get('METRICS_AGGREGATION_ENABLED', True)
+        self.shared_dir = app.config.get('METRICS_SHARED_DIR') or default_shared_dir(deployment_namespace(app))
+        self.interval = app.config.get('METRICS_AGGREGATION_INTERVAL', self.interval)
+
+    @property
+    def is_collector(self) -> bool:
+        """当前进程是否为收集进程（fork出的子进程继承的状态不算）"""
+        return self._collector_pid == os.getpid()
+
+    @property
+    def summary_path(self) -> str:
+        return os.path.join(self.shared_dir, 'summary.json')
+
+    @property
+    def exposition_path(self) -> str:
+        return os.path.join(self.shared_dir, 'requests.prom')
+
+    # ---------- 工作进程：增量导出 ----------
+
+    def ensure_exporter(self, metrics):
+        """按进程惰性启动导出线程（fork后的工作进程在首次记录请求时启动）"""
+        if not self.enabled:
+            return
+        if self._exporter_pid == os.getpid() and self._exporter_thread is not None:
+            return
+        with self._export_lock:
+            if self._exporter_pid == os.getpid() and self._exporter_thread is not None:
+                return
+            os.makedirs(self.shared_dir, exist_ok=True)
+            self._exporter_pid = os.getpid()
+            self._exported_second = metrics.current_second() - 1
+            self._exporter_thread = threading.Thread(
+                target=self._export_loop,
+                args=(metrics,),
+                name='metrics-exporter',
+                daemon=True
+            )
+            self._exporter_thread.start()
+
+    def _export_loop(self, metrics):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.export(metrics)
+            except Exception as e:
+                self.stats['export_errors'] += 1
+                print(f"导出请求指标失败: {e}")
+
+    def export(self, metrics, include_current: bool = False) -> int:
+        """将已结束的时间桶追加到本进程的分钟文件，返回导出桶数"""
+        if self._exported_second is None:
+            return 0
+        with self._export_lock:
+            before = metrics.current_second() + (1 if include_current else 0)
+            slots = metrics.export_slots(self._exported_second, before)
+            self._exported_second = before - 1
+            if not slots:
+                return 0
+            minute = int(time.time() // 60)
+            path = os.path.join(self.shared_dir, f'worker-{os.getpid()}-{minute}.jsonl')
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write(''.join(json.dumps(slot, separators=(',', ':')) + '\n' for slot in slots))
+            self.stats['exported_slots'] += len(slots)
+            return len(slots)
+
+    def flush(self, metrics):
+        """工作进程退出前导出包括当前秒在内的全部未导出数据"""
+        if self.enabled and self._exporter_pid == os.getpid():
+            self.export(metrics, include_current=True)
+
+    # ---------- 收集进程：合并与发布 ----------
+
+    def start_collector(self, merged_metrics, summary_builder: Callable,
+                        exposition_builder: Callable = None) -> bool:
+        """尝试成为收集进程（同一共享目录只有一个），成功时启动收集线程"""
+        if not self.enabled or self.is_collector:
+            return self.is_collector
+        os.makedirs(self.shared_dir, exist_ok=True)
+        lock_file = open(os.path.join(self.shared_dir, 'collector.lock'), 'a')
+        if HAS_FCNTL:
+            try:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                return False
+        self._lock_file = lock_file
+        self._collector_pid = os.getpid()
+        self._offsets = {}
+        self.merged = merged_metrics
+        self._summary_builder = summary_builder
+        self._exposition_builder = exposition_builder
+        threading.Thread(target=self._collect_loop, name='metrics-collector', daemon=True).start()
+        return True
+
+    def _collect_loop(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.collect()
+                self.publish_summary()
+            except Exception as e:
+                self.stats['collect_errors'] += 1
+                print(f"汇总请求指标失败: {e}")
+
+    def collect(self) -> int:
+        """读取各工作进程文件中的新增行并合并，删除已读完且不再写入的旧分钟文件"""
+        current_minute = int(time.time() // 60)
+        merged = 0
+        for path in sorted(glob.glob(os.path.join(self.shared_dir, 'worker-*.jsonl'))):
+            name = os.path.basename(path)[len('worker-'):-len('.jsonl')]
+            try:
+                pid, minute = (int(part) for part in name.split('-'))
+            except ValueError:
+                continue
+
+            offset = self._offsets.get(path, 0)
+            with open(path, 'rb') as f:
+                f.seek(offset)
+                data = f.read()
+            complete = data.rfind(b'\n') + 1  # 只处理完整的行
+            for line in data[:complete].splitlines():
+                try:
+                    self.merged.merge_slot(json.loads(line))
+                    merged += 1
+                except ValueError:
+                    continue
+            offset += complete
+            self._offsets[path] = offset
+            if complete:
+                self._worker_seen[pid] = time.time()
+
+            # 上一分钟之前的文件不会再被追加
+            if minute < current_minute - 1 and offset >= os.path.getsize(path):
+                os.remove(path)
+                self._offsets.pop(path, None)
+
+        self.stats['merged_slots'] += merged
+        return merged
+
+    def active_workers(self, within: float = 60) -> int:
+        cutoff = time.time() - within
+        return sum(1 for seen in self._worker_seen.values() if seen >= cutoff)
+
+    def publish_summary(self):
+        """原子写入汇总快照"""
+        summary = self._summary_builder(self.merged)
+        summary['workers'] = self.active_workers()
+        summary['generated_at'] = datetime.now().isoformat()
+        summary['collector_pid'] = os.getpid()
+        tmp_path = f'{self.summary_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False)
+        os.replace(tmp_path, self.summary_path)
+
+        # 预渲染的请求指标文本（OpenMetrics）
+        if self._exposition_builder is not None:
+            tmp_path = f'{self.exposition_path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(self._exposition_builder(self.merged))
+            os.replace(tmp_path, self.exposition_path)
+
+    # ---------- 读取汇总 ----------
+
+    def read_summary(self, max_age: float = None) -> Optional[Dict]:
+        """读取收集进程发布的汇总，不存在或过期时返回None（每秒最多检查一次文件）"""
+        if not self.enabled:
+            return None
+        max_age = max_age if max_age is not None else self.interval * 5
+        now = time.time()
+        if now - self._summary_checked >= 1.0:
+            self._summary_checked = now
+            try:
+                mtime = os.path.getmtime(self.summary_path)
+                if mtime != self._summary_mtime:
+                    with open(self.summary_path, encoding='utf-8') as f:
+                        self._summary_cache = json.load(f)
+                    self._summary_mtime = mtime
+            except (OSError, ValueError):
+                self._summary_cache, self._summary_mtime = None, None
+        if self._summary_cache is None or self._summary_mtime is None or now - self._summary_mtime > max_age:
+            return None
+        return self._summary_cache
+
+    def read_exposition(self, max_age: float = None) -> Optional[str]:
+        """读取收集进程预渲染的请求指标文本，不存在或过期时返回None"""
+        if not self.enabled:
+            return None
+        max_age = max_age if max_age is not None else self.interval * 5
+        now = time.time()
+        if now - self._exposition_checked >= 1.0:
+            self._exposition_checked = now
+            try:
+                mtime = os.path.getmtime(self.exposition_path)
+                if mtime != self._exposition_mtime:
+                    with open(self.exposition_path, encoding='utf-8') as f:
+                        self._exposition_cache = f.read()
+                    self._exposition_mtime = mtime
+            except OSError:
+                self._exposition_cache, self._exposition_mtime = None, None
+        if self._exposition_cache is None or self._exposition_mtime is None or now - self._exposition_mtime > max_age:
+            return None
+        return self._exposition_cache
+
+    def get_stats(self) -> Dict:
+        stats = dict(self.stats)
+        stats['is_collector'] = self.is_collector
+        stats['shared_dir'] = self.shared_dir
+        if self.is_collector:
+            stats['workers'] = self.active_workers()
+        return stats
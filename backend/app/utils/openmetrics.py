@@ -0,0 +1,261 @@
+"""
+OpenMetrics/Prometheus文本格式指标导出
+请求延迟直方图与状态码计数来自收集进程预渲染的全服务器累计值（不可用时使用本进程累计值），
+连接池、写入队列、缓存命中率及工作进程标识为本进程的实时值，渲染耗时与请求量无关
+"""
+import os
+import time
+import threading
+from typing import Dict, List
+
+from flask import current_app
+from sqlalchemy import event
+
+from app.utils.performance_monitor import (
+    performance_monitor, RequestMetrics, EXPOSITION_BUCKETS_MS
+)
+
+
+CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+PROCESS_START_TIME = time.time()
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels: Dict) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + '}'
+
+
+def _number(value) -> str:
+    if isinstance(value, float):
+        return repr(round(value, 6))
+    return str(value)
+
+
+class MetricsWriter:
+    """按指标族组织输出行"""
+
+    def __init__(self):
+        self.lines: List[str] = []
+
+    def family(self, name: str, metric_type: str, help_text: str, unit: str = None):
+        self.lines.append(f'# TYPE {name} {metric_type}')
+        if unit:
+            self.lines.append(f'# UNIT {name} {unit}')
+        self.lines.append(f'# HELP {name} {help_text}')
+
+    def sample(self, name: str, value, labels: Dict = None):
+        self.lines.append(f'{name}{_labels(labels)} {_number(value)}')
+
+    def render(self) -> str:
+        return '\n'.join(self.lines) + '\n' if self.lines else ''
+
+
+def render_request_metrics(metrics: RequestMetrics) -> str:
+    """渲染请求延迟直方图与状态码计数"""
+    series, codes = metrics.snapshot_totals()
+    writer = MetricsWriter()
+
+    name = 'itops_http_request_duration_seconds'
+    writer.family(name, 'histogram', '按端点与状态码分类的请求耗时', 'seconds')
+    bounds = [f'{ms / 1000:g}' for ms in EXPOSITION_BUCKETS_MS] + ['+Inf']
+    for (endpoint, cls), (count, total_ms, bucket_counts) in sorted(series.items()):
+        labels = {'endpoint': endpoint, 'status_class': cls}
+        cumulative = 0
+        for le, n in zip(bounds, bucket_counts):
+            cumulative += n
+            writer.sample(f'{name}_bucket', cumulative, dict(labels, le=le))
+        writer.sample(f'{name}_count', count, labels)
+        writer.sample(f'{name}_sum', total_ms / 1000.0, labels)
+
+    name = 'itops_http_responses'
+    writer.family(name, 'counter', '按状态码的响应数')
+    for code, count in sorted(codes.items()):
+        writer.sample(f'{name}_total', count, {'code': code})
+    return writer.render()
+
+
+class PoolMonitor:
+    """SQLAlchemy连接池检出计数与等待时间"""
+
+    def __init__(self):
+        self._pool = None
+        self._lock = threading.Lock()
+        self.stats = {
+            'checkouts': 0,
+            'connects': 0,
+            'invalidations': 0,
+            'wait_count': 0,
+            'wait_seconds': 0.0,
+            'wait_max_seconds': 0.0,
+        }
+
+    def init_app(self, app):
+        app.before_request(self._ensure_instrumented)
+
+    def _ensure_instrumented(self):
+        from app import db
+        pool = db.engine.pool
+        if pool is not self._pool:
+            self.instrument(pool)
+
+    def instrument(self, pool):
+        """为连接池注册事件并包装取连接方法以计时等待"""
+        with self._lock:
+            if pool is self._pool:
+                return
+            self._pool = pool
+            event.listen(pool, 'checkout', self._on_checkout)
+            event.listen(pool, 'connect', self._on_connect)
+            event.listen(pool, 'invalidate', self._on_invalidate)
+
+            original = getattr(pool, '_do_get', None)
+            if original is None:
+                return
+
+            def timed_do_get():
+                start = time.perf_counter()
+                try:
+                    return original()
+                finally:
+                    self._record_wait(time.perf_counter() - start)
+
+            pool._do_get = timed_do_get
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        self.stats['checkouts'] += 1
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        self.stats['connects'] += 1
+
+    def _on_invalidate(self, dbapi_connection, connection_record, exception):
+        self.stats['invalidations'] += 1
+
+    def _record_wait(self, seconds: float):
+        stats = self.stats
+        stats['wait_count'] += 1
+        stats['wait_seconds'] += seconds
+        if seconds > stats['wait_max_seconds']:
+            stats['wait_max_seconds'] = seconds
+
+    def gauges(self) -> Dict[str, float]:
+        """连接池当前状态（不同连接池类型支持的项目不同）"""
+        pool = self._pool
+        result = {}
+        for name in ('size', 'checkedout', 'overflow', 'checkedin'):
+            getter = getattr(pool, name, None)
+            if callable(getter):
+                try:
+                    result[name] = getter()
+                except Exception:
+                    continue
+        return result
+
+
+def render_process_metrics() -> str:
+    """渲染本进程的连接池、写入队列、缓存与工作进程标识指标"""
+    from app.utils.enhanced_audit import audit_writer
+    from app.utils.auth import operation_log_writer
+    from app.utils.permission_cache import permission_cache
+    from app.utils.token_revocation import token_revocation
+    from app.utils.query_tracker import query_tracker
+
+    pid = os.getpid()
+    process = {'pid': pid}
+    writer = MetricsWriter()
+
+    writer.family('itops_worker', 'info', 'gunicorn工作进程标识')
+    writer.sample('itops_worker_info', 1, {
+        'pid': pid,
+        'worker_id': performance_monitor.worker_id if performance_monitor.worker_id is not None else '',
+        'collector': 'true' if performance_monitor.aggregator.is_collector else 'false'
+    })
+    writer.family('itops_process_start_time_seconds', 'gauge', '进程启动时间', 'seconds')
+    writer.sample('itops_process_start_time_seconds', PROCESS_START_TIME, process)
+
+    # 数据库连接池
+    gauges = pool_monitor.gauges()
+    for key, help_text in (('size', '连接池容量'), ('checkedout', '已检出连接数'),
+                           ('overflow', '溢出连接数'), ('checkedin', '空闲连接数')):
+        if key in gauges:
+            name = f'itops_db_pool_{key}'
+            writer.family(name, 'gauge', help_text)
+            writer.sample(name, gauges[key], process)
+    stats = pool_monitor.stats
+    writer.family('itops_db_pool_checkouts', 'counter', '连接检出次数')
+    writer.sample('itops_db_pool_checkouts_total', stats['checkouts'], process)
+    writer.family('itops_db_pool_connects', 'counter', '新建数据库连接次数')
+    writer.sample('itops_db_pool_connects_total', stats['connects'], process)
+    writer.family('itops_db_pool_wait_seconds', 'summary', '从连接池获取连接的等待时间', 'seconds')
+    writer.sample('itops_db_pool_wait_seconds_count', stats['wait_count'], process)
+    writer.sample('itops_db_pool_wait_seconds_sum', stats['wait_seconds'], process)
+    writer.family('itops_db_pool_wait_max_seconds', 'gauge', '获取连接的最长等待时间', 'seconds')
+    writer.sample('itops_db_pool_wait_max_seconds', stats['wait_max_seconds'], process)
+
+    # 请求内SQL语句
+    query_stats = query_tracker.get_stats()
+    writer.family('itops_db_queries', 'counter', '请求内执行的SQL语句数')
+    writer.sample('itops_db_queries_total', query_stats['queries'], process)
+    writer.family('itops_db_n_plus_one', 'counter', '疑似N+1查询次数')
+    writer.sample('itops_db_n_plus_one_total', query_stats['n_plus_one'], process)
+    writer.family('itops_db_query_budget_exceeded', 'counter', '查询预算超限次数')
+    writer.sample('itops_db_query_budget_exceeded_total', query_stats['budget_exceeded'], process)
+
+    # 审计/操作日志写入队列
+    writer_stats = {'audit': audit_writer.get_stats(), 'operation_log': operation_log_writer.get_stats()}
+    writer.family('itops_write_queue_depth', 'gauge', '批量写入队列深度')
+    for queue_name, queue_stats in writer_stats.items():
+        writer.sample('itops_write_queue_depth', queue_stats['queue_depth'], dict(process, queue=queue_name))
+    writer.family('itops_write_queue_capacity', 'gauge', '批量写入队列容量')
+    for queue_name, queue_stats in writer_stats.items():
+        writer.sample('itops_write_queue_capacity', queue_stats['queue_capacity'], dict(process, queue=queue_name))
+    writer.family('itops_write_queue_written_rows', 'counter', '已写入行数')
+    for queue_name, queue_stats in writer_stats.items():
+        writer.sample('itops_write_queue_written_rows_total', queue_stats['written'], dict(process, queue=queue_name))
+    writer.family('itops_write_queue_spilled_rows', 'counter', '落盘行数')
+    for queue_name, queue_stats in writer_stats.items():
+        writer.sample('itops_write_queue_spilled_rows_total', queue_stats['spilled'], dict(process, queue=queue_name))
+
+    # 缓存命中率
+    permission_stats = permission_cache.get_stats()
+    revocation_stats = token_revocation.get_stats()
+    caches = {
+        'permission': (permission_stats['hits'], permission_stats['misses']),
+        # 布隆过滤器未命中即无需查询共享存储
+        'token_revocation_bloom': (
+            revocation_stats['checks'] - revocation_stats['bloom_hits'], revocation_stats['bloom_hits']
+        ),
+    }
+    writer.family('itops_cache_hits', 'counter', '缓存命中次数')
+    for cache_name, (hits, _) in caches.items():
+        writer.sample('itops_cache_hits_total', hits, dict(process, cache=cache_name))
+    writer.family('itops_cache_misses', 'counter', '缓存未命中次数')
+    for cache_name, (_, misses) in caches.items():
+        writer.sample('itops_cache_misses_total', misses, dict(process, cache=cache_name))
+    writer.family('itops_cache_hit_ratio', 'gauge', '缓存命中率')
+    for cache_name, (hits, misses) in caches.items():
+        total = hits + misses
+        writer.sample('itops_cache_hit_ratio', hits / total if total else 0.0, dict(process, cache=cache_name))
+
+    return writer.render()
+
+
+def render_metrics() -> str:
+    """完整的OpenMetrics文本"""
+    requests_text = performance_monitor.aggregator.read_exposition()
+    if requests_text is None:
+        requests_text = render_request_metrics(performance_monitor.request_metrics)
+    try:
+        process_text = render_process_metrics()
+    except Exception as e:
+        current_app.logger.error(f"渲染进程指标失败: {str(e)}")
+        process_text = ''
+    return requests_text + process_text + '# EOF\n'
+
+
+# 全局连接池监控
+pool_monitor = PoolMonitor()
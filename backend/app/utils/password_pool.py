@@ -0,0 +1,148 @@
+"""
+密码哈希进程池
+将pbkdf2密码哈希/校验移出请求工作线程，限制每个工作进程同时进行的哈希数并在饱和时快速拒绝
+"""
+import os
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from flask import current_app, has_app_context
+from werkzeug.security import generate_password_hash, check_password_hash
+
+from app.utils.exceptions import ServiceBusyError
+
+
+DEFAULT_HASH_METHOD = 'pbkdf2:sha256:600000'
+
+
+def _generate_hash(password: str, method: str) -> str:
+    """在子进程中生成密码哈希"""
+    return generate_password_hash(password, method=method)
+
+
+def _check_hash(password_hash: str, password: str) -> bool:
+    """在子进程中校验密码"""
+    return check_password_hash(password_hash, password)
+
+
+def _mp_context():
+    """子进程启动方式：优先forkserver，不支持的平台使用spawn"""
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+
+
+class PasswordHashPool:
+    """有界的密码哈希进程池"""
+
+    def __init__(self):
+        self._executor = None
+        self._executor_pid = None
+        self._slots = None
+        self._lock = threading.Lock()
+        self.rejected_count = 0
+        self.pending = 0
+
+    def _config(self, key, default):
+        if has_app_context():
+            return current_app.config.get(key, default)
+        return default
+
+    @property
+    def hash_method(self) -> str:
+        return self._config('PASSWORD_HASH_METHOD', DEFAULT_HASH_METHOD)
+
+    def _get_executor(self):
+        """获取当前进程的执行器（fork后或进程池损坏后重新创建）"""
+        workers = self._config('PASSWORD_HASH_WORKERS', 1)
+        if workers <= 0:
+            return None
+
+        with self._lock:
+            if self._executor_pid != os.getpid():
+                # fork后父进程的任务不会在子进程中完成，槽位与计数重新开始。
+                # 槽位须小于gunicorn每个工作进程的线程数，保证哈希饱和时仍有线程处理其他请求
+                self._executor = None
+                self._slots = threading.BoundedSemaphore(
+                    max(1, self._config('PASSWORD_HASH_MAX_INFLIGHT', 1))
+                )
+                self.pending = 0
+                self._executor_pid = os.getpid()
+            if self._executor is None:
+                # 不直接fork多线程的gunicorn工作进程（子进程可能继承被其他线程持有的锁）
+                self._executor = ProcessPoolExecutor(max_workers=workers, mp_context=_mp_context())
+            return self._executor
+
+    def _discard_executor(self, executor):
+        """丢弃已损坏的进程池（子进程异常退出），下次调用时重建"""
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False)
+
+    def _release(self, slots):
+        with self._lock:
+            self.pending -= 1
+        slots.release()
+
+    def _run(self, func, *args):
+        """提交任务并等待结果，本进程在途哈希数已达上限时立即拒绝"""
+        executor = self._get_executor()
+        if executor is None:
+            return func(*args)
+
+        slots = self._slots
+        if not slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected_count += 1
+            raise ServiceBusyError("认证服务繁忙，请稍后重试")
+
+        with self._lock:
+            self.pending += 1
+        try:
+            future = executor.submit(func, *args)
+        except (BrokenProcessPool, RuntimeError):
+            self._release(slots)
+            self._discard_executor(executor)
+            raise ServiceBusyError("认证服务暂不可用，请稍后重试")
+
+        # 槽位在任务结束时释放：等待超时后任务仍占用子进程，不能提前让出
+        future.add_done_callback(lambda _: self._release(slots))
+        try:
+            return future.result(timeout=self._config('PASSWORD_HASH_TIMEOUT', 10))
+        except FutureTimeoutError:
+            raise ServiceBusyError("认证服务响应超时，请稍后重试")
+        except BrokenProcessPool:
+            self._discard_executor(executor)
+            raise ServiceBusyError("认证服务暂不可用，请稍后重试")
+
+    def hash(self, password: str) -> str:
+        """生成密码哈希"""
+        return self._run(_generate_hash, password, self.hash_method)
+
+    def verify(self, password_hash: str, password: str) -> bool:
+        """校验密码"""
+        if not password_hash:
+            return False
+        return self._run(_check_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash: str) -> bool:
+        """判断哈希参数是否与当前配置不一致"""
+        if not password_hash or '$' not in password_hash:
+            return True
+        return password_hash.split('$', 1)[0] != self.hash_method
+
+    def get_stats(self) -> dict:
+        """获取进程池状态"""
+        return {
+            'workers': self._config('PASSWORD_HASH_WORKERS', 1),
+            'max_inflight': self._config('PASSWORD_HASH_MAX_INFLIGHT', 1),
+            'pending': self.pending,
+            'rejected': self.rejected_count
+        }
+
+
+# 全局密码哈希进程池
+password_pool = PasswordHashPool()
@@ -4,17 +4,18 @@
 """
 import psutil
 import time
+import bisect
 import threading
-from datetime import datetime, timedelta
+from datetime import datetime
 from typing import Dict, List, Optional, Tuple
-from collections import deque
-import statistics
 import json
-import sqlite3
 import os
 
 from flask import current_app
 
+from app.utils.timeseries_store import TimeSeriesStore
+from app.utils.metrics_aggregation import MetricsAggregator
+
 
 class MetricType:
     """指标类型"""
@@ -53,10 +54,14 @@ class ResourceMonitor:
         self.disk_percent = 0
         self.network_io = {'sent': 0, 'recv': 0}
         self.last_network_io = None
+        self._process = None
     
-    def get_cpu_usage(self) -> float:
-        """获取CPU使用率"""
-        self.cpu_percent = psutil.cpu_percent(interval=1)
+    def get_cpu_usage(self, interval: float = None) -> float:
+        """获取CPU使用率
+
+        interval为None时不阻塞，返回自上次调用以来的平均使用率（首次调用返回0）
+        """
+        self.cpu_percent = psutil.cpu_percent(interval=interval)
         return self.cpu_percent
     
     def get_memory_usage(self) -> Tuple[float, Dict]:
@@ -121,7 +126,10 @@ class ResourceMonitor:
     def get_process_info(self) -> Dict:
         """获取当前进程信息"""
         try:
-            process = psutil.Process()
+            # 复用Process对象，cpu_percent才能计算两次调用之间的使用率
+            if self._process is None or self._process.pid != os.getpid():
+                self._process = psutil.Process()
+            process = self._process
             return {
                 'pid': process.pid,
                 'cpu_percent': process.cpu_percent(),
@@ -134,71 +142,392 @@ class ResourceMonitor:
             return {}
 
 
+class SystemMetricsSampler:
+    """后台系统指标采样器
+
+    按固定间隔在后台线程中采集CPU/内存/磁盘/网络/进程指标并缓存最新快照，
+    接口直接读取快照及其采样时间，不在请求线程中阻塞等待采样
+    """
+    
+    def __init__(self, interval: float = 5.0):
+        self.interval = interval
+        self.resource_monitor = ResourceMonitor()
+        self._snapshot = None
+        self._sampled_at = None
+        self._last_sample_time = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self.samples = 0
+        self.last_sample_ms = 0.0
+    
+    def init_app(self, app):
+        self.interval = app.config.get('SYSTEM_METRICS_SAMPLE_INTERVAL', self.interval)
+    
+    def _ensure_started(self):
+        """按进程惰性启动采样线程（兼容gunicorn preload后fork）"""
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._stop_event.clear()
+            # 首次采样同步执行（不阻塞），保证快照可用
+            self.sample()
+            self._thread = threading.Thread(
+                target=self._run,
+                name='system-metrics-sampler',
+                daemon=True
+            )
+            self._thread.start()
+    
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.sample()
+            except Exception as e:
+                print(f"系统指标采样错误: {e}")
+    
+    def sample(self) -> Dict:
+        """采集一次快照"""
+        start = time.time()
+        monitor = self.resource_monitor
+        cpu_usage = monitor.get_cpu_usage()
+        memory_usage, memory_info = monitor.get_memory_usage()
+        disk_usage, disk_info = monitor.get_disk_usage()
+        network_io = dict(monitor.get_network_io())
+        elapsed = start - self._last_sample_time if self._last_sample_time else None
+        network_io['sent_per_sec'] = network_io.get('sent', 0) / elapsed if elapsed else 0
+        network_io['recv_per_sec'] = network_io.get('recv', 0) / elapsed if elapsed else 0
+        
+        snapshot = {
+            'system': {
+                'cpu_usage': cpu_usage,
+                'memory_usage': memory_usage,
+                'memory_info': memory_info,
+                'disk_usage': disk_usage,
+                'disk_info': disk_info,
+                'network_io': network_io
+            },
+            'process': monitor.get_process_info()
+        }
+        self._snapshot = snapshot
+        self._sampled_at = datetime.now()
+        self._last_sample_time = start
+        self.samples += 1
+        self.last_sample_ms = (time.time() - start) * 1000
+        return snapshot
+    
+    def get_snapshot(self) -> Dict:
+        """获取最新快照及其采样时间与时效（秒）"""
+        self._ensure_started()
+        snapshot, sampled_at = self._snapshot, self._sampled_at
+        return {
+            'system': snapshot['system'],
+            'process': snapshot['process'],
+            'sampled_at': sampled_at.isoformat(),
+            'age_seconds': round((datetime.now() - sampled_at).total_seconds(), 3),
+            'sample_interval': self.interval
+        }
+    
+    def stop(self):
+        self._stop_event.set()
+
+
+# 对数线性直方图：每个2的幂区间再线性划分为16个子桶，相对误差不超过1/16
+HISTOGRAM_SUB_BUCKET_BITS = 4
+HISTOGRAM_SUB_BUCKETS = 1 << HISTOGRAM_SUB_BUCKET_BITS
+
+
+def histogram_index(value_ms: float) -> int:
+    """将毫秒值映射为直方图桶序号（内部以微秒计）"""
+    value = int(value_ms * 1000) if value_ms > 0 else 0
+    if value < HISTOGRAM_SUB_BUCKETS:
+        return value
+    shift = value.bit_length() - 1 - HISTOGRAM_SUB_BUCKET_BITS
+    return (shift + 1) * HISTOGRAM_SUB_BUCKETS + (value >> shift) - HISTOGRAM_SUB_BUCKETS
+
+
+def histogram_bounds(index: int) -> Tuple[float, float]:
+    """桶序号对应的毫秒区间 [下界, 上界)"""
+    if index < HISTOGRAM_SUB_BUCKETS:
+        return index / 1000.0, (index + 1) / 1000.0
+    shift = index // HISTOGRAM_SUB_BUCKETS - 1
+    mantissa = index % HISTOGRAM_SUB_BUCKETS + HISTOGRAM_SUB_BUCKETS
+    return (mantissa << shift) / 1000.0, ((mantissa + 1) << shift) / 1000.0
+
+
+def histogram_percentiles(histogram: Dict[int, int], percentiles=(50, 95, 99)) -> Dict[str, float]:
+    """从桶计数估算分位数（取桶区间中点）"""
+    total = sum(histogram.values())
+    result = {f'p{p}': 0.0 for p in percentiles}
+    if not total:
+        return result
+    
+    indexes = sorted(histogram)
+    targets = sorted((max(1, int(round(total * p / 100.0))), f'p{p}') for p in percentiles)
+    cumulative = 0
+    position = 0
+    for index in indexes:
+        cumulative += histogram[index]
+        while position < len(targets) and cumulative >= targets[position][0]:
+            low, high = histogram_bounds(index)
+            result[targets[position][1]] = round((low + high) / 2, 3)
+            position += 1
+        if position == len(targets):
+            break
+    return result
+
+
+# 导出为累积直方图时使用的固定边界（毫秒）
+EXPOSITION_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+def exposition_bucket(value_ms: float) -> int:
+    """值所在的固定边界序号（len(EXPOSITION_BUCKETS_MS)表示+Inf）"""
+    return bisect.bisect_left(EXPOSITION_BUCKETS_MS, value_ms)
+
+
+def status_class(status_code: int) -> str:
+    """状态码分类，如2xx/4xx"""
+    return f'{status_code // 100}xx'
+
+
+class _MetricsSlot:
+    """一个时间桶内的请求统计"""
+    
+    __slots__ = ('second', 'series', 'codes')
+    
+    def __init__(self, second: int):
+        self.second = second
+        self.series = {}  # (端点, 状态码分类) -> [请求数, 响应时间合计, 直方图]
+        self.codes = {}   # 状态码 -> 次数
+
+
 class RequestMetrics:
-    """请求指标统计"""
-    
-    def __init__(self, max_samples: int = 10000):
-        self.max_samples = max_samples
-        self.response_times = deque(maxlen=max_samples)
-        self.request_counts = deque(maxlen=max_samples)
-        self.error_counts = deque(maxlen=max_samples)
-        self.status_codes = deque(maxlen=max_samples)
-        self.endpoints = deque(maxlen=max_samples)
+    """请求指标统计
+    
+    按固定时间桶（默认1秒 x 3600）组成环形缓冲，每个桶按(端点, 状态码分类)
+    维护请求数、响应时间合计和对数线性直方图；查询只需遍历窗口内的桶，内存占用恒定
+    """
+    
+    def __init__(self, window_seconds: int = 3600, resolution: int = 1, max_endpoints: int = 500):
+        self.resolution = resolution
+        self.size = max(1, window_seconds // resolution)
+        self.max_endpoints = max_endpoints
+        self._slots: List[Optional[_MetricsSlot]] = [None] * self.size
+        self._endpoints = set()
+        # 自启动以来的累计值（用于OpenMetrics导出）：
+        # (端点, 状态码分类) -> [请求数, 响应时间合计, 各固定边界的非累积计数]
+        self.totals: Dict[Tuple[str, str], list] = {}
+        self.total_codes: Dict[int, int] = {}
         self.lock = threading.Lock()
     
+    def _add_total(self, key: Tuple[str, str], count: int, total: float, bucket_counts: Dict[int, int]):
+        """累加累计值（调用方需持有锁）"""
+        entry = self.totals.get(key)
+        if entry is None:
+            entry = self.totals[key] = [0, 0.0, [0] * (len(EXPOSITION_BUCKETS_MS) + 1)]
+        entry[0] += count
+        entry[1] += total
+        for bucket, n in bucket_counts.items():
+            entry[2][bucket] += n
+    
+    def current_second(self) -> int:
+        """当前时间桶序号"""
+        return int(time.time() // self.resolution)
+    
+    def _slot_for(self, now: float) -> Optional[_MetricsSlot]:
+        """获取当前时间桶，过期的桶原地重置（调用方需持有锁）"""
+        return self._slot_at(int(now // self.resolution))
+    
+    def _slot_at(self, second: int) -> Optional[_MetricsSlot]:
+        """获取指定序号的时间桶，该位置已被更新的时间桶占用时返回None（调用方需持有锁）"""
+        index = second % self.size
+        slot = self._slots[index]
+        if slot is None or slot.second < second:
+            slot = _MetricsSlot(second)
+            self._slots[index] = slot
+        elif slot.second > second:
+            return None
+        return slot
+    
+    def _recent_slots(self, minutes: float) -> List[_MetricsSlot]:
+        """窗口内的时间桶（调用方需持有锁）"""
+        current = int(time.time() // self.resolution)
+        count = min(self.size, max(1, int(minutes * 60 // self.resolution)))
+        slots = []
+        for second in range(current - count + 1, current + 1):
+            slot = self._slots[second % self.size]
+            if slot is not None and slot.second == second:
+                slots.append(slot)
+        return slots
+    
     def record_request(self, response_time: float, status_code: int, endpoint: str):
         """记录请求指标"""
         with self.lock:
-            timestamp = datetime.now()
+            if endpoint not in self._endpoints:
+                if len(self._endpoints) >= self.max_endpoints:
+                    endpoint = 'other'
+                else:
+                    self._endpoints.add(endpoint)
             
-            self.response_times.append((timestamp, response_time))
-            self.request_counts.append((timestamp, 1))
-            self.error_counts.append((timestamp, 1 if status_code >= 400 else 0))
-            self.status_codes.append((timestamp, status_code))
-            self.endpoints.append((timestamp, endpoint))
+            slot = self._slot_for(time.time())
+            if slot is None:  # 系统时钟回拨
+                return
+            key = (endpoint, status_class(status_code))
+            series = slot.series.get(key)
+            if series is None:
+                series = slot.series[key] = [0, 0.0, {}]
+            series[0] += 1
+            series[1] += response_time
+            bucket = histogram_index(response_time)
+            series[2][bucket] = series[2].get(bucket, 0) + 1
+            slot.codes[status_code] = slot.codes.get(status_code, 0) + 1
+            self._add_total(key, 1, response_time, {exposition_bucket(response_time): 1})
+            self.total_codes[status_code] = self.total_codes.get(status_code, 0) + 1
+    
+    def export_slots(self, after_second: int, before_second: int) -> List[Dict]:
+        """导出序号在 (after_second, before_second) 区间内的非空时间桶（用于跨进程汇总）"""
+        exported = []
+        with self.lock:
+            for second in range(max(after_second + 1, before_second - self.size), before_second):
+                slot = self._slots[second % self.size]
+                if slot is None or slot.second != second or not slot.series:
+                    continue
+                exported.append({
+                    'second': second,
+                    'series': [
+                        [endpoint, cls, count, total, histogram]
+                        for (endpoint, cls), (count, total, histogram) in slot.series.items()
+                    ],
+                    'codes': slot.codes
+                })
+        return exported
+    
+    def merge_slot(self, data: Dict):
+        """合并其他进程导出的时间桶（超出窗口的旧时间桶只计入累计值）"""
+        with self.lock:
+            slot = self._slot_at(int(data['second']))
+            for endpoint, cls, count, total, histogram in data['series']:
+                exposition = {}
+                for bucket, n in histogram.items():
+                    # 以桶中点归入固定边界
+                    low, high = histogram_bounds(int(bucket))
+                    index = exposition_bucket((low + high) / 2)
+                    exposition[index] = exposition.get(index, 0) + n
+                self._add_total((endpoint, cls), count, total, exposition)
+                
+                if slot is None:
+                    continue
+                series = slot.series.get((endpoint, cls))
+                if series is None:
+                    series = slot.series[(endpoint, cls)] = [0, 0.0, {}]
+                series[0] += count
+                series[1] += total
+                target = series[2]
+                for bucket, n in histogram.items():
+                    bucket = int(bucket)
+                    target[bucket] = target.get(bucket, 0) + n
+            for code, n in data['codes'].items():
+                code = int(code)
+                self.total_codes[code] = self.total_codes.get(code, 0) + n
+                if slot is not None:
+                    slot.codes[code] = slot.codes.get(code, 0) + n
+    
+    def _aggregate(self, minutes: float, endpoint: str = None) -> Dict[str, list]:
+        """按端点合并窗口内的统计：端点 -> [请求数, 错误数, 响应时间合计, 直方图]"""
+        result = {}
+        with self.lock:
+            for slot in self._recent_slots(minutes):
+                for (name, cls), (count, total, histogram) in slot.series.items():
+                    if endpoint is not None and name != endpoint:
+                        continue
+                    merged = result.get(name)
+                    if merged is None:
+                        merged = result[name] = [0, 0, 0.0, {}]
+                    merged[0] += count
+                    if cls in ('4xx', '5xx'):
+                        merged[1] += count
+                    merged[2] += total
+                    target = merged[3]
+                    for bucket, n in histogram.items():
+                        target[bucket] = target.get(bucket, 0) + n
+        return result
+    
+    def _totals(self, minutes: float) -> Tuple[int, int, float]:
+        """窗口内的请求数、错误数、响应时间合计"""
+        requests = errors = 0
+        total_time = 0.0
+        with self.lock:
+            for slot in self._recent_slots(minutes):
+                for (_, cls), (count, total, _) in slot.series.items():
+                    requests += count
+                    total_time += total
+                    if cls in ('4xx', '5xx'):
+                        errors += count
+        return requests, errors, total_time
     
     def get_avg_response_time(self, minutes: int = 5) -> float:
         """获取平均响应时间"""
-        cutoff = datetime.now() - timedelta(minutes=minutes)
-        with self.lock:
-            recent_times = [rt for ts, rt in self.response_times if ts >= cutoff]
-            return statistics.mean(recent_times) if recent_times else 0
+        requests, _, total_time = self._totals(minutes)
+        return total_time / requests if requests else 0
     
     def get_request_rate(self, minutes: int = 5) -> float:
         """获取请求速率（每分钟）"""
-        cutoff = datetime.now() - timedelta(minutes=minutes)
-        with self.lock:
-            recent_requests = [1 for ts, _ in self.request_counts if ts >= cutoff]
-            return (len(recent_requests) / minutes) if recent_requests else 0
+        requests, _, _ = self._totals(minutes)
+        return requests / minutes if requests else 0
     
     def get_error_rate(self, minutes: int = 5) -> float:
         """获取错误率"""
-        cutoff = datetime.now() - timedelta(minutes=minutes)
-        with self.lock:
-            recent_errors = [err for ts, err in self.error_counts if ts >= cutoff]
-            total_requests = len(recent_errors)
-            error_requests = sum(recent_errors)
-            return (error_requests / total_requests * 100) if total_requests > 0 else 0
+        requests, errors, _ = self._totals(minutes)
+        return (errors / requests * 100) if requests > 0 else 0
     
     def get_status_distribution(self, minutes: int = 5) -> Dict[int, int]:
         """获取状态码分布"""
-        cutoff = datetime.now() - timedelta(minutes=minutes)
+        distribution = {}
         with self.lock:
-            recent_codes = [code for ts, code in self.status_codes if ts >= cutoff]
-            distribution = {}
-            for code in recent_codes:
-                distribution[code] = distribution.get(code, 0) + 1
-            return distribution
+            for slot in self._recent_slots(minutes):
+                for code, count in slot.codes.items():
+                    distribution[code] = distribution.get(code, 0) + count
+        return distribution
     
     def get_endpoint_stats(self, minutes: int = 5) -> Dict[str, int]:
         """获取端点访问统计"""
-        cutoff = datetime.now() - timedelta(minutes=minutes)
+        stats = {name: merged[0] for name, merged in self._aggregate(minutes).items()}
+        return dict(sorted(stats.items(), key=lambda x: x[1], reverse=True))
+    
+    def snapshot_totals(self) -> Tuple[Dict, Dict]:
+        """累计值的副本：(series, status_codes)"""
         with self.lock:
-            recent_endpoints = [ep for ts, ep in self.endpoints if ts >= cutoff]
-            stats = {}
-            for endpoint in recent_endpoints:
-                stats[endpoint] = stats.get(endpoint, 0) + 1
-            return dict(sorted(stats.items(), key=lambda x: x[1], reverse=True))
+            series = {key: [entry[0], entry[1], list(entry[2])] for key, entry in self.totals.items()}
+            return series, dict(self.total_codes)
+    
+    def get_percentiles(self, minutes: int = 5, endpoint: str = None,
+                        percentiles=(50, 95, 99)) -> Dict[str, float]:
+        """获取响应时间分位数（可按端点过滤）"""
+        histogram = {}
+        for merged in self._aggregate(minutes, endpoint).values():
+            for bucket, n in merged[3].items():
+                histogram[bucket] = histogram.get(bucket, 0) + n
+        return histogram_percentiles(histogram, percentiles)
+    
+    def get_endpoint_latency(self, minutes: int = 5, limit: int = None) -> Dict[str, Dict]:
+        """按端点统计吞吐量、错误率、平均响应时间及p50/p95/p99（按请求数降序）"""
+        result = {}
+        for name, (count, errors, total, histogram) in self._aggregate(minutes).items():
+            stats = {
+                'count': count,
+                'throughput': round(count / minutes, 3),  # 每分钟
+                'error_rate': round(errors / count * 100, 2) if count else 0,
+                'avg_response_time': round(total / count, 3) if count else 0,
+            }
+            stats.update(histogram_percentiles(histogram))
+            result[name] = stats
+        ordered = sorted(result.items(), key=lambda x: x[1]['count'], reverse=True)
+        return dict(ordered[:limit] if limit else ordered)
 
 
 class AlertRule:
@@ -234,8 +563,12 @@ class PerformanceMonitor:
     
     def __init__(self, db_path: str = None):
         self.db_path = db_path or os.path.join(os.getcwd(), 'performance_metrics.db')
+        self.store = TimeSeriesStore(self.db_path)
         self.resource_monitor = ResourceMonitor()
+        self.system_sampler = SystemMetricsSampler()
         self.request_metrics = RequestMetrics()
+        self.aggregator = MetricsAggregator()
+        self.worker_id = None  # gunicorn工作进程序号（post_fork时设置）
         self.alert_rules: List[AlertRule] = []
         self.monitoring = False
         self.monitor_thread = None
@@ -246,31 +579,23 @@ class PerformanceMonitor:
     def _init_database(self):
         """初始化数据库"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                conn.execute('''
-                    CREATE TABLE IF NOT EXISTS performance_metrics (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        metric_type TEXT NOT NULL,
-                        value REAL NOT NULL,
-                        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-                    )
-                ''')
-                
-                conn.execute('''
-                    CREATE TABLE IF NOT EXISTS alerts (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        metric_type TEXT NOT NULL,
-                        threshold_value REAL NOT NULL,
-                        actual_value REAL NOT NULL,
-                        triggered_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                        resolved_at DATETIME
-                    )
-                ''')
-                
-                conn.commit()
+            self.store.init_schema()
         except Exception as e:
             print(f"初始化数据库失败: {e}")
     
+    def init_app(self, app):
+        """从应用配置初始化采样间隔与各分辨率保留期"""
+        self.system_sampler.init_app(app)
+        self.aggregator.init_app(app)
+        self.store.configure(
+            retention_days={
+                'raw': app.config.get('METRICS_RAW_RETENTION_DAYS', 7),
+                '1h': app.config.get('METRICS_HOURLY_RETENTION_DAYS', 90),
+                '1d': app.config.get('METRICS_DAILY_RETENTION_DAYS', 730),
+            },
+            maintenance_interval=app.config.get('METRICS_MAINTENANCE_INTERVAL', 300)
+        )
+    
     def _setup_default_alerts(self):
         """设置默认告警规则"""
         self.alert_rules = [
@@ -300,19 +625,75 @@ class PerformanceMonitor:
         if self.monitor_thread:
             self.monitor_thread.join()
     
+    def after_fork(self, worker_id=None):
+        """gunicorn工作进程fork后调用：丢弃从主进程继承的请求指标与监控线程状态"""
+        self.worker_id = worker_id
+        self.request_metrics = RequestMetrics()
+        self.monitoring = False
+        self.monitor_thread = None
+    
+    def before_exit(self):
+        """工作进程退出前导出尚未汇总的请求指标"""
+        try:
+            self.aggregator.flush(self.request_metrics)
+        except Exception as e:
+            print(f"导出请求指标失败: {e}")
+    
+    def server_metrics(self) -> RequestMetrics:
+        """告警与入库使用的请求指标：收集进程使用全服务器合并指标，否则使用本进程指标"""
+        if self.aggregator.is_collector:
+            return self.aggregator.merged
+        return self.request_metrics
+    
+    @staticmethod
+    def build_application_metrics(metrics: RequestMetrics) -> Dict:
+        """计算应用层指标"""
+        return {
+            'avg_response_time': metrics.get_avg_response_time(),
+            'request_rate': metrics.get_request_rate(),
+            'error_rate': metrics.get_error_rate(),
+            'status_distribution': metrics.get_status_distribution(),
+            'endpoint_stats': metrics.get_endpoint_stats(),
+            'response_time_percentiles': metrics.get_percentiles(),
+            'endpoint_latency': metrics.get_endpoint_latency(limit=20)
+        }
+    
+    def get_application_metrics(self) -> Dict:
+        """应用层指标：优先读取收集进程发布的全服务器汇总，不可用时退化为本进程指标"""
+        summary = self.aggregator.read_summary()
+        if summary is not None:
+            application = dict(summary)
+            application['scope'] = 'server'
+            return application
+        application = self.build_application_metrics(self.request_metrics)
+        application['scope'] = 'worker'
+        application['pid'] = os.getpid()
+        return application
+    
     def _monitor_loop(self, interval: int):
         """监控循环"""
+        # 启动监控的进程（preload模式下为gunicorn主进程）尝试成为指标收集进程
+        try:
+            from app.utils.openmetrics import render_request_metrics
+            self.aggregator.start_collector(
+                RequestMetrics(), self.build_application_metrics, render_request_metrics
+            )
+        except Exception as e:
+            print(f"启动指标收集失败: {e}")
+        
         while self.monitoring:
             try:
-                # 收集系统指标
-                cpu_usage = self.resource_monitor.get_cpu_usage()
-                memory_usage, _ = self.resource_monitor.get_memory_usage()
-                disk_usage, _ = self.resource_monitor.get_disk_usage()
+                # 收集系统指标（读取后台采样快照）
+                system = self.system_sampler.get_snapshot()['system']
+                cpu_usage = system['cpu_usage']
+                memory_usage = system['memory_usage']
+                disk_usage = system['disk_usage']
                 
-                # 收集应用指标
-                avg_response_time = self.request_metrics.get_avg_response_time()
-                error_rate = self.request_metrics.get_error_rate()
-                request_rate = self.request_metrics.get_request_rate()
+                # 收集应用指标（全服务器）
+                request_metrics = self.server_metrics()
+                avg_response_time = request_metrics.get_avg_response_time()
+                error_rate = request_metrics.get_error_rate()
+                request_rate = request_metrics.get_request_rate()
                 
                 # 创建指标对象
                 metrics = [
@@ -343,15 +724,12 @@ class PerformanceMonitor:
             time.sleep(interval)
     
     def _store_metrics(self, metrics: List[PerformanceMetric]):
-        """存储指标到数据库"""
+        """批量存储指标，并按间隔执行降采样与保留期清理"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                for metric in metrics:
-                    conn.execute(
-                        'INSERT INTO performance_metrics (metric_type, value, timestamp) VALUES (?, ?, ?)',
-                        (metric.metric_type, metric.value, metric.timestamp)
-                    )
-                conn.commit()
+            self.store.write_points(
+                (metric.metric_type, metric.value, metric.timestamp) for metric in metrics
+            )
+            self.store.maybe_maintain()
         except Exception as e:
             print(f"存储指标失败: {e}")
     
@@ -367,12 +745,7 @@ class PerformanceMonitor:
         """触发告警"""
         try:
             # 记录到数据库
-            with sqlite3.connect(self.db_path) as conn:
-                conn.execute(
-                    'INSERT INTO alerts (metric_type, threshold_value, actual_value) VALUES (?, ?, ?)',
-                    (rule.metric_type, rule.threshold, actual_value)
-                )
-                conn.commit()
+            self.store.write_alert(rule.metric_type, rule.threshold, actual_value)
             
             # 记录到日志
             if current_app:
@@ -386,65 +759,34 @@ class PerformanceMonitor:
             print(f"触发告警失败: {e}")
     
     def get_current_metrics(self) -> Dict:
-        """获取当前指标"""
-        cpu_usage = self.resource_monitor.get_cpu_usage()
-        memory_usage, memory_info = self.resource_monitor.get_memory_usage()
-        disk_usage, disk_info = self.resource_monitor.get_disk_usage()
-        network_io = self.resource_monitor.get_network_io()
-        process_info = self.resource_monitor.get_process_info()
+        """获取当前指标（系统指标来自后台采样快照，不阻塞请求）"""
+        snapshot = self.system_sampler.get_snapshot()
         
         return {
-            'system': {
-                'cpu_usage': cpu_usage,
-                'memory_usage': memory_usage,
-                'memory_info': memory_info,
-                'disk_usage': disk_usage,
-                'disk_info': disk_info,
-                'network_io': network_io
-            },
-            'process': process_info,
-            'application': {
-                'avg_response_time': self.request_metrics.get_avg_response_time(),
-                'request_rate': self.request_metrics.get_request_rate(),
-                'error_rate': self.request_metrics.get_error_rate(),
-                'status_distribution': self.request_metrics.get_status_distribution(),
-                'endpoint_stats': self.request_metrics.get_endpoint_stats()
-            },
+            'system': snapshot['system'],
+            'process': snapshot['process'],
+            'application': self.get_application_metrics(),
+            'sampled_at': snapshot['sampled_at'],
+            'snapshot_age': snapshot['age_seconds'],
             'timestamp': datetime.now().isoformat()
         }
     
-    def get_historical_metrics(self, metric_type: str, hours: int = 24) -> List[Dict]:
-        """获取历史指标"""
+    def get_historical_metrics(self, metric_type: str, hours: int = 24, resolution: str = None) -> Dict:
+        """获取历史指标，按时间范围自动选择原始点或小时/天汇总
+
+        Returns:
+            {'resolution': 分辨率, 'points': [...]}
+        """
         try:
-            cutoff = datetime.now() - timedelta(hours=hours)
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.execute(
-                    'SELECT value, timestamp FROM performance_metrics WHERE metric_type = ? AND timestamp >= ? ORDER BY timestamp',
-                    (metric_type, cutoff)
-                )
-                return [{'value': row[0], 'timestamp': row[1]} for row in cursor.fetchall()]
+            return self.store.query(metric_type, hours, resolution)
         except Exception as e:
             print(f"获取历史指标失败: {e}")
-            return []
+            return {'resolution': resolution, 'points': []}
     
     def get_alerts(self, hours: int = 24) -> List[Dict]:
         """获取告警记录"""
         try:
-            cutoff = datetime.now() - timedelta(hours=hours)
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.execute(
-                    'SELECT metric_type, threshold_value, actual_value, triggered_at FROM alerts WHERE triggered_at >= ? ORDER BY triggered_at DESC',
-                    (cutoff,)
-                )
-                return [
-                    {
-                        'metric_type': row[0],
-                        'threshold_value': row[1],
-                        'actual_value': row[2],
-                        'triggered_at': row[3]
-                    }
-                    for row in cursor.fetchall()
-                ]
+            return self.store.get_alerts(hours)
         except Exception as e:
             print(f"获取告警记录失败: {e}")
             return []
@@ -452,6 +794,7 @@ class PerformanceMonitor:
     def record_request(self, response_time: float, status_code: int, endpoint: str):
         """记录请求指标"""
         self.request_metrics.record_request(response_time, status_code, endpoint)
+        self.aggregator.ensure_exporter(self.request_metrics)
 
 
 # 创建全局性能监控器实例
@@ -0,0 +1,268 @@
+"""
+权限集缓存
+将用户的角色与权限编译为不可变集合，按进程缓存，并通过共享的权限版本号失效
+"""
+import time
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import get_history
+
+from app import db
+from app.models.user import User, Role, Permission, user_roles, role_permissions
+from app.utils.shared_store import get_shared_store
+
+
+PERMISSION_VERSION_KEY = 'auth:perm_version'
+USER_PERMISSION_VERSION_KEY = 'auth:perm_version:user:{}'
+
+
+@dataclass(frozen=True)
+class PermissionSet:
+    """编译后的用户权限集（附带认证所需的用户状态，缓存命中时无需查询用户表）"""
+    user_id: int
+    permissions: frozenset
+    roles: frozenset
+    version: Optional[str]
+    username: Optional[str] = None
+    status: int = 1
+    locked_until: Optional[datetime] = None
+
+    def has_permission(self, permission_code: str) -> bool:
+        return permission_code in self.permissions
+
+    def has_role(self, role_name: str) -> bool:
+        return role_name in self.roles
+
+    def is_active(self) -> bool:
+        """与User.is_active一致：启用且未处于锁定期"""
+        if self.status != 1:
+            return False
+        return not (self.locked_until and datetime.utcnow() < self.locked_until)
+
+
+class PermissionCache:
+    """进程级权限集缓存（LRU + 版本号 + TTL）"""
+
+    def __init__(self, max_size: int = 2048, ttl: int = 300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # user_id -> (PermissionSet, cached_at)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _configure(self):
+        """从应用配置读取缓存参数"""
+        if has_app_context():
+            self.max_size = current_app.config.get('PERMISSION_CACHE_SIZE', self.max_size)
+            self.ttl = current_app.config.get('PERMISSION_CACHE_TTL', self.ttl)
+
+    def get_version(self, user_id: int) -> Optional[str]:
+        """获取用户当前权限版本号（全局版本.用户版本），共享存储不可用时返回None"""
+        try:
+            global_version, user_version = get_shared_store().get_many([
+                PERMISSION_VERSION_KEY, USER_PERMISSION_VERSION_KEY.format(user_id)
+            ])
+        except Exception as e:
+            if has_app_context():
+                current_app.logger.warning(f"读取权限版本号失败: {str(e)}")
+            return None
+        return f"{int(global_version or 0)}.{int(user_version or 0)}"
+
+    def bump_version(self, user_id: int = None):
+        """递增权限版本号，使所有进程的相关缓存失效
+
+        Args:
+            user_id: 仅影响单个用户时传入，否则递增全局版本
+        """
+        key = USER_PERMISSION_VERSION_KEY.format(user_id) if user_id else PERMISSION_VERSION_KEY
+        try:
+            get_shared_store().incr(key)
+        except Exception as e:
+            if has_app_context():
+                current_app.logger.error(f"递增权限版本号失败: {str(e)}")
+        if user_id:
+            self.invalidate(user_id)
+        else:
+            self.clear()
+
+    def get(self, user_id: int) -> Optional[PermissionSet]:
+        """获取用户权限集，缓存未命中时从数据库编译，用户不存在时返回None"""
+        self._configure()
+        version = self.get_version(user_id)
+        now = time.time()
+
+        if version is None:
+            # 无法确认版本号时不信任任何缓存（其他进程的权限变更可能未被感知），直接查库
+            self.clear()
+            self.misses += 1
+            return self.compile(user_id, None)
+
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None:
+                perm_set, cached_at = entry
+                if perm_set.version == version and now - cached_at < self.ttl:
+                    self._entries.move_to_end(user_id)
+                    self.hits += 1
+                    return perm_set
+                del self._entries[user_id]
+            self.misses += 1
+
+        perm_set = self.compile(user_id, version)
+        if perm_set is None:
+            return None
+
+        with self._lock:
+            self._entries[user_id] = (perm_set, now)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+        return perm_set
+
+    @staticmethod
+    def compile(user_id: int, version: str = '0.0') -> Optional[PermissionSet]:
+        """用单条查询编译用户状态、角色与权限，用户不存在或已删除时返回None"""
+        rows = db.session.query(
+            User.username, User.status, User.locked_until, Role.name, Permission.code
+        ).select_from(User).outerjoin(
+            user_roles, user_roles.c.user_id == User.id
+        ).outerjoin(
+            Role, Role.id == user_roles.c.role_id
+        ).outerjoin(
+            role_permissions, role_permissions.c.role_id == Role.id
+        ).outerjoin(
+            Permission, Permission.id == role_permissions.c.permission_id
+        ).filter(User.id == user_id, User.is_deleted == False).all()
+        if not rows:
+            return None
+
+        username, status, locked_until = rows[0][0], rows[0][1], rows[0][2]
+        roles = frozenset(row[3] for row in rows if row[3])
+        permissions = frozenset(row[4] for row in rows if row[4])
+        return PermissionSet(
+            user_id=user_id, permissions=permissions, roles=roles, version=version,
+            username=username, status=status, locked_until=locked_until
+        )
+
+    def invalidate(self, user_id: int):
+        """移除单个用户的缓存"""
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        """清空本进程缓存"""
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> dict:
+        """获取缓存统计"""
+        total = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': (self.hits / total) if total else 0.0
+        }
+
+
+# 全局权限缓存实例
+permission_cache = PermissionCache()
+
+
+def get_permission_set(user) -> PermissionSet:
+    """获取用户（或用户ID）的权限集"""
+    if isinstance(user, int):
+        return permission_cache.get(user)
+    perm_set = getattr(user, 'permission_set', None)
+    if perm_set is not None:
+        return perm_set
+    return permission_cache.get(user.id)
+
+
+def build_permission_claims(user) -> dict:
+    """生成嵌入JWT的权限快照声明"""
+    perm_set = get_permission_set(user)
+    return {
+        'username': user.username,
+        'perms': sorted(perm_set.permissions),
+        'roles': sorted(perm_set.roles),
+        'perm_version': perm_set.version
+    }
+
+
+def permission_set_from_claims(user_id: int, claims: dict) -> Optional[PermissionSet]:
+    """从JWT声明恢复权限集，版本号过期或无法确认时返回None"""
+    if 'perm_version' not in claims or 'perms' not in claims:
+        return None
+    version = permission_cache.get_version(user_id)
+    if version is None or claims['perm_version'] != version:
+        return None
+    return PermissionSet(
+        user_id=user_id,
+        permissions=frozenset(claims.get('perms') or []),
+        roles=frozenset(claims.get('roles') or []),
+        version=claims['perm_version']
+    )
+
+
+def _affected_scope(obj):
+    """判断对象变更对权限集的影响范围：None-无影响，'all'-全局，int-单个用户"""
+    if isinstance(obj, User):
+        if any(get_history(obj, attr).has_changes()
+               for attr in ('roles', 'status', 'locked_until', 'is_deleted', 'username')):
+            return obj.id
+        return None
+    if isinstance(obj, Role):
+        if any(get_history(obj, attr).has_changes() for attr in ('permissions', 'users', 'name', 'is_deleted')):
+            return 'all'
+        return None
+    if isinstance(obj, Permission):
+        if any(get_history(obj, attr).has_changes() for attr in ('roles', 'code', 'is_deleted')):
+            return 'all'
+    return None
+
+
+@event.listens_for(Session, 'before_flush')
+def _track_permission_changes(session, flush_context, instances):
+    """在flush前记录user_roles/role_permissions及用户状态相关变更"""
+    changed = session.info.setdefault('permission_changes', set())
+    if 'all' in changed:
+        return
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, User) and obj in session.new:
+            continue
+        if isinstance(obj, (Role, Permission)) and (obj in session.new or obj in session.deleted):
+            changed.add('all')
+            return
+        scope = _affected_scope(obj)
+        if scope is not None:
+            changed.add(scope)
+
+
+@event.listens_for(Session, 'after_commit')
+def _bump_after_commit(session):
+    """事务提交后递增权限版本号"""
+    changed = session.info.pop('permission_changes', None)
+    if not changed:
+        return
+    if 'all' in changed:
+        permission_cache.bump_version()
+        return
+    for user_id in changed:
+        permission_cache.bump_version(user_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_after_rollback(session):
+    """事务回滚时丢弃变更标记"""
+    session.info.pop('permission_changes', None)
@@ -0,0 +1,224 @@
+"""
+请求级SQL统计
+通过SQLAlchemy的before/after_cursor_execute事件统计每个请求执行的语句数与耗时，
+按语句形态（参数化SQL，IN列表折叠）识别N+1查询，并支持按端点声明查询预算
+"""
+import re
+import time
+import threading
+from typing import Dict, Optional
+
+from flask import g, request, current_app, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.utils.exceptions import QueryBudgetExceeded
+
+
+# 折叠IN列表中的占位符，使不同长度的IN查询归为同一形态
+IN_LIST_PATTERN = re.compile(r'\(\s*(?:\?|%s|%\(\w+\)s|:\w+)(?:\s*,\s*(?:\?|%s|%\(\w+\)s|:\w+))+\s*\)')
+
+
+def statement_shape(statement: str) -> str:
+    """语句形态"""
+    return IN_LIST_PATTERN.sub('(?...)', statement)
+
+
+def query_budget(max_queries: int = None, max_repeated: int = None):
+    """声明视图的查询预算
+
+    Args:
+        max_queries: 单个请求最多执行的语句数
+        max_repeated: 同一语句形态最多重复执行的次数
+    """
+    def decorator(f):
+        f._query_budget = {'max_queries': max_queries, 'max_repeated': max_repeated}
+        return f
+    return decorator
+
+
+class RequestQueryStats:
+    """单个请求的SQL统计"""
+
+    __slots__ = ('count', 'total_ms', 'shapes')
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.shapes = {}  # 语句形态 -> [次数, 耗时合计]
+
+    def record(self, statement: str, elapsed_ms: float):
+        self.count += 1
+        self.total_ms += elapsed_ms
+        entry = self.shapes.get(statement)
+        if entry is None:
+            entry = self.shapes[statement] = [0, 0.0]
+        entry[0] += 1
+        entry[1] += elapsed_ms
+
+    def repeated(self, threshold: int) -> Dict[str, int]:
+        """重复次数达到阈值的语句形态（按形态折叠后统计）"""
+        merged = {}
+        for statement, (count, _) in self.shapes.items():
+            shape = statement_shape(statement)
+            merged[shape] = merged.get(shape, 0) + count
+        return {shape: count for shape, count in merged.items() if count >= threshold}
+
+    def summary(self, top: int = 5) -> Dict:
+        """统计摘要（耗时最多的若干语句）"""
+        slowest = sorted(self.shapes.items(), key=lambda item: item[1][1], reverse=True)[:top]
+        return {
+            'count': self.count,
+            'total_ms': round(self.total_ms, 3),
+            'distinct': len(self.shapes),
+            'top': [
+                {'statement': statement[:500], 'count': count, 'total_ms': round(total, 3)}
+                for statement, (count, total) in slowest
+            ]
+        }
+
+
+class QueryTracker:
+    """SQL埋点与查询预算检查"""
+
+    def __init__(self):
+        self.app = None
+        self._installed = False
+        self._lock = threading.Lock()
+        self._reported = {}  # (端点, 形态) -> 上次告警时间
+        self.stats = {
+            'requests': 0,
+            'queries': 0,
+            'n_plus_one': 0,
+            'budget_exceeded': 0,
+        }
+
+    def init_app(self, app):
+        self.app = app
+        if not app.config.get('SQL_INSTRUMENTATION_ENABLED', True):
+            return
+        with self._lock:
+            if not self._installed:
+                event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+                event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+                self._installed = True
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+
+    # ---------- 事件 ----------
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if has_request_context():
+            conn.info.setdefault('_query_start', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if not has_request_context():
+            return
+        starts = conn.info.get('_query_start')
+        if not starts:
+            return
+        elapsed_ms = (time.perf_counter() - starts.pop()) * 1000
+        stats = getattr(g, '_query_stats', None)
+        if stats is not None:
+            stats.record(statement, elapsed_ms)
+
+    def _before_request(self):
+        g._query_stats = RequestQueryStats()
+
+    def _after_request(self, response):
+        stats = current_request_stats()
+        if stats is None:
+            return response
+
+        self.stats['requests'] += 1
+        self.stats['queries'] += stats.count
+        if self._expose_headers():
+            response.headers['X-DB-Queries'] = str(stats.count)
+            timing = f'db;dur={stats.total_ms:.2f};desc="{stats.count} queries"'
+            existing = response.headers.get('Server-Timing')
+            response.headers['Server-Timing'] = f'{existing}, {timing}' if existing else timing
+
+        self._check(stats)
+        return response
+
+    @staticmethod
+    def _expose_headers() -> bool:
+        """查询统计响应头只在调试/测试环境、开启SQL_QUERY_HEADERS或管理员请求时返回"""
+        app = current_app
+        if app.debug or app.testing or app.config.get('SQL_QUERY_HEADERS', False):
+            return True
+        from app.utils.auth import current_request_user
+
+        user = current_request_user()
+        return user is not None and user.has_role('系统管理员')
+
+    # ---------- 检查 ----------
+
+    def _budget_for(self, endpoint: Optional[str]) -> Dict:
+        """视图装饰器声明优先，其次为SQL_QUERY_BUDGETS配置（键为去掉api.前缀的端点名）"""
+        from app.utils.rate_limit import normalize_endpoint
+
+        view = current_app.view_functions.get(endpoint) if endpoint else None
+        budget = getattr(view, '_query_budget', None)
+        if budget is None and endpoint:
+            budget = current_app.config.get('SQL_QUERY_BUDGETS', {}).get(normalize_endpoint(endpoint))
+        if isinstance(budget, int):
+            budget = {'max_queries': budget, 'max_repeated': None}
+        return budget or {}
+
+    def _check(self, stats: RequestQueryStats):
+        endpoint = request.endpoint
+        threshold = current_app.config.get('SQL_N_PLUS_ONE_THRESHOLD', 5)
+        repeated = stats.repeated(threshold) if stats.count >= threshold else {}
+        for shape, count in repeated.items():
+            self.stats['n_plus_one'] += 1
+            if self._should_report(endpoint, shape):
+                current_app.logger.warning(
+                    f"疑似N+1查询: {endpoint} 同一语句执行{count}次: {shape[:300]}"
+                )
+
+        budget = self._budget_for(endpoint)
+        violations = []
+        max_queries = budget.get('max_queries')
+        if max_queries is not None and stats.count > max_queries:
+            violations.append(f"语句数{stats.count}超过预算{max_queries}")
+        max_repeated = budget.get('max_repeated')
+        if max_repeated is not None:
+            worst = max(stats.repeated(1).values(), default=0)
+            if worst > max_repeated:
+                violations.append(f"同一语句重复{worst}次超过预算{max_repeated}")
+        if not violations:
+            return
+
+        self.stats['budget_exceeded'] += 1
+        message = f"查询预算超限: {endpoint} " + '；'.join(violations)
+        if current_app.config.get('SQL_QUERY_BUDGET_MODE', 'log') == 'raise':
+            raise QueryBudgetExceeded(message, stats.summary())
+        current_app.logger.warning(message)
+
+    def _should_report(self, endpoint: str, shape: str) -> bool:
+        """同一端点同一语句形态在冷却时间内只记录一次日志"""
+        key = (endpoint, shape)
+        now = time.time()
+        with self._lock:
+            last = self._reported.get(key)
+            if last is not None and now - last < 60:
+                return False
+            if len(self._reported) > 10000:
+                self._reported.clear()
+            self._reported[key] = now
+        return True
+
+    def get_stats(self) -> Dict:
+        return dict(self.stats)
+
+
+def current_request_stats() -> Optional[RequestQueryStats]:
+    """当前请求的SQL统计"""
+    if not has_request_context():
+        return None
+    return getattr(g, '_query_stats', None)
+
+
+# 全局SQL统计
+query_tracker = QueryTracker()
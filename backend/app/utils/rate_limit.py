@@ -2,16 +2,32 @@
 API频率限制配置模块
 实现分级频率限制策略，防止暴力攻击和API滥用
 """
-from flask import request, g
+from flask import request
+from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from app.utils.helpers import get_client_ip
 
 
 def get_user_id():
-    """获取当前用户ID用于限制"""
-    if hasattr(g, 'current_user') and g.current_user:
-        return str(g.current_user.id)
+    """获取限流键：携带有效访问令牌时按用户，否则按客户端IP
+
+    限流检查通常先于login_required执行（此时请求尚未认证），
+    因此在键函数中自行解析令牌
+    """
+    from app.utils.auth import current_request_user
+
+    user = current_request_user()
+    if user is not None:
+        return f'user:{user.id}'
+    try:
+        verify_jwt_in_request(optional=True)
+        identity = get_jwt_identity()
+    except Exception:
+        # 令牌过期、无效、已吊销或为刷新令牌时按IP限流
+        identity = None
+    if identity is not None:
+        return f'user:{identity}'
     return get_client_ip(request)
 
 
@@ -68,65 +84,135 @@ class RateLimitConfig:
     ]
 
 
-def create_limiter(app):
-    """创建并配置限流器"""
+    # 共享数据容量：查询与导出类接口按成本从同一预算中扣减，
+    # 重量级接口单次消耗更多额度，避免导出挤占查询容量
+    DATA_CAPACITY_LIMITS = [
+        "6000 per hour",    # 每小时6000单位
+        "600 per minute"    # 每分钟600单位
+    ]
+
+
+# 认证相关端点
+AUTH_ENDPOINTS = [
+    'auth.login', 'auth.refresh', 'auth.change_password',
+    'auth.logout', 'auth.get_profile', 'auth.update_profile'
+]
+
+# 登录端点（最严格）
+LOGIN_ENDPOINTS = ['auth.login']
+
+# 文件上传端点
+UPLOAD_ENDPOINTS = ['file.upload_file']
+
+# 数据导出端点
+EXPORT_ENDPOINTS = [
+    'asset.export_assets', 'port.export_ports', 'maintenance.export_records',
+    'fault.export_faults', 'statistics.export_report'
+]
+
+# 管理员端点
+ADMIN_ENDPOINTS = [
+    'user.create_user', 'user.delete_user', 'user.update_user',
+    'user.assign_roles', 'user.reset_password'
+]
+
+# 查询端点
+QUERY_ENDPOINTS = [
+    'asset.get_assets', 'maintenance.get_records',
+    'fault.get_faults', 'network.get_devices',
+    'statistics.get_overview'
+]
+
+# 端点在共享数据容量中的单次成本（未列出的查询/导出端点分别按1/10计）
+ENDPOINT_COSTS = {
+    'asset.export_assets': 20,
+    'port.export_ports': 20,
+}
+DEFAULT_QUERY_COST = 1
+DEFAULT_EXPORT_COST = 10
+
+
+def create_limiter(app=None):
+    """创建限流器
+
+    存储后端与算法从应用配置读取（RATELIMIT_STORAGE_URI / RATELIMIT_STRATEGY），
+    生产环境使用Redis使各工作进程共享计数，测试环境使用memory://
+    """
     limiter = Limiter(
-        app,
         key_func=get_user_id,
+        app=app,
         default_limits=RateLimitConfig.DEFAULT_LIMITS,
-        storage_uri="memory://",  # 生产环境建议使用Redis
         headers_enabled=True,
         swallow_errors=True  # 不因限流器错误而中断请求
     )
-    
+
     return limiter
 
 
+def normalize_endpoint(endpoint: str) -> str:
+    """去掉主蓝图前缀，如 api.asset.export_assets -> asset.export_assets"""
+    if endpoint and endpoint.startswith('api.'):
+        return endpoint[len('api.'):]
+    return endpoint
+
+
+def get_endpoint_cost(endpoint: str) -> int:
+    """端点在共享数据容量中的单次成本，非查询/导出端点返回0"""
+    if endpoint in ENDPOINT_COSTS:
+        return ENDPOINT_COSTS[endpoint]
+    if endpoint in EXPORT_ENDPOINTS:
+        return DEFAULT_EXPORT_COST
+    if endpoint in QUERY_ENDPOINTS:
+        return DEFAULT_QUERY_COST
+    return 0
+
+
+def bind_endpoint_limits(app, limiter) -> dict:
+    """在蓝图注册完成后，按端点分级绑定频率限制
+
+    非默认分级的端点绑定对应分级限制；查询/导出端点另外按成本共享数据容量。
+    返回 {端点: 绑定的限制描述}
+    """
+    bound = {}
+    for endpoint, view in list(app.view_functions.items()):
+        name = normalize_endpoint(endpoint)
+        limits = get_rate_limit_for_endpoint(name)
+        cost = get_endpoint_cost(name)
+        if limits is RateLimitConfig.DEFAULT_LIMITS and not cost:
+            continue
+
+        wrapped = view
+        descriptions = []
+        if limits is not RateLimitConfig.DEFAULT_LIMITS:
+            wrapped = limiter.limit(";".join(limits))(wrapped)
+            descriptions.extend(limits)
+        if cost:
+            wrapped = limiter.shared_limit(
+                ";".join(RateLimitConfig.DATA_CAPACITY_LIMITS),
+                scope='data_capacity',
+                cost=cost
+            )(wrapped)
+            descriptions.append(f"data_capacity x{cost}")
+
+        app.view_functions[endpoint] = wrapped
+        bound[name] = descriptions
+    return bound
+
+
 def get_rate_limit_for_endpoint(endpoint: str) -> list:
     """根据端点获取相应的频率限制"""
     
-    # 认证相关端点
-    auth_endpoints = [
-        'auth.login', 'auth.refresh', 'auth.change_password',
-        'auth.logout', 'auth.get_profile', 'auth.update_profile'
-    ]
-    
-    # 登录端点（最严格）
-    login_endpoints = ['auth.login']
-    
-    # 文件上传端点
-    upload_endpoints = ['file.upload_file']
-    
-    # 数据导出端点
-    export_endpoints = [
-        'asset.export_assets', 'maintenance.export_records',
-        'fault.export_faults', 'statistics.export_report'
-    ]
-    
-    # 管理员端点
-    admin_endpoints = [
-        'user.create_user', 'user.delete_user', 'user.update_user',
-        'user.assign_roles', 'user.reset_password'
-    ]
-    
-    # 查询端点
-    query_endpoints = [
-        'asset.get_assets', 'maintenance.get_records',
-        'fault.get_faults', 'network.get_devices',
-        'statistics.get_overview'
-    ]
-    
-    if endpoint in login_endpoints:
+    if endpoint in LOGIN_ENDPOINTS:
         return RateLimitConfig.LOGIN_LIMITS
-    elif endpoint in auth_endpoints:
+    elif endpoint in AUTH_ENDPOINTS:
         return RateLimitConfig.AUTH_LIMITS
-    elif endpoint in upload_endpoints:
+    elif endpoint in UPLOAD_ENDPOINTS:
         return RateLimitConfig.UPLOAD_LIMITS
-    elif endpoint in export_endpoints:
+    elif endpoint in EXPORT_ENDPOINTS:
         return RateLimitConfig.EXPORT_LIMITS
-    elif endpoint in admin_endpoints:
+    elif endpoint in ADMIN_ENDPOINTS:
         return RateLimitConfig.ADMIN_LIMITS
-    elif endpoint in query_endpoints:
+    elif endpoint in QUERY_ENDPOINTS:
         return RateLimitConfig.QUERY_LIMITS
     else:
-        return RateLimitConfig.DEFAULT_LIMITS
\ No newline at end of file
+        return RateLimitConfig.DEFAULT_LIMITS
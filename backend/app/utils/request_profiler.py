@@ -0,0 +1,255 @@
+"""
+慢请求采样分析
+后台线程按固定间隔对执行中的请求线程做栈采样：请求运行超过起始阈值后才开始采样（快请求无额外开销），
+另可按1/N比例从请求开始即采样。请求耗时达到告警阈值（或被抽中）时，
+以折叠栈（collapsed stack，可直接用于flamegraph.pl/speedscope）写入文件，并附带路由、参数及SQL摘要
+"""
+import os
+import re
+import sys
+import glob
+import json
+import time
+import random
+import threading
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from flask import g, request, current_app
+
+from app.utils.query_tracker import current_request_stats
+
+
+PROFILE_ID_PATTERN = re.compile(r'^[0-9]{8}-[0-9]{6}-[0-9]+-[0-9]+$')
+SENSITIVE_PARAM_PATTERN = re.compile(r'password|passwd|token|secret|api_key|signature', re.IGNORECASE)
+
+
+def collapse_stack(frame) -> str:
+    """将栈帧转换为折叠栈格式（根在前，以分号分隔）"""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        module = frame.f_globals.get('__name__', '?')
+        names.append(f"{module}:{code.co_name}".replace(';', ':'))
+        frame = frame.f_back
+    names.reverse()
+    return ';'.join(names)
+
+
+class ActiveRequest:
+    """正在执行的请求"""
+
+    __slots__ = ('thread_id', 'started', 'sample_all', 'stacks', 'samples', 'first_sample')
+
+    def __init__(self, thread_id: int, sample_all: bool):
+        self.thread_id = thread_id
+        self.started = time.perf_counter()
+        self.sample_all = sample_all
+        self.stacks = Counter()
+        self.samples = 0
+        self.first_sample = None  # 首次采样相对请求开始的毫秒数
+
+
+class RequestProfiler:
+    """慢请求栈采样器"""
+
+    def __init__(self):
+        self.enabled = True
+        self.output_dir = os.path.join('logs', 'profiles')
+        self.threshold_ms = 2000.0  # 与响应时间告警规则一致
+        self.start_ms = 500.0  # 请求运行超过该时长开始采样
+        self.interval = 0.01  # 采样间隔（秒）
+        self.sample_rate = 0  # 每N个请求抽取一个完整采样，0表示关闭
+        self.max_files = 200
+
+        self._active: Dict[int, ActiveRequest] = {}
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._sequence = 0
+        self.stats = {'profiled': 0, 'samples': 0, 'write_errors': 0}
+
+    def init_app(self, app):
+        self.enabled = app.config.get('PROFILER_ENABLED', True)
+        self.output_dir = app.config.get('PROFILER_OUTPUT_DIR') or self.output_dir
+        self.threshold_ms = app.config.get('PROFILER_THRESHOLD_MS', self.threshold_ms)
+        self.start_ms = min(app.config.get('PROFILER_START_MS', self.start_ms), self.threshold_ms)
+        self.interval = app.config.get('PROFILER_SAMPLE_INTERVAL', self.interval)
+        self.sample_rate = app.config.get('PROFILER_SAMPLE_RATE', self.sample_rate)
+        self.max_files = app.config.get('PROFILER_MAX_FILES', self.max_files)
+        if not self.enabled:
+            return
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+
+    # ---------- 采样线程 ----------
+
+    def _ensure_sampler(self):
+        """按进程惰性启动采样线程（fork后的工作进程在首个请求时启动）"""
+        if self._pid == os.getpid() and self._thread is not None:
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None:
+                return
+            self._pid = os.getpid()
+            self._active = {}
+            self._wakeup = threading.Event()
+            self._thread = threading.Thread(target=self._sample_loop, name='request-profiler', daemon=True)
+            self._thread.start()
+
+    def _sample_loop(self):
+        while True:
+            if not self._active:
+                # 没有执行中的请求时阻塞等待
+                self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+            time.sleep(self.interval)
+            try:
+                self.sample()
+            except Exception as e:
+                print(f"请求栈采样失败: {e}")
+
+    def sample(self):
+        """对达到采样条件的请求线程采样一次"""
+        start_seconds = self.start_ms / 1000.0
+        now = time.perf_counter()
+        frames = None
+        for active in list(self._active.values()):
+            elapsed = now - active.started
+            if not active.sample_all and elapsed < start_seconds:
+                continue
+            if frames is None:
+                frames = sys._current_frames()
+            frame = frames.get(active.thread_id)
+            if frame is None:
+                continue
+            active.stacks[collapse_stack(frame)] += 1
+            active.samples += 1
+            if active.first_sample is None:
+                active.first_sample = elapsed * 1000
+            self.stats['samples'] += 1
+
+    # ---------- 请求钩子 ----------
+
+    def _before_request(self):
+        self._ensure_sampler()
+        sample_all = bool(self.sample_rate) and random.randrange(self.sample_rate) == 0
+        active = ActiveRequest(threading.get_ident(), sample_all)
+        g._profile = active
+        self._active[active.thread_id] = active
+        self._wakeup.set()
+
+    def _after_request(self, response):
+        active = getattr(g, '_profile', None)
+        if active is None:
+            return response
+        self._active.pop(active.thread_id, None)
+        duration_ms = (time.perf_counter() - active.started) * 1000
+        if active.samples and (duration_ms >= self.threshold_ms or active.sample_all):
+            try:
+                self.write_profile(active, duration_ms, response.status_code)
+            except Exception as e:
+                self.stats['write_errors'] += 1
+                current_app.logger.error(f"写入请求采样文件失败: {str(e)}")
+        return response
+
+    def _teardown_request(self, exception=None):
+        # 视图抛出未处理异常时after_request不会执行
+        active = getattr(g, '_profile', None)
+        if active is not None:
+            self._active.pop(active.thread_id, None)
+
+    # ---------- 文件 ----------
+
+    def _request_params(self) -> Dict:
+        params = {}
+        for key, values in request.args.lists():
+            if SENSITIVE_PARAM_PATTERN.search(key):
+                params[key] = '***'
+            else:
+                params[key] = values[0] if len(values) == 1 else values
+        return params
+
+    def write_profile(self, active: ActiveRequest, duration_ms: float, status_code: int) -> str:
+        """写入折叠栈文件及元数据，返回采样文件ID"""
+        os.makedirs(self.output_dir, exist_ok=True)
+        with self._lock:
+            self._sequence += 1
+            profile_id = f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{self._sequence}"
+
+        query_stats = current_request_stats()
+        metadata = {
+            'id': profile_id,
+            'created_at': datetime.now().isoformat(),
+            'method': request.method,
+            'path': request.path,
+            'endpoint': request.endpoint,
+            'view_args': request.view_args or {},
+            'params': self._request_params(),
+            'status_code': status_code,
+            'duration_ms': round(duration_ms, 2),
+            'reason': 'slow' if duration_ms >= self.threshold_ms else 'sampled',
+            'sampled_from_ms': round(active.first_sample or 0, 2),
+            'sample_interval_ms': self.interval * 1000,
+            'samples': active.samples,
+            'sql': query_stats.summary() if query_stats is not None else None,
+            'pid': os.getpid(),
+        }
+
+        base = os.path.join(self.output_dir, profile_id)
+        with open(base + '.collapsed', 'w', encoding='utf-8') as f:
+            for stack, count in active.stacks.most_common():
+                f.write(f'{stack} {count}\n')
+        with open(base + '.json', 'w', encoding='utf-8') as f:
+            json.dump(metadata, f, ensure_ascii=False, default=str)
+
+        self.stats['profiled'] += 1
+        self._apply_retention()
+        return profile_id
+
+    def _apply_retention(self):
+        """只保留最新的max_files个采样"""
+        paths = sorted(glob.glob(os.path.join(self.output_dir, '*.json')), key=os.path.getmtime)
+        for path in paths[:max(0, len(paths) - self.max_files)]:
+            for suffix in ('.json', '.collapsed'):
+                try:
+                    os.remove(path[:-len('.json')] + suffix)
+                except OSError:
+                    pass
+
+    def list_profiles(self, limit: int = 50, endpoint: str = None) -> List[Dict]:
+        """采样列表（按时间倒序）"""
+        paths = sorted(glob.glob(os.path.join(self.output_dir, '*.json')), key=os.path.getmtime, reverse=True)
+        profiles = []
+        for path in paths:
+            try:
+                with open(path, encoding='utf-8') as f:
+                    metadata = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if endpoint and metadata.get('endpoint') != endpoint:
+                continue
+            profiles.append(metadata)
+            if len(profiles) >= limit:
+                break
+        return profiles
+
+    def profile_path(self, profile_id: str, kind: str = 'collapsed') -> Optional[str]:
+        """采样文件路径，ID不合法或文件不存在时返回None"""
+        if not PROFILE_ID_PATTERN.match(profile_id or '') or kind not in ('collapsed', 'json'):
+            return None
+        path = os.path.abspath(os.path.join(self.output_dir, f'{profile_id}.{kind}'))
+        return path if os.path.exists(path) else None
+
+    def get_stats(self) -> Dict:
+        stats = dict(self.stats)
+        stats['active'] = len(self._active)
+        return stats
+
+
+# 全局慢请求采样器
+request_profiler = RequestProfiler()
@@ -51,6 +51,25 @@ class ApiResponse:
         }
         return jsonify(response)
     
+    @staticmethod
+    def cursor_success(data: list, next_cursor: Optional[str], page_size: int = 20,
+                       total: Optional[int] = None, message: str = "查询成功") -> Dict:
+        """游标分页成功响应"""
+        response = {
+            "code": 200,
+            "success": True,
+            "message": message,
+            "data": {
+                "list": data,
+                "next_cursor": next_cursor,
+                "has_more": next_cursor is not None,
+                "page_size": page_size,
+                "total": total
+            },
+            "timestamp": __import__('datetime').datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        }
+        return jsonify(response)
+    
     @staticmethod
     def unauthorized(message: str = "未授权访问") -> Dict:
         """未授权响应"""
@@ -0,0 +1,349 @@
+"""
+共享状态存储
+为多个gunicorn工作进程提供共享的键值、计数器和版本号
+
+配置Redis（REDIS_URL）时始终使用Redis：连接失败后按指数退避重试，退避期间的调用
+立即抛出SharedStoreUnavailable，由调用方决定降级方式（安全相关的调用方按失败关闭处理），
+降级状态通过store_status()暴露给健康检查。未配置Redis或测试环境使用进程内存储
+"""
+import os
+import time
+import threading
+from typing import Optional, Any
+
+from flask import current_app, has_app_context
+
+try:
+    import redis
+    HAS_REDIS = True
+except ImportError:
+    HAS_REDIS = False
+
+
+class SharedStoreUnavailable(Exception):
+    """共享存储暂不可用"""
+
+
+class MemoryStore:
+    """进程内存储（测试环境及Redis不可用时的替代实现）"""
+
+    backend = 'memory'
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def _get_alive(self, key: str):
+        """获取未过期的条目（调用方需持有锁）"""
+        item = self._data.get(key)
+        if item is None:
+            return None
+        value, expires_at = item
+        if expires_at is not None and expires_at <= time.time():
+            del self._data[key]
+            return None
+        return item
+
+    def get(self, key: str) -> Optional[Any]:
+        """获取值"""
+        with self._lock:
+            item = self._get_alive(key)
+            return item[0] if item else None
+
+    def set(self, key: str, value: Any, ttl: int = None):
+        """设置值，ttl为过期秒数"""
+        with self._lock:
+            expires_at = time.time() + ttl if ttl else None
+            self._data[key] = (value, expires_at)
+
+    def get_many(self, keys) -> list:
+        """批量获取值"""
+        with self._lock:
+            result = []
+            for key in keys:
+                item = self._get_alive(key)
+                result.append(item[0] if item else None)
+            return result
+
+    def add(self, key: str, value: Any, ttl: int = None) -> bool:
+        """仅在键不存在时设置（用于跨进程互斥），成功返回True"""
+        with self._lock:
+            if self._get_alive(key) is not None:
+                return False
+            self._data[key] = (value, time.time() + ttl if ttl else None)
+            return True
+
+    def delete(self, key: str):
+        """删除值"""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def incr(self, key: str, amount: int = 1, ttl: int = None) -> int:
+        """原子递增，首次创建时设置过期时间"""
+        with self._lock:
+            item = self._get_alive(key)
+            if item is None:
+                expires_at = time.time() + ttl if ttl else None
+                value = amount
+            else:
+                value = int(item[0]) + amount
+                expires_at = item[1]
+            self._data[key] = (value, expires_at)
+            return value
+
+    def zadd_capped(self, key: str, member: str, score: float, max_size: int, ttl: int = None):
+        """写入有序集合成员，超过容量时淘汰分值最低的成员，并刷新过期时间"""
+        with self._lock:
+            item = self._get_alive(key)
+            members = item[0] if item else {}
+            members[member] = score
+            if len(members) > max_size:
+                for old in sorted(members, key=members.get)[:len(members) - max_size]:
+                    del members[old]
+            self._data[key] = (members, time.time() + ttl if ttl else None)
+
+    def zscore(self, key: str, member: str) -> Optional[float]:
+        """获取有序集合成员分值"""
+        with self._lock:
+            item = self._get_alive(key)
+            return item[0].get(member) if item else None
+
+    def zcard(self, key: str) -> int:
+        """获取有序集合大小"""
+        with self._lock:
+            item = self._get_alive(key)
+            return len(item[0]) if item else 0
+
+    def zrangebyscore(self, key: str, min_score: float) -> list:
+        """获取分值大于min_score的成员"""
+        with self._lock:
+            item = self._get_alive(key)
+            if not item:
+                return []
+            return [member for member, score in item[0].items() if score > min_score]
+
+    def zremrangebyscore(self, key: str, max_score: float) -> int:
+        """删除分值不大于max_score的成员，返回删除数量"""
+        with self._lock:
+            item = self._get_alive(key)
+            if not item:
+                return 0
+            expired = [member for member, score in item[0].items() if score <= max_score]
+            for member in expired:
+                del item[0][member]
+            return len(expired)
+
+    def ping(self) -> bool:
+        return True
+
+
+class RedisStore:
+    """基于Redis的共享存储（带指数退避的断路器）"""
+
+    backend = 'redis'
+
+    def __init__(self, url: str, retry_base: float = 0.5, retry_max: float = 30.0):
+        self.client = redis.Redis.from_url(
+            url,
+            decode_responses=True,
+            socket_timeout=0.5,
+            socket_connect_timeout=0.5
+        )
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._retry_at = 0.0
+        self.degraded_since = None
+        self.last_error = None
+
+    @property
+    def available(self) -> bool:
+        return self._failures == 0
+
+    def _call(self, func, *args, **kwargs):
+        """执行Redis命令：退避期间直接失败，失败时延长退避，成功时恢复"""
+        if self._failures and time.time() < self._retry_at:
+            raise SharedStoreUnavailable(f"Redis不可用（{self.last_error}），退避中")
+        try:
+            result = func(*args, **kwargs)
+        except redis.RedisError as e:
+            with self._lock:
+                self._failures += 1
+                delay = min(self.retry_max, self.retry_base * (2 ** (self._failures - 1)))
+                self._retry_at = time.time() + delay
+                self.last_error = str(e)
+                if self.degraded_since is None:
+                    self.degraded_since = time.time()
+            raise SharedStoreUnavailable(str(e)) from e
+        if self._failures:
+            with self._lock:
+                self._failures = 0
+                self.degraded_since = None
+        return result
+
+    def _pipeline(self, build):
+        def execute():
+            pipe = self.client.pipeline()
+            build(pipe)
+            return pipe.execute()
+        return self._call(execute)
+
+    def get(self, key: str) -> Optional[Any]:
+        return self._call(self.client.get, key)
+
+    def get_many(self, keys) -> list:
+        return self._call(self.client.mget, keys)
+
+    def set(self, key: str, value: Any, ttl: int = None):
+        self._call(self.client.set, key, value, ex=ttl)
+
+    def add(self, key: str, value: Any, ttl: int = None) -> bool:
+        return bool(self._call(self.client.set, key, value, ex=ttl, nx=True))
+
+    def delete(self, key: str):
+        self._call(self.client.delete, key)
+
+    def incr(self, key: str, amount: int = 1, ttl: int = None) -> int:
+        def build(pipe):
+            pipe.incrby(key, amount)
+            if ttl:
+                # 仅在键无过期时间时设置，避免滑动续期
+                pipe.expire(key, ttl, nx=True)
+        return int(self._pipeline(build)[0])
+
+    def zadd_capped(self, key: str, member: str, score: float, max_size: int, ttl: int = None):
+        def build(pipe):
+            pipe.zadd(key, {member: score})
+            pipe.zremrangebyrank(key, 0, -(max_size + 1))
+            if ttl:
+                pipe.expire(key, ttl)
+        self._pipeline(build)
+
+    def zscore(self, key: str, member: str) -> Optional[float]:
+        return self._call(self.client.zscore, key, member)
+
+    def zcard(self, key: str) -> int:
+        return int(self._call(self.client.zcard, key))
+
+    def zrangebyscore(self, key: str, min_score: float) -> list:
+        return self._call(self.client.zrangebyscore, key, f'({min_score}', '+inf')
+
+    def zremrangebyscore(self, key: str, max_score: float) -> int:
+        return int(self._call(self.client.zremrangebyscore, key, '-inf', max_score))
+
+    def ping(self) -> bool:
+        return bool(self._call(self.client.ping))
+
+    def status(self) -> dict:
+        return {
+            'backend': self.backend,
+            'available': self.available,
+            'degraded': not self.available,
+            'degraded_since': self.degraded_since,
+            'consecutive_failures': self._failures,
+            'retry_in': max(0.0, round(self._retry_at - time.time(), 3)) if self._failures else 0.0,
+            'last_error': self.last_error,
+        }
+
+
+class SlidingWindowCounter:
+    """基于共享存储的分桶滑动窗口计数器
+
+    窗口被划分为若干固定长度的桶，每个桶是一个带TTL的计数键，
+    计数时一次批量读取窗口内所有桶求和，所有工作进程共享同一计数
+    """
+
+    def __init__(self, prefix: str, window: int, bucket_seconds: int = None):
+        self.prefix = prefix
+        self.window = window
+        self.bucket_seconds = bucket_seconds or max(1, window // 10)
+
+    def _keys(self, identity, now: float) -> list:
+        current = int(now // self.bucket_seconds)
+        buckets = max(1, -(-self.window // self.bucket_seconds))
+        return [f"{self.prefix}:{identity}:{current - i}" for i in range(buckets)]
+
+    def hit(self, identity, amount: int = 1) -> int:
+        """计数并返回窗口内的总数（共享存储不可用时退化为本进程计数）"""
+        keys = self._keys(identity, time.time())
+        try:
+            return self._hit(get_shared_store(), keys, amount)
+        except SharedStoreUnavailable:
+            return self._hit(_local_fallback, keys, amount)
+
+    def _hit(self, store, keys: list, amount: int) -> int:
+        store.incr(keys[0], amount, ttl=self.window + self.bucket_seconds)
+        return sum(int(v) for v in store.get_many(keys) if v)
+
+    def count(self, identity) -> int:
+        """返回窗口内的总数"""
+        keys = self._keys(identity, time.time())
+        try:
+            values = get_shared_store().get_many(keys)
+        except SharedStoreUnavailable:
+            values = _local_fallback.get_many(keys)
+        return sum(int(v) for v in values if v)
+
+
+_store = None
+_store_lock = threading.Lock()
+# Redis不可用期间滑动窗口计数器使用的本进程计数（降级状态在store_status中可见）
+_local_fallback = MemoryStore()
+
+
+def _create_store():
+    """根据配置创建存储实例
+
+    配置了Redis时即使首次连接失败也返回Redis存储，由其按退避策略持续重试，
+    不会将进程固定在进程内存储上
+    """
+    if has_app_context():
+        backend = current_app.config.get('SHARED_STORE_BACKEND', 'redis')
+        url = current_app.config.get('REDIS_URL')
+    else:
+        backend = os.environ.get('SHARED_STORE_BACKEND', 'redis')
+        url = os.environ.get('REDIS_URL')
+
+    if backend == 'redis' and HAS_REDIS and url:
+        store = RedisStore(url)
+        try:
+            store.ping()
+        except SharedStoreUnavailable as e:
+            if has_app_context():
+                current_app.logger.error(f"Redis共享存储暂不可用，将按退避策略重试: {str(e)}")
+        return store
+
+    store = MemoryStore()
+    if backend == 'redis':
+        # 期望使用Redis但未能创建，状态中标记为降级
+        store.fallback_reason = '未配置REDIS_URL' if not url else '未安装redis客户端'
+        if has_app_context():
+            current_app.logger.warning(f"{store.fallback_reason}，共享状态仅在本进程内有效")
+    return store
+
+
+def get_shared_store():
+    """获取全局共享存储实例"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = _create_store()
+    return _store
+
+
+def store_status() -> dict:
+    """共享存储状态（用于健康检查）"""
+    store = get_shared_store()
+    if hasattr(store, 'status'):
+        return store.status()
+    reason = getattr(store, 'fallback_reason', None)
+    return {'backend': store.backend, 'available': True, 'degraded': bool(reason), 'last_error': reason}
+
+
+def reset_shared_store(store=None):
+    """重置共享存储（用于测试或重新配置）"""
+    global _store
+    with _store_lock:
+        _store = store
@@ -0,0 +1,304 @@
+"""
+嵌入式时序指标存储
+基于SQLite（WAL模式），原始点按批写入performance_metrics，
+完整的小时/天自动降采样为min/avg/max/p95汇总，各分辨率按各自保留期清理，
+查询时根据时间范围自动选择分辨率
+"""
+import os
+import math
+import time
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Tuple
+
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+# 分辨率 -> 汇总桶长度
+ROLLUP_RESOLUTIONS = {
+    '1h': timedelta(hours=1),
+    '1d': timedelta(days=1),
+}
+
+
+def format_timestamp(value: datetime) -> str:
+    """统一的时间戳文本格式，保证按字符串比较即按时间比较"""
+    return value.strftime(TIMESTAMP_FORMAT)
+
+
+def bucket_start(value: datetime, resolution: str) -> datetime:
+    """时间所在汇总桶的起点"""
+    if resolution == '1h':
+        return value.replace(minute=0, second=0, microsecond=0)
+    return value.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def percentile(values: List[float], p: float) -> float:
+    """最近秩法计算分位数"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, int(math.ceil(p / 100.0 * len(ordered))))
+    return ordered[rank - 1]
+
+
+class TimeSeriesStore:
+    """时序指标存储"""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        # 各分辨率保留天数（raw为原始采样点）
+        self.retention_days = {'raw': 7, '1h': 90, '1d': 730}
+        # 查询范围不超过该小时数时使用对应分辨率
+        self.resolution_thresholds = [('raw', 24), ('1h', 24 * 30)]
+        self.maintenance_interval = 300
+
+        self._local = threading.local()
+        self._pid = None
+        self._next_maintenance = 0.0
+        self._maintenance_lock = threading.Lock()
+
+    def configure(self, retention_days: Dict[str, int] = None, maintenance_interval: int = None):
+        if retention_days:
+            self.retention_days.update(retention_days)
+        if maintenance_interval is not None:
+            self.maintenance_interval = maintenance_interval
+
+    # ---------- 连接 ----------
+
+    def connection(self) -> sqlite3.Connection:
+        """线程级复用的连接（fork后重新建立）"""
+        if self._pid != os.getpid():
+            self._local = threading.local()
+            self._pid = os.getpid()
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def init_schema(self):
+        """建表及索引"""
+        conn = self.connection()
+        with conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS performance_metrics (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    metric_type TEXT NOT NULL,
+                    value REAL NOT NULL,
+                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            conn.execute('''
+                CREATE INDEX IF NOT EXISTS ix_performance_metrics_type_time
+                ON performance_metrics (metric_type, timestamp)
+            ''')
+            # 降采样与保留期清理按时间范围扫描
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_performance_metrics_time ON performance_metrics (timestamp)')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS performance_metric_rollups (
+                    metric_type TEXT NOT NULL,
+                    resolution TEXT NOT NULL,
+                    bucket_start DATETIME NOT NULL,
+                    min_value REAL NOT NULL,
+                    avg_value REAL NOT NULL,
+                    max_value REAL NOT NULL,
+                    p95_value REAL NOT NULL,
+                    sample_count INTEGER NOT NULL,
+                    PRIMARY KEY (metric_type, resolution, bucket_start)
+                ) WITHOUT ROWID
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS alerts (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    metric_type TEXT NOT NULL,
+                    threshold_value REAL NOT NULL,
+                    actual_value REAL NOT NULL,
+                    triggered_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    resolved_at DATETIME
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_alerts_triggered_at ON alerts (triggered_at)')
+
+    # ---------- 写入 ----------
+
+    def write_points(self, points: Iterable[Tuple[str, float, datetime]]):
+        """在一个事务中批量写入原始点 (metric_type, value, timestamp)"""
+        rows = [(metric_type, value, format_timestamp(timestamp)) for metric_type, value, timestamp in points]
+        if not rows:
+            return
+        conn = self.connection()
+        with conn:
+            conn.executemany(
+                'INSERT INTO performance_metrics (metric_type, value, timestamp) VALUES (?, ?, ?)',
+                rows
+            )
+
+    def write_alert(self, metric_type: str, threshold: float, actual_value: float):
+        conn = self.connection()
+        with conn:
+            conn.execute(
+                'INSERT INTO alerts (metric_type, threshold_value, actual_value, triggered_at) VALUES (?, ?, ?, ?)',
+                (metric_type, threshold, actual_value, format_timestamp(datetime.now()))
+            )
+
+    # ---------- 降采样与保留期 ----------
+
+    def maybe_maintain(self, now: datetime = None):
+        """按间隔执行降采样与清理"""
+        if time.time() < self._next_maintenance:
+            return
+        if not self._maintenance_lock.acquire(blocking=False):
+            return
+        try:
+            self._next_maintenance = time.time() + self.maintenance_interval
+            self.rollup(now=now)
+            self.apply_retention(now=now)
+        finally:
+            self._maintenance_lock.release()
+
+    def rollup(self, now: datetime = None) -> Dict[str, int]:
+        """将已完整结束的小时/天从原始点汇总为min/avg/max/p95，返回各分辨率新增桶数"""
+        now = now or datetime.now()
+        conn = self.connection()
+        created = {}
+        for resolution, span in ROLLUP_RESOLUTIONS.items():
+            last = conn.execute(
+                'SELECT MAX(bucket_start) FROM performance_metric_rollups WHERE resolution = ?',
+                (resolution,)
+            ).fetchone()[0]
+            if last:
+                start = datetime.strptime(last, TIMESTAMP_FORMAT) + span
+            else:
+                oldest = conn.execute('SELECT MIN(timestamp) FROM performance_metrics').fetchone()[0]
+                if not oldest:
+                    created[resolution] = 0
+                    continue
+                start = bucket_start(datetime.fromisoformat(oldest), resolution)
+            end = bucket_start(now, resolution)  # 当前未结束的桶不汇总
+
+            count = 0
+            with conn:
+                while start < end:
+                    # 跳过没有原始点的区间
+                    following = conn.execute(
+                        'SELECT MIN(timestamp) FROM performance_metrics WHERE timestamp >= ?',
+                        (format_timestamp(start),)
+                    ).fetchone()[0]
+                    if not following:
+                        break
+                    start = max(start, bucket_start(datetime.fromisoformat(following), resolution))
+                    if start >= end:
+                        break
+                    count += self._rollup_bucket(conn, resolution, start, start + span)
+                    start += span
+            created[resolution] = count
+        return created
+
+    def _rollup_bucket(self, conn, resolution: str, start: datetime, end: datetime) -> int:
+        rows = conn.execute(
+            'SELECT metric_type, value FROM performance_metrics WHERE timestamp >= ? AND timestamp < ?',
+            (format_timestamp(start), format_timestamp(end))
+        ).fetchall()
+        series = {}
+        for metric_type, value in rows:
+            series.setdefault(metric_type, []).append(value)
+
+        records = [
+            (metric_type, resolution, format_timestamp(start), min(values),
+             sum(values) / len(values), max(values), percentile(values, 95), len(values))
+            for metric_type, values in series.items()
+        ]
+        conn.executemany(
+            'INSERT OR REPLACE INTO performance_metric_rollups '
+            '(metric_type, resolution, bucket_start, min_value, avg_value, max_value, p95_value, sample_count) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            records
+        )
+        return len(records)
+
+    def apply_retention(self, now: datetime = None) -> Dict[str, int]:
+        """按分辨率删除超过保留期的数据，返回各分辨率删除行数"""
+        now = now or datetime.now()
+        conn = self.connection()
+        deleted = {}
+        with conn:
+            cutoff = format_timestamp(now - timedelta(days=self.retention_days['raw']))
+            deleted['raw'] = conn.execute(
+                'DELETE FROM performance_metrics WHERE timestamp < ?', (cutoff,)
+            ).rowcount
+            for resolution in ROLLUP_RESOLUTIONS:
+                cutoff = format_timestamp(now - timedelta(days=self.retention_days[resolution]))
+                deleted[resolution] = conn.execute(
+                    'DELETE FROM performance_metric_rollups WHERE resolution = ? AND bucket_start < ?',
+                    (resolution, cutoff)
+                ).rowcount
+            cutoff = format_timestamp(now - timedelta(days=self.retention_days['1h']))
+            conn.execute('DELETE FROM alerts WHERE triggered_at < ?', (cutoff,))
+        return deleted
+
+    # ---------- 查询 ----------
+
+    def select_resolution(self, hours: float) -> str:
+        """根据查询范围选择分辨率（不超过该分辨率的保留期）"""
+        for resolution, max_hours in self.resolution_thresholds:
+            if hours <= max_hours and hours <= self.retention_days[resolution] * 24:
+                return resolution
+        return '1d'
+
+    def query(self, metric_type: str, hours: float = 24, resolution: str = None) -> Dict:
+        """查询指标历史
+
+        Returns:
+            {'resolution': 分辨率, 'points': [...]}，汇总分辨率的点包含min/max/p95/count
+        """
+        resolution = resolution or self.select_resolution(hours)
+        cutoff = format_timestamp(datetime.now() - timedelta(hours=hours))
+        conn = self.connection()
+        if resolution == 'raw':
+            rows = conn.execute(
+                'SELECT value, timestamp FROM performance_metrics '
+                'WHERE metric_type = ? AND timestamp >= ? ORDER BY timestamp',
+                (metric_type, cutoff)
+            ).fetchall()
+            points = [{'value': row[0], 'timestamp': row[1]} for row in rows]
+        else:
+            rows = conn.execute(
+                'SELECT bucket_start, min_value, avg_value, max_value, p95_value, sample_count '
+                'FROM performance_metric_rollups '
+                'WHERE metric_type = ? AND resolution = ? AND bucket_start >= ? ORDER BY bucket_start',
+                (metric_type, resolution, format_timestamp(bucket_start(
+                    datetime.strptime(cutoff, TIMESTAMP_FORMAT), resolution)))
+            ).fetchall()
+            points = [
+                {
+                    'timestamp': row[0],
+                    'value': row[2],
+                    'min': row[1],
+                    'max': row[3],
+                    'p95': row[4],
+                    'count': row[5]
+                }
+                for row in rows
+            ]
+        return {'resolution': resolution, 'points': points}
+
+    def get_alerts(self, hours: int = 24) -> List[Dict]:
+        cutoff = format_timestamp(datetime.now() - timedelta(hours=hours))
+        rows = self.connection().execute(
+            'SELECT metric_type, threshold_value, actual_value, triggered_at FROM alerts '
+            'WHERE triggered_at >= ? ORDER BY triggered_at DESC',
+            (cutoff,)
+        ).fetchall()
+        return [
+            {
+                'metric_type': row[0],
+                'threshold_value': row[1],
+                'actual_value': row[2],
+                'triggered_at': row[3]
+            }
+            for row in rows
+        ]
@@ -0,0 +1,239 @@
+"""
+JWT吊销存储
+吊销记录按jti写入共享存储，TTL等于令牌剩余有效期；
+各工作进程维护一个布隆过滤器，版本号变化时按吊销时间游标增量同步、定期全量重建，
+绝大多数请求在进程内即可判定未吊销，只有布隆过滤器命中时才查询共享存储；
+共享存储长时间不可用时按已吊销处理
+"""
+import math
+import time
+import hashlib
+import threading
+from typing import Dict
+
+from flask import current_app, has_app_context
+
+from app.utils.shared_store import get_shared_store
+
+
+REVOKED_KEY_PREFIX = 'jwt:revoked'
+REVOKED_INDEX_KEY = 'jwt:revoked:index'  # 有序集合，成员为jti，分值为令牌过期时间
+REVOKED_LOG_KEY = 'jwt:revoked:log'  # 有序集合，成员为jti，分值为吊销时间（用于增量同步）
+REVOKED_VERSION_KEY = 'jwt:revoked:version'
+
+
+class BloomFilter:
+    """基于bytearray的布隆过滤器，使用双重哈希生成k个位置"""
+
+    __slots__ = ('capacity', 'size', 'hash_count', 'bits', 'count')
+
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        self.capacity = max(1, capacity)
+        self.size = max(8, int(-self.capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size / self.capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        for i in range(self.hash_count):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, item: str):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        bits = self.bits
+        for position in self._positions(item):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+
+class TokenRevocationStore:
+    """JWT吊销存储"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._bloom = BloomFilter(1)
+        self._version = None
+        self._cursor = None
+        self._next_poll = 0.0
+        self._next_full_rebuild = 0.0
+        self._synced_at = 0.0
+        self.stats = {
+            'checks': 0,
+            'bloom_hits': 0,
+            'store_lookups': 0,
+            'revoked_hits': 0,
+            'rebuilds': 0,
+            'incremental_syncs': 0,
+            'store_errors': 0,
+            'stale_rejections': 0,
+        }
+
+    def init_app(self, app, jwt_manager):
+        """注册flask_jwt_extended的吊销检查回调"""
+        jwt_manager.token_in_blocklist_loader(self._check_payload)
+
+    def _config(self, key, default):
+        if has_app_context():
+            return current_app.config.get(key, default)
+        return default
+
+    def _check_payload(self, jwt_header, jwt_payload) -> bool:
+        jti = jwt_payload.get('jti')
+        return bool(jti) and self.is_revoked(jti)
+
+    # ---------- 同步 ----------
+
+    def _refresh_if_needed(self):
+        """按间隔轮询共享版本号，变化时增量同步，定期全量重建"""
+        now = time.time()
+        if now < self._next_poll:
+            return
+        self._next_poll = now + self._config('JWT_REVOCATION_SYNC_INTERVAL', 1.0)
+
+        try:
+            version = get_shared_store().get(REVOKED_VERSION_KEY)
+            if self._cursor is None or now >= self._next_full_rebuild:
+                self.rebuild(version)
+            elif version != self._version:
+                self._sync_since(version, now)
+        except Exception as e:
+            self.stats['store_errors'] += 1
+            if has_app_context():
+                current_app.logger.error(f"同步令牌吊销列表失败: {str(e)}")
+            return
+        self._synced_at = now
+
+    def _sync_since(self, version, now: float):
+        """只拉取游标之后的吊销记录加入布隆过滤器
+
+        吊销日志按吊销时间计分，游标回退一个重叠窗口以容忍进程间时钟偏差与写入先后，
+        重叠部分已在过滤器中的jti不会重复计数
+        """
+        overlap = self._config('JWT_REVOCATION_SYNC_OVERLAP', 5.0)
+        if self._cursor < now - self._config('JWT_REVOCATION_LOG_RETENTION', 3600):
+            # 游标早于日志保留期，日志已不完整，改为全量重建
+            self.rebuild(version)
+            return
+
+        jtis = get_shared_store().zrangebyscore(REVOKED_LOG_KEY, self._cursor - overlap)
+        with self._lock:
+            bloom = self._bloom
+            for jti in jtis:
+                if jti not in bloom:
+                    bloom.add(jti)
+            overloaded = bloom.count > bloom.capacity
+            self._version = version
+            self._cursor = now
+            self.stats['incremental_syncs'] += 1
+        if overloaded:
+            self.rebuild(version)
+
+    def rebuild(self, version=None):
+        """从共享存储加载未过期的jti并重建布隆过滤器，同时清理已过期的索引与日志"""
+        store = get_shared_store()
+        now = time.time()
+        store.zremrangebyscore(REVOKED_INDEX_KEY, now)
+        store.zremrangebyscore(REVOKED_LOG_KEY, now - self._config('JWT_REVOCATION_LOG_RETENTION', 3600))
+        jtis = store.zrangebyscore(REVOKED_INDEX_KEY, now)
+
+        capacity = max(self._config('JWT_REVOCATION_BLOOM_CAPACITY', 100000), len(jtis) * 2)
+        bloom = BloomFilter(capacity, self._config('JWT_REVOCATION_BLOOM_ERROR_RATE', 0.001))
+        for jti in jtis:
+            bloom.add(jti)
+
+        with self._lock:
+            self._bloom = bloom
+            self._version = version
+            self._cursor = now
+            self._next_full_rebuild = now + self._config('JWT_REVOCATION_FULL_REBUILD_INTERVAL', 600)
+            self.stats['rebuilds'] += 1
+
+    # ---------- 查询 ----------
+
+    def is_revoked(self, jti: str) -> bool:
+        """判断令牌是否已吊销：布隆过滤器未命中直接返回，命中时查询共享存储确认
+
+        共享存储持续不可用、本地过滤器超过JWT_REVOCATION_MAX_STALENESS未同步时，
+        无法得知其他进程的吊销，按已吊销处理（失败关闭）
+        """
+        self.stats['checks'] += 1
+        self._refresh_if_needed()
+        if time.time() - self._synced_at > self._config('JWT_REVOCATION_MAX_STALENESS', 30):
+            self.stats['stale_rejections'] += 1
+            return True
+        if jti not in self._bloom:
+            return False
+
+        self.stats['bloom_hits'] += 1
+        self.stats['store_lookups'] += 1
+        try:
+            revoked = get_shared_store().get(f"{REVOKED_KEY_PREFIX}:{jti}") is not None
+        except Exception as e:
+            # 共享存储不可用时对布隆命中的令牌按已吊销处理
+            self.stats['store_errors'] += 1
+            if has_app_context():
+                current_app.logger.error(f"查询令牌吊销状态失败: {str(e)}")
+            revoked = True
+        if revoked:
+            self.stats['revoked_hits'] += 1
+        return revoked
+
+    # ---------- 吊销 ----------
+
+    def revoke(self, jti: str, expires_at: float = None):
+        """吊销令牌
+
+        Args:
+            jti: 令牌ID
+            expires_at: 令牌过期时间戳（exp声明），吊销记录保留到令牌自然过期
+
+        Raises:
+            SharedStoreUnavailable: 共享存储不可用，吊销未能同步到其他进程
+        """
+        now = time.time()
+        if expires_at is None:
+            expires = current_app.config.get('JWT_ACCESS_TOKEN_EXPIRES')
+            expires_at = now + (expires.total_seconds() if expires else 86400)
+        ttl = int(math.ceil(expires_at - now))
+        if ttl <= 0:
+            return
+
+        # 本进程立即生效，其他进程在下次轮询时增量同步
+        with self._lock:
+            self._bloom.add(jti)
+            overloaded = self._bloom.count > self._bloom.capacity
+
+        max_entries = self._config('JWT_REVOCATION_MAX_ENTRIES', 1000000)
+        store = get_shared_store()
+        store.set(f"{REVOKED_KEY_PREFIX}:{jti}", '1', ttl=ttl)
+        store.zadd_capped(REVOKED_INDEX_KEY, jti, expires_at, max_entries)
+        store.zadd_capped(REVOKED_LOG_KEY, jti, now, max_entries)
+        store.incr(REVOKED_VERSION_KEY)
+
+        if overloaded:
+            try:
+                self.rebuild(self._version)
+            except Exception as e:
+                self.stats['store_errors'] += 1
+                if has_app_context():
+                    current_app.logger.error(f"重建令牌吊销过滤器失败: {str(e)}")
+
+    def get_stats(self) -> Dict:
+        stats = dict(self.stats)
+        stats['version'] = self._version
+        stats['bloom_entries'] = self._bloom.count
+        stats['bloom_capacity'] = self._bloom.capacity
+        stats['synced_at'] = self._synced_at
+        return stats
+
+
+# 全局令牌吊销存储
+token_revocation = TokenRevocationStore()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+审计日志分区/归档工具
+
+用法:
+    python audit_archive_tool.py partition            # 补建复合索引并将审计表转换为按月分区（MySQL，一次性）
+    python audit_archive_tool.py retention            # 补齐未来分区并归档过期月份（建议每日cron执行）
+    python audit_archive_tool.py query --table enhanced_audit_log --since 2025-01-01 --user-id 3
+"""
+
+import os
+import sys
+import json
+import argparse
+from datetime import datetime
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import create_app
+from app.utils.audit_archive import audit_archiver, iter_archive, ARCHIVE_TABLES
+
+
+def cmd_partition(args):
+    app = create_app()
+    with app.app_context():
+        for name in audit_archiver.ensure_indexes():
+            print(f"✅ 创建索引: {name}")
+        for table in ARCHIVE_TABLES:
+            try:
+                if audit_archiver.partition_table(table):
+                    print(f"✅ 已转换为按月分区: {table}")
+                else:
+                    print(f"⚠️  {table} 已分区或当前数据库不支持分区，跳过")
+            except Exception as e:
+                print(f"❌ {table} 分区转换失败: {str(e)}")
+                return False
+    return True
+
+
+def cmd_retention(args):
+    app = create_app()
+    with app.app_context():
+        if args.months is not None:
+            audit_archiver._retention_months = args.months
+        summary = audit_archiver.run_retention()
+        for table, results in summary.items():
+            if not results:
+                print(f"✅ {table}: 无过期数据")
+            for item in results:
+                print(f"✅ {table} {item['month']}: 归档 {item['rows']} 行 -> {item['archive']} ({item['method']})")
+    return True
+
+
+def cmd_query(args):
+    archive_dir = args.archive_dir or os.environ.get('AUDIT_ARCHIVE_DIR', 'archive/audit')
+    filters = {}
+    if args.user_id is not None:
+        filters['user_id'] = args.user_id
+    if args.event_type:
+        filters['event_type'] = args.event_type
+    if args.ip:
+        filters['client_ip' if args.table == 'enhanced_audit_log' else 'ip'] = args.ip
+
+    start = datetime.fromisoformat(args.since) if args.since else None
+    end = datetime.fromisoformat(args.until) if args.until else None
+
+    count = 0
+    for record in iter_archive(archive_dir, args.table, start, end, filters):
+        print(json.dumps(record, ensure_ascii=False))
+        count += 1
+        if args.limit and count >= args.limit:
+            break
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description='审计日志分区/归档工具')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    subparsers.add_parser('partition', help='补建索引并将审计表转换为按月分区')
+
+    retention = subparsers.add_parser('retention', help='归档并删除过期月份')
+    retention.add_argument('--months', type=int, help='保留月数（默认读取AUDIT_RETENTION_MONTHS）')
+
+    query = subparsers.add_parser('query', help='查询归档文件')
+    query.add_argument('--table', choices=list(ARCHIVE_TABLES), default='enhanced_audit_log')
+    query.add_argument('--archive-dir', help='归档目录（默认读取AUDIT_ARCHIVE_DIR）')
+    query.add_argument('--since', help='起始时间，ISO格式')
+    query.add_argument('--until', help='结束时间，ISO格式')
+    query.add_argument('--user-id', type=int)
+    query.add_argument('--event-type')
+    query.add_argument('--ip')
+    query.add_argument('--limit', type=int, default=0)
+
+    args = parser.parse_args()
+    handlers = {'partition': cmd_partition, 'retention': cmd_retention, 'query': cmd_query}
+    sys.exit(0 if handlers[args.command](args) else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -44,6 +44,23 @@ class Config:
             JWT_SECRET_KEY = 'dev-jwt-' + secrets.token_urlsafe(32)
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(hours=24)
     JWT_REFRESH_TOKEN_EXPIRES = timedelta(days=30)
+    # JWT吊销：进程内布隆过滤器按间隔（秒）从共享存储同步
+    JWT_REVOCATION_SYNC_INTERVAL = float(os.environ.get('JWT_REVOCATION_SYNC_INTERVAL', '1.0'))
+    JWT_REVOCATION_BLOOM_CAPACITY = int(os.environ.get('JWT_REVOCATION_BLOOM_CAPACITY', '100000'))
+    JWT_REVOCATION_BLOOM_ERROR_RATE = 0.001
+    JWT_REVOCATION_FULL_REBUILD_INTERVAL = int(os.environ.get('JWT_REVOCATION_FULL_REBUILD_INTERVAL', '600'))  # 全量重建间隔(秒)
+    JWT_REVOCATION_SYNC_OVERLAP = 5.0  # 增量同步游标回退窗口，容忍进程间时钟偏差(秒)
+    JWT_REVOCATION_LOG_RETENTION = int(os.environ.get('JWT_REVOCATION_LOG_RETENTION', '3600'))  # 增量同步日志保留时长(秒)
+    JWT_REVOCATION_MAX_STALENESS = int(os.environ.get('JWT_REVOCATION_MAX_STALENESS', '30'))  # 超过该时长未同步则拒绝所有令牌(秒)
+    # 在访问令牌中嵌入权限快照（通过共享存储中的权限版本号实时撤销）
+    JWT_EMBED_PERMISSIONS = os.environ.get('JWT_EMBED_PERMISSIONS', 'false').lower() in ['true', 'on', '1']
+    
+    # 密码哈希配置（独立进程池，避免阻塞请求工作线程）
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:600000')
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', '1'))
+    # 每个gunicorn工作进程同时进行的哈希数，须小于其线程数（gunicorn.conf.py threads=2）
+    PASSWORD_HASH_MAX_INFLIGHT = int(os.environ.get('PASSWORD_HASH_MAX_INFLIGHT', '1'))
+    PASSWORD_HASH_TIMEOUT = int(os.environ.get('PASSWORD_HASH_TIMEOUT', '10'))  # 秒
     
     # 文件上传配置
     UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER') or os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'uploads')
@@ -52,6 +69,18 @@ class Config:
     
     # Redis配置
     REDIS_URL = os.environ.get('REDIS_URL') or 'redis://localhost:6379/0'
+    SHARED_STORE_BACKEND = os.environ.get('SHARED_STORE_BACKEND', 'redis')  # redis/memory
+    
+    # 频率限制配置（Redis共享计数，滑动窗口算法；Redis不可用时退化为进程内计数）
+    RATELIMIT_STORAGE_URI = os.environ.get('RATELIMIT_STORAGE_URI') or \
+        (REDIS_URL if SHARED_STORE_BACKEND == 'redis' else 'memory://')
+    RATELIMIT_STRATEGY = os.environ.get('RATELIMIT_STRATEGY', 'moving-window')
+    RATELIMIT_KEY_PREFIX = 'ratelimit'
+    RATELIMIT_IN_MEMORY_FALLBACK_ENABLED = True
+    
+    # 权限缓存配置
+    PERMISSION_CACHE_SIZE = int(os.environ.get('PERMISSION_CACHE_SIZE', '2048'))
+    PERMISSION_CACHE_TTL = int(os.environ.get('PERMISSION_CACHE_TTL', '300'))  # 秒
     
     # CORS配置
     ALLOWED_ORIGINS = os.environ.get('ALLOWED_ORIGINS', 'http://localhost:3000,http://127.0.0.1:3000,http://localhost:3001,http://127.0.0.1:3001,http://localhost:3002,http://127.0.0.1:3002,http://localhost:3003,http://127.0.0.1:3003').split(',')
@@ -86,6 +115,54 @@ class Config:
     ANOMALY_DETECTION_SENSITIVITY = os.environ.get('ANOMALY_DETECTION_SENSITIVITY', 'medium')
     MAX_LOGIN_ATTEMPTS = int(os.environ.get('MAX_LOGIN_ATTEMPTS', '5'))
     ACCOUNT_LOCKOUT_DURATION = int(os.environ.get('ACCOUNT_LOCKOUT_DURATION', '1800'))  # 30分钟
+    ANOMALY_PROFILE_CACHE_SIZE = int(os.environ.get('ANOMALY_PROFILE_CACHE_SIZE', '1000'))  # 每进程缓存的行为画像数
+    BEHAVIOR_PROFILE_BACKGROUND = os.environ.get('BEHAVIOR_PROFILE_BACKGROUND', 'true').lower() in ['true', 'on', '1']
+    BEHAVIOR_PROFILE_REFRESH_INTERVAL = int(os.environ.get('BEHAVIOR_PROFILE_REFRESH_INTERVAL', '60'))  # 秒
+    BEHAVIOR_PROFILE_BATCH_SIZE = int(os.environ.get('BEHAVIOR_PROFILE_BATCH_SIZE', '5000'))
+    BEHAVIOR_PROFILE_LAG = int(os.environ.get('BEHAVIOR_PROFILE_LAG', '10'))  # 秒，等待批量写入落库
+    BEHAVIOR_PROFILE_GAP_TIMEOUT = int(os.environ.get('BEHAVIOR_PROFILE_GAP_TIMEOUT', '600'))  # 秒，水位线以下缺失ID的回查时长
+    BEHAVIOR_PROFILE_MAX_GAPS = int(os.environ.get('BEHAVIOR_PROFILE_MAX_GAPS', '1000'))
+    BEHAVIOR_PROFILE_MAX_IPS = int(os.environ.get('BEHAVIOR_PROFILE_MAX_IPS', '50'))
+    BEHAVIOR_PROFILE_MAX_USER_AGENTS = int(os.environ.get('BEHAVIOR_PROFILE_MAX_USER_AGENTS', '20'))
+    BEHAVIOR_PROFILE_MAX_ENDPOINTS = int(os.environ.get('BEHAVIOR_PROFILE_MAX_ENDPOINTS', '100'))
+    
+    # 请求级安全检测配置
+    SECURITY_DETECTION_ENABLED = os.environ.get('SECURITY_DETECTION_ENABLED', 'true').lower() in ['true', 'on', '1']
+    SECURITY_DETECTION_EXEMPT_PATHS = tuple(
+        p for p in os.environ.get('SECURITY_DETECTION_EXEMPT_PATHS', '/api/monitor/health,/health,/static/').split(',') if p
+    )
+    SECURITY_DETECTION_SAMPLE_RATE = float(os.environ.get('SECURITY_DETECTION_SAMPLE_RATE', '0.1'))  # 低风险GET的检测采样率
+    SECURITY_DETECTION_BUDGET_MS = float(os.environ.get('SECURITY_DETECTION_BUDGET_MS', '2.0'))  # 单请求检测时间预算
+    SECURITY_DETECTION_SYNC_EVERY = int(os.environ.get('SECURITY_DETECTION_SYNC_EVERY', '20'))  # 本地计数同步到共享计数的批量
+    SECURITY_DETECTION_MAX_TRACKED_IPS = int(os.environ.get('SECURITY_DETECTION_MAX_TRACKED_IPS', '10000'))
+    SECURITY_ALERT_COOLDOWN = int(os.environ.get('SECURITY_ALERT_COOLDOWN', '300'))  # 同一IP同类告警间隔(秒)
+    SECURITY_OFF_HOURS = (0, 6)  # 非工作时段[开始, 结束)，设为None关闭
+    IP_BLOCKLIST_SYNC_INTERVAL = float(os.environ.get('IP_BLOCKLIST_SYNC_INTERVAL', '1.0'))  # 规则版本号轮询间隔(秒)
+    IP_BLOCKLIST_DEGRADED_RELOAD_INTERVAL = float(os.environ.get('IP_BLOCKLIST_DEGRADED_RELOAD_INTERVAL', '10.0'))  # 共享存储不可用时从数据库重建的间隔(秒)
+    
+    # 审计/操作日志批量写入配置
+    AUDIT_ASYNC_WRITE = os.environ.get('AUDIT_ASYNC_WRITE', 'true').lower() in ['true', 'on', '1']
+    AUDIT_BATCH_SIZE = int(os.environ.get('AUDIT_BATCH_SIZE', '200'))
+    AUDIT_FLUSH_INTERVAL = float(os.environ.get('AUDIT_FLUSH_INTERVAL', '1.0'))  # 秒
+    AUDIT_QUEUE_SIZE = int(os.environ.get('AUDIT_QUEUE_SIZE', '10000'))
+    AUDIT_DURABLE = os.environ.get('AUDIT_DURABLE', 'true').lower() in ['true', 'on', '1']  # 入队前写预写日志，设为false关闭
+    OPERATION_LOG_ASYNC_WRITE = os.environ.get('OPERATION_LOG_ASYNC_WRITE', 'true').lower() in ['true', 'on', '1']
+    OPERATION_LOG_BATCH_SIZE = int(os.environ.get('OPERATION_LOG_BATCH_SIZE', '200'))
+    OPERATION_LOG_FLUSH_INTERVAL = float(os.environ.get('OPERATION_LOG_FLUSH_INTERVAL', '0.2'))  # 秒
+    OPERATION_LOG_QUEUE_SIZE = int(os.environ.get('OPERATION_LOG_QUEUE_SIZE', '10000'))
+    OPERATION_LOG_DURABLE = os.environ.get('OPERATION_LOG_DURABLE', 'true').lower() in ['true', 'on', '1']
+    OPERATION_LOG_MAX_REQUEST_DATA = int(os.environ.get('OPERATION_LOG_MAX_REQUEST_DATA', '2000'))  # 字符
+    BATCH_WRITER_SPILL_DIR = os.environ.get('BATCH_WRITER_SPILL_DIR', 'logs/spill')
+    
+    # 审计日志保留与归档配置
+    AUDIT_RETENTION_MONTHS = int(os.environ.get('AUDIT_RETENTION_MONTHS', '12'))
+    AUDIT_ARCHIVE_DIR = os.environ.get('AUDIT_ARCHIVE_DIR', 'archive/audit')
+    AUDIT_PARTITION_MONTHS_AHEAD = int(os.environ.get('AUDIT_PARTITION_MONTHS_AHEAD', '2'))
+    
+    # 风险评分配置
+    RISK_FAILURE_WINDOW = int(os.environ.get('RISK_FAILURE_WINDOW', '300'))  # 登录失败统计窗口(秒)
+    RISK_KNOWN_IP_MAX = int(os.environ.get('RISK_KNOWN_IP_MAX', '20'))  # 每用户保留的常用IP数
+    RISK_KNOWN_IP_TTL = int(os.environ.get('RISK_KNOWN_IP_TTL', str(30 * 86400)))  # 常用IP保留期(秒)
     
     # 安全通信配置
     RSA_PRIVATE_KEY_PATH = os.environ.get('RSA_PRIVATE_KEY_PATH', '')
@@ -95,6 +172,33 @@ class Config:
     # 性能监控配置
     PERFORMANCE_MONITORING = os.environ.get('PERFORMANCE_MONITORING', 'True').lower() == 'true'
     MONITORING_INTERVAL = int(os.environ.get('MONITORING_INTERVAL', '60'))  # 秒
+    # 性能指标时序存储：原始点/小时汇总/天汇总的保留天数
+    METRICS_RAW_RETENTION_DAYS = int(os.environ.get('METRICS_RAW_RETENTION_DAYS', '7'))
+    METRICS_HOURLY_RETENTION_DAYS = int(os.environ.get('METRICS_HOURLY_RETENTION_DAYS', '90'))
+    METRICS_DAILY_RETENTION_DAYS = int(os.environ.get('METRICS_DAILY_RETENTION_DAYS', '730'))
+    METRICS_MAINTENANCE_INTERVAL = 300  # 降采样与清理间隔（秒）
+    # 跨工作进程请求指标汇总（共享目录默认位于/dev/shm下按代码目录与数据库区分的子目录）
+    METRICS_AGGREGATION_ENABLED = os.environ.get('METRICS_AGGREGATION_ENABLED', 'true').lower() in ['true', 'on', '1']
+    METRICS_SHARED_DIR = os.environ.get('METRICS_SHARED_DIR')
+    METRICS_AGGREGATION_INTERVAL = float(os.environ.get('METRICS_AGGREGATION_INTERVAL', '1.0'))
+    METRICS_AUTH_TOKEN = os.environ.get('METRICS_AUTH_TOKEN')  # /metrics抓取令牌
+    METRICS_ALLOWED_IPS = os.environ.get('METRICS_ALLOWED_IPS', '')  # /metrics抓取端IP/网段白名单，逗号分隔（与令牌至少配置一项）
+    # 请求级SQL统计：同一语句形态重复达到阈值视为疑似N+1；超出查询预算时log仅记录，raise抛出异常
+    SQL_INSTRUMENTATION_ENABLED = os.environ.get('SQL_INSTRUMENTATION_ENABLED', 'true').lower() in ['true', 'on', '1']
+    SQL_N_PLUS_ONE_THRESHOLD = int(os.environ.get('SQL_N_PLUS_ONE_THRESHOLD', '5'))
+    SQL_QUERY_BUDGET_MODE = os.environ.get('SQL_QUERY_BUDGET_MODE', 'log')
+    # 响应中返回X-DB-Queries/Server-Timing：默认仅调试、测试环境及管理员请求
+    SQL_QUERY_HEADERS = os.environ.get('SQL_QUERY_HEADERS', 'false').lower() in ['true', 'on', '1']
+    SQL_QUERY_BUDGETS = {}  # 端点 -> 最大语句数或{'max_queries':..., 'max_repeated':...}，视图上的@query_budget优先
+    # 慢请求栈采样：运行超过PROFILER_START_MS开始采样，耗时达到PROFILER_THRESHOLD_MS时写入折叠栈文件
+    PROFILER_ENABLED = os.environ.get('PROFILER_ENABLED', 'true').lower() in ['true', 'on', '1']
+    PROFILER_OUTPUT_DIR = os.environ.get('PROFILER_OUTPUT_DIR', 'logs/profiles')
+    PROFILER_THRESHOLD_MS = float(os.environ.get('PROFILER_THRESHOLD_MS', '2000'))  # 与响应时间告警阈值一致
+    PROFILER_START_MS = float(os.environ.get('PROFILER_START_MS', '500'))
+    PROFILER_SAMPLE_INTERVAL = float(os.environ.get('PROFILER_SAMPLE_INTERVAL', '0.01'))  # 秒
+    PROFILER_SAMPLE_RATE = int(os.environ.get('PROFILER_SAMPLE_RATE', '0'))  # 每N个请求完整采样一个，0为关闭
+    PROFILER_MAX_FILES = int(os.environ.get('PROFILER_MAX_FILES', '200'))
+    SYSTEM_METRICS_SAMPLE_INTERVAL = float(os.environ.get('SYSTEM_METRICS_SAMPLE_INTERVAL', '5'))  # 系统指标后台采样间隔（秒）
     ALERT_CPU_THRESHOLD = float(os.environ.get('ALERT_CPU_THRESHOLD', '80.0'))
     ALERT_MEMORY_THRESHOLD = float(os.environ.get('ALERT_MEMORY_THRESHOLD', '85.0'))
     ALERT_DISK_THRESHOLD = float(os.environ.get('ALERT_DISK_THRESHOLD', '90.0'))
@@ -115,6 +219,15 @@ class TestingConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
     WTF_CSRF_ENABLED = False
+    SHARED_STORE_BACKEND = 'memory'
+    RATELIMIT_STORAGE_URI = 'memory://'
+    PASSWORD_HASH_WORKERS = 0  # 测试环境同步执行
+    AUDIT_ASYNC_WRITE = False  # 测试环境同步写入审计日志
+    OPERATION_LOG_ASYNC_WRITE = False
+    BEHAVIOR_PROFILE_BACKGROUND = False  # 测试中直接调用run_once
+    METRICS_AGGREGATION_ENABLED = False
+    SQL_QUERY_BUDGET_MODE = 'raise'  # 测试中查询预算超限直接失败
+    PROFILER_ENABLED = False
 
 
 class ProductionConfig(Config):
@@ -14,7 +14,7 @@ except ImportError:
     SQLAlchemy = None
 import os
 import sys
-from datetime import datetime
+from datetime import datetime, timedelta
 import secrets
 import hashlib
 
@@ -112,6 +112,25 @@ class Asset(db.Model):
     remark = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    __table_args__ = (
+        db.Index('ix_it_asset_warranty_end_date', 'warranty_end_date'),
+    )
+    
+    @staticmethod
+    def warranty_filter(warranty_status, today=None):
+        """保修状态对应的查询条件，与get_warranty_status的判定一致；未知状态返回None"""
+        today = today or datetime.now().date()
+        expiring_end = today + timedelta(days=30)
+        if warranty_status == 'unknown':
+            return Asset.warranty_end_date.is_(None)
+        if warranty_status == 'expired':
+            return Asset.warranty_end_date < today
+        if warranty_status == 'expiring':
+            return Asset.warranty_end_date.between(today, expiring_end)
+        if warranty_status == 'valid':
+            return Asset.warranty_end_date > expiring_end
+        return None
+    
     def get_warranty_status(self):
         """获取保修状态"""
         if not self.warranty_end_date:
@@ -826,37 +845,19 @@ def get_assets():
                 fallback_categories = ['交换机', '路由器', '防火墙', 'BRAS', '网关', '负载均衡器', '服务器', '工作站', '台式机', '笔记本', '网络设备']
                 query = query.filter(Asset.category.in_(fallback_categories))
         
-        # 获取数据（先不进行保修状态过滤，在内存中处理）
-        # 获取总数（应用其他搜索条件后）
-        base_total = query.count()
-        print(f"基础搜索结果总数: {base_total}")
-        
-        # 获取数据（先不进行保修状态过滤，在内存中处理）
-        # 获取总数（应用其他搜索条件后）
-        base_total = query.count()
-        print(f"基础搜索结果总数: {base_total}")
-        
-        # 获取所有匹配的资产数据（用于保修状态过滤）
-        all_assets = query.all()
-        
-        # 在内存中进行保修状态过滤
-        filtered_assets = []
-        for asset in all_assets:
-            asset_warranty_status = asset.get_warranty_status()
-            
-            # 如果指定了保修状态搜索，进行过滤
-            if warranty_status and asset_warranty_status != warranty_status:
-                continue
-            
-            filtered_assets.append(asset)
+        # 保修状态过滤（转换为保修结束日期的范围条件）
+        if warranty_status:
+            warranty_condition = Asset.warranty_filter(warranty_status)
+            if warranty_condition is not None:
+                query = query.filter(warranty_condition)
         
-        # 重新计算过滤后的总数
-        total = len(filtered_assets)
-        print(f"保修状态过滤后总数: {total}")
+        # 获取总数（应用全部搜索条件后）
+        total = query.count()
+        print(f"搜索结果总数: {total}")
         
         # 计算偏移量和分页
         offset = (page - 1) * page_size
-        paginated_assets = filtered_assets[offset:offset + page_size]
+        paginated_assets = query.offset(offset).limit(page_size).all()
         assets_data = []
         
         for asset in paginated_assets:
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+用户表盲索引升级脚本
+为加密存储的邮箱、手机号添加HMAC盲索引列并回填历史数据，
+移除密文邮箱列上的唯一索引，改为未删除用户盲索引（生成列）上的唯一索引
+"""
+
+import os
+import sys
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import create_app, db
+from app.models.user import User
+from app.utils.encryption import blind_index
+from sqlalchemy import text, inspect
+
+
+def upgrade_user_blind_index(batch_size=500):
+    """添加盲索引列并回填"""
+    app = create_app()
+    
+    with app.app_context():
+        print("🚀 开始升级用户表盲索引...")
+        
+        try:
+            existing_columns = [col['name'] for col in inspect(db.engine).get_columns('sys_user')]
+            
+            for column, comment in [('email_bidx', '邮箱盲索引'), ('phone_bidx', '手机号盲索引')]:
+                if column in existing_columns:
+                    print(f"⚠️  列 sys_user.{column} 已存在，跳过")
+                    continue
+                db.session.execute(text(
+                    f"ALTER TABLE sys_user ADD COLUMN {column} VARCHAR(64) NULL COMMENT '{comment}'"
+                ))
+                db.session.execute(text(f"CREATE INDEX ix_sys_user_{column} ON sys_user ({column})"))
+                print(f"✅ 添加列及索引: sys_user.{column}")
+            
+            db.session.commit()
+            
+            # 回填盲索引（读取时自动解密）
+            updated = 0
+            last_id = 0
+            while True:
+                users = User.query.filter(User.id > last_id).order_by(User.id).limit(batch_size).all()
+                if not users:
+                    break
+                for user in users:
+                    user.email_bidx = blind_index(user.email, 'email')
+                    user.phone_bidx = blind_index(user.phone, 'phone')
+                    updated += 1
+                last_id = users[-1].id
+                db.session.commit()
+            
+            print(f"✅ 盲索引回填完成，共处理 {updated} 个用户")
+            
+            return upgrade_email_unique_index()
+            
+        except Exception as e:
+            db.session.rollback()
+            print(f"❌ 盲索引升级失败: {str(e)}")
+            return False
+
+
+def upgrade_email_unique_index():
+    """邮箱唯一约束迁移到未删除用户的盲索引上（需在盲索引回填后执行）"""
+    inspector = inspect(db.engine)
+    
+    # 移除密文邮箱列上的唯一索引（密文随机化，唯一约束无意义且会阻止软删除后重新注册）
+    for index in inspector.get_indexes('sys_user'):
+        if index.get('unique') and index['column_names'] == ['email']:
+            db.session.execute(text(f"DROP INDEX {index['name']} ON sys_user"))
+            print(f"✅ 移除密文邮箱唯一索引: {index['name']}")
+    
+    existing_columns = [col['name'] for col in inspector.get_columns('sys_user')]
+    if 'email_active_bidx' not in existing_columns:
+        db.session.execute(text(
+            "ALTER TABLE sys_user ADD COLUMN email_active_bidx VARCHAR(64) "
+            "GENERATED ALWAYS AS (CASE WHEN is_deleted = 0 THEN email_bidx END) VIRTUAL NULL "
+            "COMMENT '未删除用户的邮箱盲索引（软删除后为NULL，不参与唯一约束）'"
+        ))
+        print("✅ 添加生成列: sys_user.email_active_bidx")
+    db.session.commit()
+    
+    if 'uq_sys_user_email_active_bidx' in [index['name'] for index in inspector.get_indexes('sys_user')]:
+        print("⚠️  索引 uq_sys_user_email_active_bidx 已存在，跳过")
+        return True
+    
+    # 未删除用户中存在重复邮箱时无法建立唯一索引，需人工处理
+    duplicates = db.session.execute(text(
+        "SELECT email_active_bidx, COUNT(*) AS total FROM sys_user "
+        "WHERE email_active_bidx IS NOT NULL GROUP BY email_active_bidx HAVING COUNT(*) > 1"
+    )).fetchall()
+    if duplicates:
+        for row in duplicates:
+            user_ids = [user.id for user in User.query.filter_by(email_bidx=row[0], is_deleted=False).all()]
+            print(f"❌ 邮箱重复的未删除用户: {user_ids}")
+        print("❌ 请先处理重复邮箱后重新执行本脚本")
+        return False
+    
+    db.session.execute(text(
+        "CREATE UNIQUE INDEX uq_sys_user_email_active_bidx ON sys_user (email_active_bidx)"
+    ))
+    db.session.commit()
+    print("✅ 添加唯一索引: sys_user.uq_sys_user_email_active_bidx")
+    return True
+
+
+if __name__ == '__main__':
+    upgrade_user_blind_index()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+安全检测数据表升级脚本
+为已有数据库创建行为画像后台汇总使用的user_behavior_profile、profile_watermark表，
+以及IP阻止/放行列表使用的ip_access_rule表
+"""
+
+import os
+import sys
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import create_app, db
+from app.utils.anomaly_detection import UserBehaviorProfile, ProfileWatermark
+from app.utils.ip_blocklist import IPAccessRule
+from sqlalchemy import text, inspect
+
+
+TABLES = [
+    (UserBehaviorProfile, '用户行为画像'),
+    (ProfileWatermark, '行为画像汇总水位线'),
+    (IPAccessRule, 'IP访问规则'),
+]
+
+# 已创建的表上后续新增的列
+COLUMNS = [
+    ('profile_watermark', 'pending_ids', "TEXT NULL COMMENT '水位线以下尚未出现的ID(JSON，ID->发现时间)'"),
+]
+
+
+def upgrade_security_tables():
+    """创建缺失的安全检测数据表及新增列"""
+    app = create_app()
+
+    with app.app_context():
+        print("🚀 开始升级安全检测数据表...")
+
+        try:
+            existing_tables = inspect(db.engine).get_table_names()
+
+            for model, description in TABLES:
+                table = model.__table__
+                if table.name in existing_tables:
+                    print(f"⚠️  表 {table.name} 已存在，跳过")
+                    continue
+                table.create(db.engine)
+                print(f"✅ 创建表: {table.name}（{description}）")
+
+            inspector = inspect(db.engine)
+            for table_name, column, definition in COLUMNS:
+                if table_name not in existing_tables:
+                    continue
+                if column in [col['name'] for col in inspector.get_columns(table_name)]:
+                    print(f"⚠️  列 {table_name}.{column} 已存在，跳过")
+                    continue
+                db.session.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {column} {definition}"))
+                print(f"✅ 添加列: {table_name}.{column}")
+            db.session.commit()
+
+            return True
+
+        except Exception as e:
+            db.session.rollback()
+            print(f"❌ 安全检测数据表升级失败: {str(e)}")
+            return False
+
+
+if __name__ == '__main__':
+    upgrade_security_tables()
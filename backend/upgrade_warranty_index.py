@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+资产表保修索引升级脚本
+为已有数据库的it_asset表添加(is_deleted, warranty_end_date)复合索引，
+使保修状态筛选可按索引范围扫描
+"""
+
+import os
+import sys
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import create_app, db
+from sqlalchemy import text, inspect
+
+
+INDEX_NAME = 'ix_it_asset_deleted_warranty'
+
+
+def upgrade_warranty_index():
+    """添加保修结束日期复合索引"""
+    app = create_app()
+    
+    with app.app_context():
+        print("🚀 开始升级资产表保修索引...")
+        
+        try:
+            existing_indexes = [index['name'] for index in inspect(db.engine).get_indexes('it_asset')]
+            if INDEX_NAME in existing_indexes:
+                print(f"⚠️  索引 it_asset.{INDEX_NAME} 已存在，跳过")
+                return True
+            
+            db.session.execute(text(
+                f"CREATE INDEX {INDEX_NAME} ON it_asset (is_deleted, warranty_end_date)"
+            ))
+            db.session.commit()
+            print(f"✅ 添加索引: it_asset.{INDEX_NAME}")
+            return True
+            
+        except Exception as e:
+            db.session.rollback()
+            print(f"❌ 保修索引升级失败: {str(e)}")
+            return False
+
+
+if __name__ == '__main__':
+    upgrade_warranty_index()
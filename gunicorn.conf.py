@@ -97,6 +97,15 @@ def pre_fork(server, worker):
 def post_fork(server, worker):
     """工作进程创建后执行"""
     server.log.info("工作进程 %s 已创建", worker.pid)
+    # preload模式下应用在主进程中创建，工作进程需丢弃继承的指标状态，
+    # 请求指标由各工作进程增量导出，主进程的监控线程负责合并
+    from app.utils.performance_monitor import performance_monitor
+    performance_monitor.after_fork(worker_id=worker.age)
+
+def worker_exit(server, worker):
+    """工作进程退出时执行"""
+    from app.utils.performance_monitor import performance_monitor
+    performance_monitor.before_exit()
 
 def post_worker_init(worker):
     """工作进程初始化后执行"""
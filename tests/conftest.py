@@ -6,7 +6,7 @@ import sys
 import pytest
 import tempfile
 from app import create_app, db
-from app.models import User, Role, Asset, MaintenanceRecord
+from app.models import User, Role, Permission, Asset, MaintenanceRecord
 from app.config import TestConfig
 
 # 添加项目根目录到Python路径
@@ -36,24 +36,25 @@ def db_session(app):
         db.create_all()
         
         # 创建基础数据
-        admin_role = Role(name='管理员', description='系统管理员')
-        user_role = Role(name='普通用户', description='普通用户')
+        view_asset = Permission(name='查看资产', code='asset:view')
+        admin_role = Role(name='管理员', code='admin', description='系统管理员', permissions=[view_asset])
+        user_role = Role(name='普通用户', code='user', description='普通用户')
         
         admin_user = User(
             username='admin',
             email='admin@test.com',
-            role=admin_role
+            roles=[admin_role]
         )
         admin_user.set_password('admin123')
         
         normal_user = User(
             username='user',
             email='user@test.com',
-            role=user_role
+            roles=[user_role]
         )
         normal_user.set_password('user123')
         
-        db.session.add_all([admin_role, user_role, admin_user, normal_user])
+        db.session.add_all([view_asset, admin_role, user_role, admin_user, normal_user])
         db.session.commit()
         
         yield db.session
@@ -72,7 +73,8 @@ def auth_headers(client):
             'password': password
         })
         data = response.get_json()
-        token = data.get('token')
+        token = (data.get('data') or {}).get('access_token')
+        assert token, f"登录失败: {data.get('message')}"
         return {'Authorization': f'Bearer {token}'}
     
     return _get_auth_headers
@@ -239,4 +239,669 @@ class TestUserManagement:
                                  'email': 'new@test.com',
                                  'password': 'password'
                              })
-        assert response.status_code == 403
\ No newline at end of file
+        assert response.status_code == 403
+
+class TestPermissionCache:
+    """权限集缓存测试类"""
+    
+    def test_cache_hit_and_version_invalidation(self, app, monkeypatch):
+        """测试缓存命中与版本号失效"""
+        from app.utils.permission_cache import PermissionCache, PermissionSet
+        from app.utils.shared_store import MemoryStore, reset_shared_store
+        
+        reset_shared_store(MemoryStore())
+        cache = PermissionCache(max_size=10, ttl=300)
+        compiled = []
+        
+        def fake_compile(user_id, version=0):
+            compiled.append(user_id)
+            return PermissionSet(user_id, frozenset({'asset:view'}), frozenset({'运维员'}), version)
+        
+        monkeypatch.setattr(cache, 'compile', fake_compile)
+        
+        perm_set = cache.get(1)
+        assert perm_set.has_permission('asset:view')
+        assert perm_set.has_role('运维员')
+        cache.get(1)
+        assert compiled == [1]
+        
+        # 版本号递增后重新编译
+        cache.bump_version()
+        cache.get(1)
+        assert compiled == [1, 1]
+        reset_shared_store()
+    
+    def test_cache_is_bounded(self, app, monkeypatch):
+        """测试缓存容量上限"""
+        from app.utils.permission_cache import PermissionCache, PermissionSet
+        
+        cache = PermissionCache(max_size=2, ttl=300)
+        monkeypatch.setattr(cache, '_configure', lambda: None)
+        monkeypatch.setattr(cache, 'compile',
+                            lambda user_id, version=0: PermissionSet(user_id, frozenset(), frozenset(), version))
+        
+        for user_id in range(5):
+            cache.get(user_id)
+        
+        assert cache.get_stats()['size'] == 2
+    
+    def test_claims_snapshot_revoked_by_version(self, app):
+        """测试JWT权限快照在版本号变化后失效"""
+        from app.utils.permission_cache import permission_cache, permission_set_from_claims
+        from app.utils.shared_store import MemoryStore, reset_shared_store
+        
+        reset_shared_store(MemoryStore())
+        claims = {
+            'perms': ['asset:view'],
+            'roles': ['查看员'],
+            'perm_version': permission_cache.get_version(7)
+        }
+        
+        perm_set = permission_set_from_claims(7, claims)
+        assert perm_set is not None
+        assert perm_set.has_permission('asset:view')
+        
+        # 单用户版本递增只影响该用户
+        permission_cache.bump_version(8)
+        assert permission_set_from_claims(7, claims) is not None
+        permission_cache.bump_version(7)
+        assert permission_set_from_claims(7, claims) is None
+        reset_shared_store()
+
+    def test_authenticate_request_cache_hit_without_queries(self, app, monkeypatch):
+        """认证结果按请求隔离；权限集缓存命中时不查询用户表"""
+        from flask import g
+        from flask_jwt_extended import create_access_token
+        from app.utils import auth
+        from app.utils.permission_cache import permission_cache, PermissionSet
+        from app.utils.shared_store import MemoryStore, reset_shared_store
+
+        compiled = []
+
+        def fake_compile(user_id, version=None):
+            compiled.append(user_id)
+            return PermissionSet(user_id, frozenset(), frozenset(), version, username=f'user-{user_id}')
+
+        def no_query(*args, **kwargs):
+            raise AssertionError("缓存命中时不应查询用户表")
+
+        monkeypatch.setattr(permission_cache, 'compile', fake_compile)
+        monkeypatch.setattr(User, 'find_by_id', no_query)
+        monkeypatch.setitem(app.config, 'JWT_EMBED_PERMISSIONS', False)
+        reset_shared_store(MemoryStore())
+        permission_cache.clear()
+        try:
+            tokens = {user_id: create_access_token(identity=user_id) for user_id in ('7', '8')}
+
+            for user_id in ('7', '7', '8'):
+                headers = {'Authorization': f'Bearer {tokens[user_id]}'}
+                with app.test_request_context('/', headers=headers):
+                    first = auth._authenticate_request()
+                    assert auth._authenticate_request() is first
+                    assert g.current_user.username == f'user-{user_id}'
+
+            assert compiled == ['7', '8']
+        finally:
+            permission_cache.clear()
+            reset_shared_store()
+
+
+class TestSharedStore:
+    """共享存储降级测试"""
+
+    def test_redis_backoff_and_status(self, app):
+        """Redis不可用时按退避快速失败，状态标记为降级且不会固定为进程内存储"""
+        import time
+        from app.utils.shared_store import RedisStore, SharedStoreUnavailable, store_status, reset_shared_store
+
+        store = RedisStore('redis://127.0.0.1:1/0', retry_base=60)
+        reset_shared_store(store)
+        try:
+            with pytest.raises(SharedStoreUnavailable):
+                store.ping()
+            started = time.time()
+            with pytest.raises(SharedStoreUnavailable):
+                store.get('any')
+            assert time.time() - started < 0.1
+
+            status = store_status()
+            assert status['backend'] == 'redis'
+            assert status['degraded'] is True
+            assert status['consecutive_failures'] == 1
+        finally:
+            reset_shared_store()
+
+    def test_security_callers_fail_closed(self, app, monkeypatch):
+        """共享存储不可用时权限快照失效、权限集不走缓存，计数器退化为本进程计数"""
+        from app.utils.permission_cache import PermissionCache, PermissionSet, permission_set_from_claims
+        from app.utils.shared_store import RedisStore, SlidingWindowCounter, reset_shared_store
+
+        reset_shared_store(RedisStore('redis://127.0.0.1:1/0', retry_base=60))
+        try:
+            claims = {'perms': ['asset:view'], 'roles': [], 'perm_version': '0.0'}
+            assert permission_set_from_claims(7, claims) is None
+
+            cache = PermissionCache(max_size=10, ttl=300)
+            compiled = []
+            monkeypatch.setattr(cache, 'compile', lambda user_id, version=None: compiled.append(user_id) or
+                                PermissionSet(user_id, frozenset(), frozenset(), version))
+            cache.get(1)
+            cache.get(1)
+            assert compiled == [1, 1]
+
+            counter = SlidingWindowCounter('test:degraded', window=60)
+            assert counter.hit('10.0.0.1') == 1
+            assert counter.hit('10.0.0.1') == 2
+            assert counter.count('10.0.0.1') == 2
+        finally:
+            reset_shared_store()
+
+
+class TestBlindIndex:
+    """加密字段盲索引测试类"""
+    
+    def test_blind_index_is_deterministic_and_normalized(self):
+        """测试盲索引确定性与规范化"""
+        from app.utils.encryption import blind_index
+        
+        assert blind_index('Admin@Test.com ', 'email') == blind_index('admin@test.com', 'email')
+        assert blind_index('138-0013-8000', 'phone') == blind_index('13800138000', 'phone')
+        assert blind_index('13800138000', 'phone') != blind_index('13800138000', 'email')
+        assert blind_index(None, 'email') is None
+    
+    def test_user_email_maintains_blind_index(self):
+        """测试写入邮箱时自动维护盲索引"""
+        from app.utils.encryption import blind_index
+        
+        user = User(username='bidx_user', email='bidx@test.com', phone='13900139000')
+        assert user.email_bidx == blind_index('bidx@test.com', 'email')
+        assert user.phone_bidx == blind_index('13900139000', 'phone')
+        
+        user.email = None
+        assert user.email_bidx is None
+    
+    def test_email_unique_among_active_users(self, app, db_session):
+        """测试邮箱唯一索引只约束未删除用户"""
+        from sqlalchemy.exc import IntegrityError
+        from app import db
+        
+        first = User(username='unique_a', email='unique@test.com')
+        first.set_password('unique123')
+        db.session.add(first)
+        db.session.commit()
+        
+        duplicate = User(username='unique_b', email='Unique@Test.com')
+        duplicate.set_password('unique123')
+        db.session.add(duplicate)
+        with pytest.raises(IntegrityError):
+            db.session.commit()
+        db.session.rollback()
+        
+        first.delete()
+        reused = User(username='unique_c', email='unique@test.com')
+        reused.set_password('unique123')
+        db.session.add(reused)
+        db.session.commit()
+        assert User.find_by_email('unique@test.com').id == reused.id
+
+
+class TestEncryptedFields:
+    """加密字段延迟加载与解密缓存测试类"""
+    
+    def test_decrypt_cache_returns_same_plaintext(self, monkeypatch):
+        """测试解密缓存命中返回相同明文，容量受DECRYPT_CACHE_SIZE限制"""
+        from app.utils.encryption import encryptor
+        
+        monkeypatch.setenv('DECRYPT_CACHE_SIZE', '2')
+        encryptor._init_encryption()
+        try:
+            tokens = [encryptor.encrypt(f'user{i}@test.com') for i in range(3)]
+            
+            assert encryptor.decrypt(tokens[0]) == 'user0@test.com'
+            assert encryptor.decrypt(tokens[0]) == 'user0@test.com'
+            assert (encryptor.decrypt_hits, encryptor.decrypt_misses) == (1, 1)
+            
+            encryptor.decrypt(tokens[1])
+            encryptor.decrypt(tokens[2])
+            stats = encryptor.get_cache_stats()
+            assert stats['size'] == stats['max_size'] == 2
+            
+            # 最久未使用的tokens[0]已被淘汰，重新解密
+            assert encryptor.decrypt(tokens[0]) == 'user0@test.com'
+            assert encryptor.decrypt_misses == 4
+        finally:
+            monkeypatch.undo()
+            encryptor._init_encryption()
+    
+    def test_encrypted_columns_deferred(self, app, db_session):
+        """测试加密列默认不加载，undefer_group('encrypted')时随主查询加载"""
+        from sqlalchemy import inspect
+        from sqlalchemy.orm import undefer_group
+        from app import db
+        
+        db.session.expunge_all()
+        user = User.query.filter_by(username='admin').first()
+        assert {'email', 'phone'} <= inspect(user).unloaded
+        
+        db.session.expunge_all()
+        user = User.query.options(undefer_group('encrypted')).filter_by(username='admin').first()
+        assert not {'email', 'phone'} & inspect(user).unloaded
+        assert user.email == 'admin@test.com'
+    
+    def test_user_list_loads_encrypted_columns_in_one_query(self, client, db_session, auth_headers):
+        """测试用户列表不逐行延迟加载加密列"""
+        from sqlalchemy import event
+        from app import db, limiter
+        from app.models import Permission
+        from app.utils.permission_cache import permission_cache
+        
+        admin_role = Role.query.filter_by(code='admin').first()
+        admin_role.permissions.append(Permission(name='查看用户', code='user:view'))
+        for i in range(5):
+            db.session.add(User(username=f'list_user{i}', email=f'list{i}@test.com',
+                                phone=f'1380013800{i}', password_hash='x'))
+        db.session.commit()
+        permission_cache.clear()
+        limiter.reset()
+        headers = auth_headers()
+        
+        statements = []
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+        
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            response = client.get('/api/users?page_size=50', headers=headers)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        
+        assert response.status_code == 200
+        assert response.get_json()['data']['total'] == 7
+        deferred_loads = [
+            statement for statement in statements
+            if 'sys_user.email' in statement and 'sys_user.username' not in statement
+        ]
+        assert deferred_loads == []
+
+
+class TestPasswordHashPool:
+    """密码哈希进程池测试"""
+    
+    def _wait_idle(self, pool, timeout=10):
+        import time
+        
+        deadline = time.time() + timeout
+        while pool.pending and time.time() < deadline:
+            time.sleep(0.05)
+        assert pool.pending == 0
+    
+    def test_reject_when_saturated_and_timeout_holds_slot(self, app, monkeypatch):
+        """测试超时任务仍占用槽位，饱和时快速拒绝，任务结束后恢复"""
+        import time
+        from app.utils.exceptions import ServiceBusyError
+        from app.utils.password_pool import PasswordHashPool
+        
+        monkeypatch.setitem(app.config, 'PASSWORD_HASH_WORKERS', 1)
+        monkeypatch.setitem(app.config, 'PASSWORD_HASH_MAX_INFLIGHT', 1)
+        monkeypatch.setitem(app.config, 'PASSWORD_HASH_TIMEOUT', 0.5)
+        pool = PasswordHashPool()
+        try:
+            with pytest.raises(ServiceBusyError, match='超时'):
+                pool._run(time.sleep, 2)
+            assert pool.pending == 1
+            
+            with pytest.raises(ServiceBusyError, match='繁忙'):
+                pool._run(abs, -1)
+            assert pool.rejected_count == 1
+            
+            self._wait_idle(pool)
+            assert pool._run(abs, -1) == 1
+        finally:
+            pool._executor.shutdown()
+    
+    def test_broken_pool_is_rebuilt(self, app, monkeypatch):
+        """测试子进程异常退出后进程池被重建"""
+        import os
+        from app.utils.exceptions import ServiceBusyError
+        from app.utils.password_pool import PasswordHashPool
+        
+        monkeypatch.setitem(app.config, 'PASSWORD_HASH_WORKERS', 1)
+        pool = PasswordHashPool()
+        try:
+            with pytest.raises(ServiceBusyError, match='不可用'):
+                pool._run(os._exit, 1)
+            self._wait_idle(pool)
+            assert pool._run(abs, -2) == 2
+        finally:
+            pool._executor.shutdown()
+    
+    def test_rehash_on_login(self, client, db_session):
+        """测试哈希参数变更后登录时透明重新哈希"""
+        from werkzeug.security import generate_password_hash, check_password_hash
+        from app import db, limiter
+        from app.utils.password_pool import password_pool
+        
+        user = User.query.filter_by(username='user').first()
+        user.password_hash = generate_password_hash('user123', method='pbkdf2:sha256:1000')
+        db.session.commit()
+        assert password_pool.needs_rehash(user.password_hash)
+        
+        limiter.reset()
+        try:
+            response = client.post('/api/auth/login', json={'username': 'user', 'password': 'user123'})
+            assert response.status_code == 200
+        finally:
+            limiter.reset()
+        
+        db.session.refresh(user)
+        assert user.password_hash.startswith(password_pool.hash_method + '$')
+        assert not password_pool.needs_rehash(user.password_hash)
+        assert check_password_hash(user.password_hash, 'user123')
+
+
+class TestRiskState:
+    """风险评分增量状态测试"""
+
+    def test_failure_window_and_known_ips(self, app):
+        """登录失败计数与常用IP集合"""
+        from app.utils.enhanced_audit import risk_state
+        from app.utils.shared_store import MemoryStore, reset_shared_store
+
+        reset_shared_store(MemoryStore())
+        try:
+            for _ in range(3):
+                risk_state.record_failure(42)
+            assert risk_state.recent_failures(42) == 3
+            assert risk_state.recent_failures(43) == 0
+
+            # 没有常用IP时不视为陌生
+            assert not risk_state.is_unfamiliar_ip(42, '10.0.0.1')
+            risk_state.record_known_ip(42, '10.0.0.1')
+            assert not risk_state.is_unfamiliar_ip(42, '10.0.0.1')
+            assert risk_state.is_unfamiliar_ip(42, '10.0.0.2')
+        finally:
+            reset_shared_store()
+
+
+class TestAnomalyDetector:
+    """异常检测共享计数测试"""
+
+    def test_brute_force_counted_across_instances(self, app):
+        """不同检测器实例（模拟多个工作进程）共享失败计数"""
+        from app.utils.anomaly_detection import AnomalyDetector
+        from app.utils.shared_store import MemoryStore, reset_shared_store
+
+        reset_shared_store(MemoryStore())
+        try:
+            workers = [AnomalyDetector() for _ in range(5)]
+            results = [worker.detect_brute_force_attack('192.0.2.10') for worker in workers]
+            assert results[:4] == [None] * 4
+            assert results[4] is not None
+            assert results[4].evidence['attempt_count'] == 5
+        finally:
+            reset_shared_store()
+
+    def test_profile_cache_bounded(self, app, db_session):
+        """行为画像缓存按LRU淘汰"""
+        from app.utils.anomaly_detection import AnomalyDetector
+
+        app.config['ANOMALY_PROFILE_CACHE_SIZE'] = 3
+        try:
+            detector = AnomalyDetector()
+            for user_id in range(10):
+                detector.get_behavior_profile(user_id)
+            assert list(detector.behavior_profiles) == [7, 8, 9]
+        finally:
+            app.config['ANOMALY_PROFILE_CACHE_SIZE'] = 1000
+
+
+class TestBehaviorProfileBuilder:
+    """行为画像后台汇总测试"""
+
+    def test_incremental_build_from_watermark(self, app, db_session):
+        """按水位线增量汇总，检测时直接读取画像表"""
+        from datetime import datetime, timedelta
+        from app import db
+        from app.utils.enhanced_audit import EnhancedAuditLog
+        from app.utils.anomaly_detection import (
+            AnomalyDetector, behavior_profile_builder, ProfileWatermark
+        )
+
+        def add_log(hour, ip):
+            db.session.add(EnhancedAuditLog(
+                event_type='LOGIN_SUCCESS', event_category='AUTHENTICATION', user_id=1,
+                operation_description='login', operation_result='SUCCESS', client_ip=ip,
+                event_timestamp=(datetime.utcnow() - timedelta(days=1)).replace(hour=hour)
+            ))
+            db.session.commit()
+
+        for _ in range(5):
+            add_log(9, '10.0.0.1')
+        assert behavior_profile_builder.run_once(lag_seconds=0) == 5
+
+        add_log(10, '10.0.0.2')
+        assert behavior_profile_builder.run_once(lag_seconds=0) == 1
+        assert ProfileWatermark.query.filter_by(name='behavior_profile').first().last_id > 0
+
+        profile = AnomalyDetector().get_behavior_profile(1)
+        assert not profile.is_new_ip_address('10.0.0.2')
+        assert profile.is_new_ip_address('10.0.0.3')
+        assert not profile.is_unusual_login_time(9)[0]
+        assert profile.is_unusual_login_time(22)[0]
+
+    def test_late_commit_below_watermark(self, app, db_session):
+        """ID较小但提交较晚的记录在水位线越过后仍会被补汇总"""
+        from datetime import datetime, timedelta
+        from app import db
+        from app.utils.enhanced_audit import EnhancedAuditLog
+        from app.utils.anomaly_detection import behavior_profile_builder, ProfileWatermark
+
+        def add_log(log_id):
+            db.session.add(EnhancedAuditLog(
+                id=log_id, event_type='LOGIN_SUCCESS', event_category='AUTHENTICATION', user_id=1,
+                operation_description='login', operation_result='SUCCESS', client_ip='10.0.0.1',
+                event_timestamp=datetime.utcnow() - timedelta(minutes=1)
+            ))
+            db.session.commit()
+
+        add_log(101)
+        add_log(103)
+        assert behavior_profile_builder.run_once(lag_seconds=0) == 2
+        watermark = ProfileWatermark.query.filter_by(name='behavior_profile').first()
+        assert watermark.last_id == 103
+        assert '102' in watermark.pending_ids
+
+        add_log(102)
+        assert behavior_profile_builder.run_once(lag_seconds=0) == 1
+        assert behavior_profile_builder.run_once(lag_seconds=0) == 0
+
+
+class TestIPBlocklist:
+    """IP阻止列表测试"""
+
+    def test_cidr_longest_prefix_match(self, app, db_session):
+        """网段阻止、更具体的放行规则优先，IPv6同样生效"""
+        from app.utils.ip_blocklist import ip_blocklist
+        from app.utils.shared_store import MemoryStore, reset_shared_store
+
+        reset_shared_store(MemoryStore())
+        try:
+            ip_blocklist.add_rule('10.8.0.0/16', action='block', reason='campus NAT')
+            ip_blocklist.add_rule('10.8.3.7', action='allow')
+            ip_blocklist.add_rule('2001:db8::/32', action='block', duration=3600)
+
+            assert ip_blocklist.is_blocked('10.8.200.1')
+            assert not ip_blocklist.is_blocked('10.8.3.7')
+            assert not ip_blocklist.is_blocked('10.9.0.1')
+            assert ip_blocklist.is_blocked('2001:db8::1')
+            assert not ip_blocklist.is_blocked('not-an-ip')
+
+            assert ip_blocklist.remove_rule('10.8.0.0/16')
+            assert not ip_blocklist.is_blocked('10.8.200.1')
+        finally:
+            reset_shared_store()
+
+    def test_add_rule_via_api(self, client, db_session):
+        """管理员通过接口添加网段阻止规则后立即生效"""
+        from app import db, limiter
+        from app.utils.ip_blocklist import ip_blocklist
+        from app.utils.shared_store import MemoryStore, reset_shared_store
+
+        role = Role(name='admin', code='ops-admin', description='运维管理员')
+        operator = User(username='ops-admin', email='ops-admin@test.com', roles=[role])
+        operator.set_password('ops-admin123')
+        db.session.add_all([role, operator])
+        db.session.commit()
+
+        reset_shared_store(MemoryStore())
+        limiter.reset()
+        try:
+            response = client.post('/api/auth/login', json={'username': 'ops-admin', 'password': 'ops-admin123'})
+            token = response.get_json()['data']['access_token']
+
+            response = client.post(
+                '/api/monitor/security/blocked-ips',
+                json={'cidr': '10.66.0.0/16', 'action': 'block', 'reason': 'scan'},
+                headers={'Authorization': f'Bearer {token}'}
+            )
+            assert response.status_code == 200
+            data = response.get_json()
+            assert data['success'] is True
+            assert data['data']['cidr'] == '10.66.0.0/16'
+            assert ip_blocklist.is_blocked('10.66.1.1')
+            assert not ip_blocklist.is_blocked('10.67.1.1')
+        finally:
+            limiter.reset()
+            reset_shared_store()
+
+
+    def test_reload_failure_backs_off(self, app, monkeypatch):
+        """规则加载失败时沿用已加载的规则，并推迟重试而不是每次请求都查库"""
+        from app.utils.ip_blocklist import IPBlocklist
+        from app.utils.shared_store import MemoryStore, reset_shared_store
+
+        blocklist = IPBlocklist()
+        attempts = []
+
+        def failing_reload(version=None):
+            attempts.append(version)
+            raise RuntimeError("no such table: ip_access_rule")
+
+        monkeypatch.setattr(blocklist, 'reload', failing_reload)
+        reset_shared_store(MemoryStore())
+        try:
+            for _ in range(5):
+                assert not blocklist.is_blocked('10.0.0.1')
+            assert len(attempts) == 1
+            assert blocklist.reload_errors == 1
+        finally:
+            reset_shared_store()
+
+    def test_version_poll_does_not_reload(self, app, monkeypatch):
+        """本进程递增版本号后轮询不再重复重建（进程内存储返回整数版本号）"""
+        from app.utils.ip_blocklist import IPBlocklist, BLOCKLIST_VERSION_KEY
+        from app.utils.shared_store import MemoryStore, reset_shared_store
+
+        blocklist = IPBlocklist()
+        versions = []
+        monkeypatch.setattr(blocklist, 'reload', lambda version=None: (
+            versions.append(version), setattr(blocklist, '_version', version),
+            setattr(blocklist, 'reloads', blocklist.reloads + 1)
+        ))
+        store = MemoryStore()
+        reset_shared_store(store)
+        try:
+            blocklist._bump_version()
+            for _ in range(3):
+                blocklist._next_poll = 0
+                blocklist.is_blocked('10.0.0.1')
+            assert versions == ['1']
+
+            # 其他进程递增版本号后重建
+            store.incr(BLOCKLIST_VERSION_KEY)
+            blocklist._next_poll = 0
+            blocklist.is_blocked('10.0.0.1')
+            assert versions == ['1', '2']
+        finally:
+            reset_shared_store()
+
+
+class TestTokenRevocation:
+    """JWT吊销测试"""
+
+    def test_bloom_filter(self):
+        """已加入的元素必定命中"""
+        from app.utils.token_revocation import BloomFilter
+
+        bloom = BloomFilter(1000)
+        for i in range(1000):
+            bloom.add(f'jti-{i}')
+        assert all(f'jti-{i}' in bloom for i in range(1000))
+        assert sum(f'other-{i}' in bloom for i in range(1000)) < 20
+
+    def test_revoke_and_sync(self, app):
+        """吊销后本进程立即生效，其他进程重建布隆过滤器后生效"""
+        import time
+        from app.utils.shared_store import MemoryStore, reset_shared_store
+        from app.utils.token_revocation import TokenRevocationStore
+
+        reset_shared_store(MemoryStore())
+        try:
+            local, other = TokenRevocationStore(), TokenRevocationStore()
+            assert not other.is_revoked('abc')
+
+            local.revoke('abc', time.time() + 60)
+            assert local.is_revoked('abc')
+            assert not local.is_revoked('def')
+
+            other._next_poll = 0
+            assert other.is_revoked('abc')
+            assert other.stats['rebuilds'] == 1
+            assert other.stats['incremental_syncs'] == 1
+        finally:
+            reset_shared_store()
+
+    def test_fails_closed_when_store_unavailable(self, app):
+        """共享存储不可用时同步错误不外抛，超过最大陈旧时长后拒绝所有令牌"""
+        import time
+        from app.utils.shared_store import MemoryStore, RedisStore, SharedStoreUnavailable, reset_shared_store
+        from app.utils.token_revocation import TokenRevocationStore
+
+        reset_shared_store(MemoryStore())
+        try:
+            revocation = TokenRevocationStore()
+            assert not revocation.is_revoked('abc')
+
+            reset_shared_store(RedisStore('redis://127.0.0.1:1/0', retry_base=60))
+            revocation._next_poll = 0
+            assert not revocation.is_revoked('abc')
+            assert revocation.stats['store_errors'] == 1
+
+            revocation._synced_at = time.time() - 3600
+            assert revocation.is_revoked('abc')
+            with pytest.raises(SharedStoreUnavailable):
+                revocation.revoke('def', time.time() + 60)
+        finally:
+            reset_shared_store()
+
+    def test_refresh_rejected_after_logout(self, client, db_session):
+        """登出同时吊销配对的刷新令牌"""
+        from app import limiter
+        from app.utils.shared_store import MemoryStore, reset_shared_store
+
+        reset_shared_store(MemoryStore())
+        limiter.reset()
+        try:
+            response = client.post('/api/auth/login', json={'username': 'user', 'password': 'user123'})
+            tokens = response.get_json()['data']
+            access = {'Authorization': f"Bearer {tokens['access_token']}"}
+            refresh = {'Authorization': f"Bearer {tokens['refresh_token']}"}
+
+            assert client.post('/api/auth/refresh', headers=refresh).status_code == 200
+            assert client.post('/api/auth/logout', headers=access).status_code == 200
+
+            assert client.get('/api/auth/profile', headers=access).status_code == 401
+            assert client.post('/api/auth/refresh', headers=refresh).status_code == 401
+        finally:
+            limiter.reset()
+            reset_shared_store()
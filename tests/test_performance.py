@@ -289,4 +289,662 @@ class TestPerformance:
             results = [future.result() for future in as_completed(futures)]
         
         success_rate = sum(results) / len(results)
-        assert success_rate >= 0.95, f'数据库连接池测试失败，成功率{success_rate:.2%}'
\ No newline at end of file
+        assert success_rate >= 0.95, f'数据库连接池测试失败，成功率{success_rate:.2%}'
+
+class TestAuditBatchWriter:
+    """审计日志批量写入测试"""
+
+    def test_batched_insert(self, app, db_session):
+        """队列中的审计记录合并为批量写入"""
+        from app.utils.enhanced_audit import audit_logger, audit_writer, AuditEventType, EnhancedAuditLog
+
+        audit_writer.enabled = True
+        try:
+            with app.test_request_context('/api/assets'):
+                for i in range(5):
+                    audit_logger.log_event(AuditEventType.DATA_READ, operation_description=f'读取{i}')
+            assert audit_writer.queue_depth() > 0 or audit_writer.stats['written'] >= 5
+            audit_writer.flush_now()
+        finally:
+            audit_writer.enabled = app.config.get('AUDIT_ASYNC_WRITE', False)
+
+        assert EnhancedAuditLog.query.filter(
+            EnhancedAuditLog.operation_description.like('读取%')
+        ).count() == 5
+
+    def test_spill_and_replay(self, app, db_session, tmp_path):
+        """写入失败的记录落盘并在恢复后重放"""
+        from app.utils.batch_writer import BatchWriter
+        from app.utils.enhanced_audit import EnhancedAuditLog
+
+        writer = BatchWriter('audit_test', EnhancedAuditLog.__table__, 'AUDIT')
+        writer.spill_dir = str(tmp_path)
+        writer._spill([{'operation_description': 'spilled'}])
+        assert writer.get_stats()['spill_pending']
+
+        writer._write_batch = lambda rows: writer.stats.__setitem__('written', writer.stats['written'] + len(rows))
+        writer._replay_spill()
+        assert writer.stats['replayed'] == 1
+        assert not writer.get_stats()['spill_pending']
+
+    def test_spill_files_are_per_process(self, tmp_path):
+        """溢出文件按进程命名，只接管已退出进程遗留的文件"""
+        import os
+        import subprocess
+        import sys
+        from app.utils.batch_writer import BatchWriter
+        from app.utils.enhanced_audit import EnhancedAuditLog
+
+        writer = BatchWriter('audit_test', EnhancedAuditLog.__table__, 'AUDIT')
+        writer.spill_dir = str(tmp_path)
+        assert str(os.getpid()) in os.path.basename(writer.spill_path)
+
+        exited = subprocess.run([sys.executable, '-c', 'import os; print(os.getpid())'],
+                                capture_output=True, text=True).stdout.strip()
+        orphan = tmp_path / f'audit_test.{exited}-1.0.wal.jsonl'
+        orphan.write_text('{"operation_description": "orphan"}\n', encoding='utf-8')
+        alive = tmp_path / f'audit_test.{os.getppid()}-1.spill.jsonl'
+        alive.write_text('{"operation_description": "alive"}\n', encoding='utf-8')
+
+        replayed = []
+        writer._write_batch = lambda rows: replayed.extend(rows)
+        writer._replay_spill()
+        assert replayed == [{'operation_description': 'orphan'}]
+        assert not orphan.exists() and alive.exists()
+
+    def test_durable_journal_released_after_flush(self, app, tmp_path):
+        """预写日志先于入队落盘，批次写入后删除"""
+        from app.utils.batch_writer import BatchWriter
+        from app.utils.enhanced_audit import EnhancedAuditLog
+
+        writer = BatchWriter('audit_test', EnhancedAuditLog.__table__, 'AUDIT')
+        writer.app = app
+        writer.spill_dir = str(tmp_path)
+        writer.durable = True
+        writer._ensure_started = writer._bind_process  # 不启动后台线程，手动刷新
+        written = []
+        writer._write_batch = lambda rows: written.extend(rows)
+
+        writer.submit({'operation_description': 'wal'})
+        journals = list(tmp_path.glob('audit_test.*.wal.jsonl'))
+        assert len(journals) == 1 and 'wal' in journals[0].read_text(encoding='utf-8')
+
+        writer.flush_now()
+        assert written == [{'operation_description': 'wal'}]
+        assert not list(tmp_path.glob('audit_test.*.wal.jsonl'))
+
+
+class TestOperationLogWriter:
+    """操作日志批量写入测试"""
+
+    def test_log_operation_enqueues_without_commit(self, app, monkeypatch):
+        """log_operation只入队，不提交请求会话"""
+        from types import SimpleNamespace
+        from flask import g
+        from app import db
+        from app.utils.auth import log_operation, operation_log_writer
+
+        submitted = []
+        monkeypatch.setattr(operation_log_writer, 'submit', submitted.append)
+        monkeypatch.setattr(db.session, 'commit', lambda: pytest.fail("不应提交请求会话"))
+
+        @log_operation('保存位置')
+        def save_positions():
+            return 'ok'
+
+        with app.test_request_context('/api/topology/positions', method='POST', json={'positions': [1, 2]}):
+            g.current_user = SimpleNamespace(id=1, username='admin')
+            assert save_positions() == 'ok'
+
+        assert len(submitted) == 1
+        assert submitted[0]['operation'] == '保存位置'
+        assert submitted[0]['user_id'] == 1
+        assert 'id' not in submitted[0]
+
+    def test_request_data_capped_and_computed_once(self, app, monkeypatch):
+        """请求数据摘要按OPERATION_LOG_MAX_REQUEST_DATA截断，同一请求内只序列化一次"""
+        from app.utils import auth
+
+        monkeypatch.setitem(app.config, 'OPERATION_LOG_MAX_REQUEST_DATA', 50)
+        calls = []
+        original = auth._request_repr.repr
+        monkeypatch.setattr(auth._request_repr, 'repr', lambda data: calls.append(1) or original(data))
+
+        payload = {'rows': [{'name': 'x' * 100} for _ in range(1000)], 'password': 'secret'}
+        with app.test_request_context('/api/assets/import', method='POST', json=payload):
+            first = auth._get_request_data()
+            assert auth._get_request_data() is first
+        assert len(first) == 50
+        assert 'secret' not in first
+        assert len(calls) == 1
+
+        with app.test_request_context('/api/assets', method='GET', query_string={'page': 2}):
+            assert auth._get_request_data() == "{'page': '2'}"
+        assert len(calls) == 2
+
+    def test_batch_flush_is_single_insert(self, app, tmp_path):
+        """一个批次只执行一条批量INSERT"""
+        from datetime import datetime
+        from sqlalchemy import event
+        from app import db
+        from app.models.user import OperationLog
+        from app.utils.batch_writer import BatchWriter
+
+        table = OperationLog.__table__
+        table.create(db.engine, checkfirst=True)
+        writer = BatchWriter('operation_log_test', table, 'OPERATION_LOG')
+        writer.app = app
+        writer.spill_dir = str(tmp_path)
+        writer.durable = False
+        writer._ensure_started = writer._bind_process  # 不启动后台线程，手动刷新
+
+        now = datetime.utcnow()
+        for i in range(20):
+            writer.submit({
+                'user_id': 1, 'username': 'admin', 'operation': f'批量{i}', 'method': 'POST',
+                'url': '/api/assets', 'created_at': now, 'updated_at': now, 'is_deleted': False
+            })
+
+        inserts = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            if statement.lstrip().upper().startswith('INSERT'):
+                inserts.append((executemany, len(parameters) if executemany else 1))
+
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            writer.flush_now()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+
+        assert inserts == [(True, 20)]
+        with db.engine.connect() as conn:
+            rows = conn.execute(table.select().where(table.c.operation.like('批量%'))).fetchall()
+        assert len(rows) == 20
+
+
+class TestAuditArchive:
+    """审计日志归档测试"""
+
+    def test_retention_exports_and_purges(self, app, db_session, tmp_path):
+        """过期月份导出为压缩JSONL后删除，并可离线查询"""
+        from datetime import datetime
+        from app import db
+        from app.utils.audit_archive import AuditArchiver, iter_archive
+        from app.utils.enhanced_audit import EnhancedAuditLog
+
+        old = datetime(2020, 1, 15)
+        db.session.add(EnhancedAuditLog(
+            event_type='LOGIN_FAILED', event_category='AUTHENTICATION', user_id=1,
+            operation_description='old', operation_result='FAILED', event_timestamp=old
+        ))
+        db.session.commit()
+
+        archiver = AuditArchiver(archive_dir=str(tmp_path), retention_months=12)
+        summary = archiver.run_retention(['enhanced_audit_log'])
+        assert summary['enhanced_audit_log'][0]['rows'] >= 1
+        assert EnhancedAuditLog.query.filter(EnhancedAuditLog.event_timestamp < datetime(2020, 2, 1)).count() == 0
+
+        records = list(iter_archive(str(tmp_path), 'enhanced_audit_log',
+                                    start=datetime(2020, 1, 1), filters={'user_id': 1}))
+        assert records and records[0]['operation_description'] == 'old'
+
+    def test_purge_only_archived_rows_and_rerun_keeps_parts(self, app, db_session, tmp_path):
+        """导出后新写入的记录不被删除，重跑写入新分片而不覆盖已有归档"""
+        from datetime import datetime
+        from app import db
+        from app.utils.audit_archive import AuditArchiver, iter_archive
+        from app.utils.enhanced_audit import EnhancedAuditLog
+
+        def add(description):
+            db.session.add(EnhancedAuditLog(
+                event_type='DATA_READ', event_category='DATA_OPERATION', operation_description=description,
+                operation_result='SUCCESS', event_timestamp=datetime(2020, 3, 10)
+            ))
+            db.session.commit()
+
+        month = datetime(2020, 3, 1)
+        archiver = AuditArchiver(archive_dir=str(tmp_path), retention_months=12)
+        add('first')
+        assert archiver.export_month('enhanced_audit_log', month)[0] == 1
+        add('late')
+        archiver.purge_month('enhanced_audit_log', month)
+        remaining = EnhancedAuditLog.query.filter(EnhancedAuditLog.event_timestamp < datetime(2020, 4, 1)).all()
+        assert [log.operation_description for log in remaining] == ['late']
+
+        assert archiver.export_month('enhanced_audit_log', month)[0] == 1
+        archiver.purge_month('enhanced_audit_log', month)
+        assert len(archiver.archive_parts('enhanced_audit_log', month)) == 2
+        records = list(iter_archive(str(tmp_path), 'enhanced_audit_log', start=month))
+        assert sorted(record['operation_description'] for record in records) == ['first', 'late']
+
+
+class TestAuditLogQuery:
+    """审计日志游标分页测试"""
+
+    def test_keyset_pagination(self, app, db_session):
+        """游标分页按(event_timestamp, id)倒序且不重复、不遗漏"""
+        from datetime import datetime
+        from app import db
+        from app.utils.enhanced_audit import audit_logger, EnhancedAuditLog
+
+        same_time = datetime(2026, 1, 1, 12, 0, 0)
+        for i in range(7):
+            db.session.add(EnhancedAuditLog(
+                event_type='DATA_READ', event_category='DATA_OPERATION',
+                operation_description=f'page{i}', operation_result='SUCCESS',
+                event_timestamp=same_time
+            ))
+        db.session.commit()
+
+        seen = []
+        cursor = None
+        while True:
+            result = audit_logger.query_logs(page_size=3, cursor=cursor, event_type='DATA_READ')
+            seen.extend(item['id'] for item in result['items'])
+            cursor = result['next_cursor']
+            if not cursor:
+                break
+
+        assert len(seen) == len(set(seen)) == 7
+        assert seen == sorted(seen, reverse=True)
+        assert audit_logger.query_logs(page_size=3, event_type='DATA_READ', count='exact')['total'] == 7
+
+
+class TestDetectionPipeline:
+    """请求级安全检测测试"""
+
+    def test_ring_counter_window(self):
+        """环形缓冲计数在窗口滑出后扣减"""
+        from app.middleware.detection import RingCounter
+
+        counter = RingCounter(60)
+        for _ in range(3):
+            counter.hit(1000.2)
+        assert counter.hit(1030.0) == 4
+        assert counter.hit(1061.0) == 2  # 1000秒的3次已滑出窗口
+        assert counter.hit(2000.0) == 1
+
+    def test_exempt_route_and_timing_header(self, client):
+        """豁免路由跳过检测，普通接口返回检测耗时头"""
+        from app.middleware.detection import detection_pipeline
+
+        skipped = detection_pipeline.stats['skipped']
+        client.get('/api/monitor/health')
+        assert detection_pipeline.stats['skipped'] == skipped + 1
+
+        response = client.get('/api/assets')
+        assert response.headers.get('X-Security-Check-Time', '').endswith('us')
+
+
+class TestRateLimitBinding:
+    """端点分级限流绑定测试"""
+
+    def test_endpoint_tiers_and_costs(self):
+        """去掉主蓝图前缀后匹配分级，导出接口按权重消耗共享容量"""
+        from app.utils.rate_limit import (
+            normalize_endpoint, get_rate_limit_for_endpoint, get_endpoint_cost, RateLimitConfig
+        )
+
+        name = normalize_endpoint('api.asset.export_assets')
+        assert name == 'asset.export_assets'
+        assert get_rate_limit_for_endpoint(name) is RateLimitConfig.EXPORT_LIMITS
+        assert get_endpoint_cost(name) > get_endpoint_cost('asset.get_assets') == 1
+        assert get_endpoint_cost('location.get_locations') == 0
+
+    def test_login_limits_counted_once(self, client):
+        """登录端点只由分级绑定限流，3 per minute允许3次（不与视图装饰器重复计数）"""
+        from app import limiter
+
+        limiter.reset()
+        credentials = {'username': 'ratelimit-probe', 'password': 'wrong-password'}
+        try:
+            statuses = []
+            for i in range(4):
+                if i:
+                    time.sleep(2.1)  # 避开每2秒1次的分级
+                statuses.append(client.post('/api/auth/login', json=credentials).status_code)
+            assert 429 not in statuses[:3]
+            assert statuses[3] == 429
+        finally:
+            limiter.reset()
+
+    def test_key_resolves_jwt_identity(self, app):
+        """限流键在键函数中解析访问令牌，无令牌时按IP"""
+        from flask_jwt_extended import create_access_token
+        from app.utils.rate_limit import get_user_id
+
+        token = create_access_token(identity='7')
+        with app.test_request_context('/api/assets', headers={'Authorization': f'Bearer {token}'}):
+            assert get_user_id() == 'user:7'
+        with app.test_request_context('/api/assets', environ_base={'REMOTE_ADDR': '10.1.2.3'}):
+            assert get_user_id() == '10.1.2.3'
+        with app.test_request_context('/api/assets', headers={'Authorization': 'Bearer invalid'},
+                                      environ_base={'REMOTE_ADDR': '10.1.2.3'}):
+            assert get_user_id() == '10.1.2.3'
+
+    def test_tier_limit_returns_429(self, client):
+        """超出登录分级限制（每2秒1次）时返回HTTP 429及Retry-After"""
+        from app import limiter
+
+        limiter.reset()
+        try:
+            credentials = {'username': 'ratelimit-probe', 'password': 'wrong-password'}
+            first = client.post('/api/auth/login', json=credentials)
+            assert first.status_code != 429
+
+            second = client.post('/api/auth/login', json=credentials)
+            assert second.status_code == 429
+            assert int(second.headers['Retry-After']) >= 1
+            body = second.get_json()
+            assert body['code'] == 429
+            assert body['success'] is False
+        finally:
+            limiter.reset()
+
+
+class TestSystemMetricsSampler:
+    """后台系统指标采样测试"""
+
+    def test_snapshot_is_cached(self):
+        """读取快照不重新采样，并返回快照时效"""
+        import time
+        from app.utils.performance_monitor import SystemMetricsSampler
+
+        sampler = SystemMetricsSampler(interval=60)
+        try:
+            start = time.time()
+            first = sampler.get_snapshot()
+            second = sampler.get_snapshot()
+            assert time.time() - start < 0.5
+            assert sampler.samples == 1
+            assert first['sampled_at'] == second['sampled_at']
+            assert second['age_seconds'] >= 0
+            assert 'cpu_usage' in second['system']
+        finally:
+            sampler.stop()
+
+
+class TestRequestMetrics:
+    """分桶请求指标测试"""
+
+    def test_histogram_bounds_contain_value(self):
+        """对数线性桶区间包含原值且相对误差不超过1/16"""
+        from app.utils.performance_monitor import histogram_index, histogram_bounds
+
+        for value in [0.005, 0.5, 1, 12.3, 250, 2000, 60000]:
+            low, high = histogram_bounds(histogram_index(value))
+            assert low <= value < high
+            assert (high - low) / high <= 1 / 16 + 1e-9 or high <= 0.016
+
+    def test_endpoint_percentiles_and_error_rate(self):
+        """按端点统计分位数、错误率与吞吐量"""
+        from app.utils.performance_monitor import RequestMetrics
+
+        metrics = RequestMetrics(window_seconds=600)
+        for i in range(1, 101):
+            metrics.record_request(float(i), 200, 'api.asset.get_assets')
+        for _ in range(10):
+            metrics.record_request(5.0, 500, 'api.fault.get_faults')
+
+        latency = metrics.get_endpoint_latency(minutes=1)
+        assert list(latency) == ['api.asset.get_assets', 'api.fault.get_faults']
+        assert abs(latency['api.asset.get_assets']['p95'] - 95) < 95 / 16
+        assert latency['api.fault.get_faults']['error_rate'] == 100
+        assert metrics.get_status_distribution(minutes=1) == {200: 100, 500: 10}
+        assert round(metrics.get_error_rate(minutes=1), 2) == round(10 / 110 * 100, 2)
+
+
+class TestTimeSeriesStore:
+    """时序指标存储测试"""
+
+    def test_rollup_retention_and_resolution(self, tmp_path):
+        """完整小时/天被汇总，重复执行幂等，按范围选择分辨率"""
+        from datetime import datetime, timedelta
+        from app.utils.timeseries_store import TimeSeriesStore
+
+        store = TimeSeriesStore(str(tmp_path / 'metrics.db'))
+        store.init_schema()
+        now = datetime(2026, 1, 3, 12, 30)
+        store.write_points(
+            ('cpu_usage', float(m % 100), now - timedelta(minutes=m)) for m in range(60 * 50)
+        )
+
+        assert store.rollup(now=now) == {'1h': 50, '1d': 2}
+        assert store.rollup(now=now) == {'1h': 0, '1d': 0}
+
+        conn = store.connection()
+        row = conn.execute(
+            "SELECT min_value, max_value, sample_count FROM performance_metric_rollups "
+            "WHERE resolution = '1h' AND bucket_start = '2026-01-03 11:00:00.000000'"
+        ).fetchone()
+        assert row == (31.0, 90.0, 60)
+
+        assert store.select_resolution(2) == 'raw'
+        assert store.select_resolution(72) == '1h'
+        assert store.select_resolution(24 * 90) == '1d'
+
+        deleted = store.apply_retention(now=now + timedelta(days=8))
+        assert deleted['raw'] == 60 * 50 and deleted['1h'] == 0
+
+
+class TestMetricsAggregation:
+    """跨工作进程指标汇总测试"""
+
+    def test_export_collect_and_summary(self, tmp_path):
+        """工作进程导出的时间桶被收集进程合并并发布为汇总"""
+        import os
+        from app.utils.metrics_aggregation import MetricsAggregator
+        from app.utils.performance_monitor import RequestMetrics, PerformanceMonitor
+
+        workers = [RequestMetrics(), RequestMetrics()]
+        for metrics in workers:
+            for _ in range(10):
+                metrics.record_request(10.0, 200, 'api.asset.get_assets')
+            metrics.record_request(30.0, 500, 'api.fault.get_faults')
+
+        exporter = MetricsAggregator()
+        exporter.shared_dir = str(tmp_path)
+        for metrics in workers:
+            exporter._exported_second = metrics.current_second() - 5
+            assert exporter.export(metrics, include_current=True) >= 1
+
+        collector = MetricsAggregator()
+        collector.shared_dir = str(tmp_path)
+        assert collector.start_collector(RequestMetrics(), PerformanceMonitor.build_application_metrics)
+        assert collector.is_collector and collector._collector_pid == os.getpid()
+        collector.collect()
+        assert collector.merged.get_endpoint_stats(minutes=1) == {
+            'api.asset.get_assets': 20, 'api.fault.get_faults': 2
+        }
+
+        collector.publish_summary()
+        summary = collector.read_summary()
+        assert summary['endpoint_stats']['api.asset.get_assets'] == 20
+        assert round(summary['error_rate'], 2) == round(2 / 22 * 100, 2)
+
+    def test_shared_dir_namespaced_per_deployment(self, app, monkeypatch):
+        """同一主机上不同数据库的部署不共用共享目录"""
+        from app.utils.metrics_aggregation import MetricsAggregator
+
+        monkeypatch.setitem(app.config, 'METRICS_SHARED_DIR', None)
+        first, second = MetricsAggregator(), MetricsAggregator()
+        first.init_app(app)
+        monkeypatch.setitem(app.config, 'SQLALCHEMY_DATABASE_URI', 'sqlite:////tmp/other-deployment.db')
+        second.init_app(app)
+        assert first.shared_dir != second.shared_dir
+
+        monkeypatch.setitem(app.config, 'METRICS_SHARED_DIR', '/srv/metrics')
+        second.init_app(app)
+        assert second.shared_dir == '/srv/metrics'
+
+
+class TestOpenMetrics:
+    """OpenMetrics导出测试"""
+
+    def test_request_histogram_rendering(self):
+        """累计直方图按固定边界累积输出"""
+        from app.utils.performance_monitor import RequestMetrics
+        from app.utils.openmetrics import render_request_metrics
+
+        metrics = RequestMetrics()
+        for value in [3.0, 30.0, 3000.0, 20000.0]:
+            metrics.record_request(value, 200, 'api.asset.get_assets')
+
+        text = render_request_metrics(metrics)
+        labels = 'endpoint="api.asset.get_assets",status_class="2xx"'
+        assert f'itops_http_request_duration_seconds_bucket{{{labels},le="0.005"}} 1' in text
+        assert f'itops_http_request_duration_seconds_bucket{{{labels},le="5"}} 3' in text
+        assert f'itops_http_request_duration_seconds_bucket{{{labels},le="+Inf"}} 4' in text
+        assert 'itops_http_responses_total{code="200"} 4' in text
+
+    def test_metrics_endpoint(self, app, client, monkeypatch):
+        """/metrics需令牌或白名单，校验通过后返回OpenMetrics文本"""
+        assert client.get('/metrics').status_code == 403
+
+        monkeypatch.setitem(app.config, 'METRICS_ALLOWED_IPS', '10.0.0.0/8')
+        assert client.get('/metrics', environ_base={'REMOTE_ADDR': '192.168.1.1'}).status_code == 403
+        assert client.get('/metrics', environ_base={'REMOTE_ADDR': '10.1.1.1'}).status_code == 200
+
+        monkeypatch.setitem(app.config, 'METRICS_ALLOWED_IPS', '')
+        monkeypatch.setitem(app.config, 'METRICS_AUTH_TOKEN', 'scrape-token')
+        assert client.get('/metrics').status_code == 401
+        response = client.get('/metrics', headers={'Authorization': 'Bearer scrape-token'})
+        assert response.status_code == 200
+        assert response.content_type.startswith('application/openmetrics-text')
+        body = response.get_data(as_text=True)
+        assert 'itops_worker_info' in body
+        assert body.endswith('# EOF\n')
+
+
+class TestQueryTracker:
+    """请求级SQL统计测试"""
+
+    def test_repeated_statement_shapes(self):
+        """IN列表长度不同的语句归为同一形态"""
+        from app.utils.query_tracker import RequestQueryStats, statement_shape
+
+        assert statement_shape('SELECT * FROM rooms WHERE id IN (?, ?, ?)') == \
+            statement_shape('SELECT * FROM rooms WHERE id IN (?, ?)')
+
+        stats = RequestQueryStats()
+        stats.record('SELECT * FROM assets LIMIT ?', 1.0)
+        for _ in range(6):
+            stats.record('SELECT * FROM rooms WHERE rooms.id = ?', 0.5)
+        assert stats.count == 7
+        assert stats.repeated(5) == {'SELECT * FROM rooms WHERE rooms.id = ?': 6}
+        assert stats.summary()['top'][0]['count'] == 6
+
+    def test_query_headers(self, client, db_session, auth_headers):
+        """响应携带X-DB-Queries与Server-Timing"""
+        from app import limiter
+
+        limiter.reset()
+        response = client.get('/api/assets', headers=auth_headers())
+        assert response.status_code == 200
+        assert int(response.headers['X-DB-Queries']) > 0
+        assert 'db;dur=' in response.headers['Server-Timing']
+
+    def test_query_headers_hidden_in_production(self, app, client, monkeypatch):
+        """非调试/测试环境下匿名请求不返回查询统计响应头"""
+        monkeypatch.setattr(app, 'testing', False)
+        monkeypatch.setitem(app.config, 'SQL_QUERY_HEADERS', False)
+        response = client.get('/api/monitor/health')
+        assert 'X-DB-Queries' not in response.headers
+
+        monkeypatch.setitem(app.config, 'SQL_QUERY_HEADERS', True)
+        response = client.get('/api/monitor/health')
+        assert 'X-DB-Queries' in response.headers
+
+
+class TestRequestProfiler:
+    """慢请求采样测试"""
+
+    def test_profile_written_and_listed(self, app, tmp_path):
+        """采样结果写为折叠栈文件并可列出"""
+        from app.utils.request_profiler import RequestProfiler, ActiveRequest
+
+        profiler = RequestProfiler()
+        profiler.output_dir = str(tmp_path)
+        active = ActiveRequest(threading.get_ident(), sample_all=True)
+        profiler._active[active.thread_id] = active
+        profiler.sample()
+        profiler.sample()
+        assert active.samples == 2
+
+        with app.test_request_context('/api/assets?keyword=db&password=x'):
+            profile_id = profiler.write_profile(active, 2500.0, 200)
+
+        with open(profiler.profile_path(profile_id), encoding='utf-8') as f:
+            lines = f.read().splitlines()
+        assert lines[0].endswith(' 2')
+        assert 'test_profile_written_and_listed' in lines[0]
+
+        profiles = profiler.list_profiles()
+        assert profiles[0]['id'] == profile_id
+        assert profiles[0]['reason'] == 'slow'
+        assert profiles[0]['params'] == {'keyword': 'db', 'password': '***'}
+        assert profiler.profile_path('../' + profile_id) is None
+
+
+class TestAssetListSerialization:
+    """资产列表批量序列化测试"""
+
+    def test_to_dict_list_matches_to_dict(self, db_session):
+        """批量序列化与逐条序列化结果一致"""
+        from app.models.location import Building
+        from app.models.network import DevicePort
+
+        building = Building(name='一号楼', code='LIST-B1')
+        db_session.add(building)
+        db_session.flush()
+        switch = Asset(name='核心交换机', asset_code='LIST-SW1', category='交换机', building_id=building.id)
+        router = Asset(name='出口路由器', asset_code='LIST-RT1', category='路由器')
+        printer = Asset(name='打印机', asset_code='LIST-PR1', category='办公设备', building_id=building.id)
+        db_session.add_all([switch, router, printer])
+        db_session.flush()
+        db_session.add_all([
+            DevicePort(device_id=switch.id, port_name='Gi0/1', is_connected=True),
+            DevicePort(device_id=switch.id, port_name='Gi0/2', is_connected=False),
+            DevicePort(device_id=switch.id, port_name='Gi0/3', is_connected=True, is_deleted=True),
+        ])
+        db_session.commit()
+
+        assets = Asset.query.options(*Asset.location_load_options()).filter(
+            Asset.asset_code.like('LIST-%')
+        ).order_by(Asset.id).all()
+        batched = Asset.to_dict_list(assets)
+        assert batched == [asset.to_dict() for asset in assets]
+        assert (batched[0]['total_ports'], batched[0]['connected_ports']) == (2, 1)
+        assert (batched[1]['total_ports'], batched[1]['connected_ports']) == (0, 0)
+        assert 'total_ports' not in batched[2]
+
+
+class TestWarrantyFilter:
+    """保修状态SQL筛选测试"""
+
+    def test_warranty_filter_matches_python_status(self, db_session):
+        """SQL范围条件与逐条判定结果一致"""
+        from datetime import date, timedelta
+
+        today = date.today()
+        offsets = [-10, -1, 0, 15, 30, 31, 400]
+        for offset in offsets:
+            db_session.add(Asset(
+                name=f'保修{offset}', asset_code=f'WTY{offset + 1000}', category='服务器',
+                warranty_end_date=today + timedelta(days=offset)
+            ))
+        db_session.add(Asset(name='未设置保修', asset_code='WTY-NONE', category='服务器'))
+        db_session.commit()
+
+        base = Asset.query.filter_by(is_deleted=False).filter(Asset.asset_code.like('WTY%'))
+        everything = base.all()
+        expected = {
+            'expiring': {a.id for a in everything if a.is_warranty_expiring()},
+            'expired': {a.id for a in everything if a.get_warranty_status() == '已过保'},
+            'valid': {a.id for a in everything if a.get_warranty_status() == '保修中'},
+        }
+        for status, ids in expected.items():
+            assert {a.id for a in base.filter(Asset.warranty_filter(status)).all()} == ids
+        assert len(expected['expiring']) == 3
+        assert Asset.warranty_filter('unknown') is None